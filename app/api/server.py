@@ -0,0 +1,331 @@
+"""提出用のHTTP API
+
+Streamlitを経由せずにスクリプトから提出できるようにするためのサーバー。
+Streamlitと同じディレクトリ(リポジトリのルート)で、Streamlitとは別プロセスとして起動する。
+
+    python -m app.api.server --port 15001
+    python -m app.api.server --issue-token USERNAME   # トークンの発行
+
+認証は Authorization: Bearer <token> ヘッダーで行う。
+トークンは提出ページからも発行できる。
+
+エンドポイント:
+    GET  /api/competitions
+    GET  /api/competitions/<id>/leaderboard
+    GET  /api/competitions/<id>/submissions              自分の提出履歴
+    POST /api/competitions/<id>/submissions?filename=... 本文にCSVをそのまま送る
+
+提出の本文はメモリに載せずにユーザーのディレクトリへチャンク単位で書き出してから採点する。
+採点と登録は提出ページと同じ app.src.submission の関数を使う。
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# リクエストを処理するスレッドを起動する前に、重いモジュールを読み込んでおく
+import numpy  # noqa: F401
+import pandas  # noqa: F401
+
+from app.src.api_token import get_username_for_token, issue_api_token
+from app.src.code_execution import is_code_competition
+from app.src.competition import get_competitions, use_competition
+from app.src.database import (
+    DAILY_SUBMISSION_LIMIT_REACHED,
+    SUBMISSION_INSERTED,
+    SUBMISSION_LIMIT_REACHED,
+    TIMESTAMP_FORMAT,
+    create_tables,
+    get_or_create_user_id,
+    get_user_id,
+    get_user_submissions,
+)
+from app.src.leaderboard import get_leaderboard
+from app.src.logger_config import get_logger
+from app.src.submission import (
+    create_user_directory,
+    get_submission_file_path,
+    score_and_register_submission,
+)
+from app.src.submission_validation import SubmissionValidationError
+
+logger = get_logger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 15001
+# Streamlitのアップロード上限(server.maxUploadSize)のデフォルトに合わせる
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+COMPETITION_PATH = re.compile(r"^/api/competitions/([^/]+)/(leaderboard|submissions)$")
+
+# 提出結果のステータスとHTTPステータスの対応
+SUBMISSION_STATUS_CODES = {
+    SUBMISSION_INSERTED: HTTPStatus.CREATED,
+    SUBMISSION_LIMIT_REACHED: HTTPStatus.TOO_MANY_REQUESTS,
+    DAILY_SUBMISSION_LIMIT_REACHED: HTTPStatus.TOO_MANY_REQUESTS,
+}
+
+_initialized_competitions = set()
+_initialized_lock = threading.Lock()
+
+
+def ensure_tables(competition_id):
+    """コンペティションごとにプロセス内で1回だけテーブルを作成する"""
+    with _initialized_lock:
+        if competition_id not in _initialized_competitions:
+            create_tables()
+            _initialized_competitions.add(competition_id)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        # 提出ファイルの問題のある行 (SubmissionValidationError.errors)
+        self.errors = errors
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    server_version = "minikaggle-api"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            username = self._authenticate()
+            if url.path == "/api/competitions" and method == "GET":
+                self._send_json(HTTPStatus.OK, list_competitions())
+                return
+
+            match = COMPETITION_PATH.match(url.path)
+            if match is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, "Not found")
+            competition_id, resource = match.groups()
+            if competition_id not in get_competitions():
+                raise ApiError(
+                    HTTPStatus.NOT_FOUND, f"Unknown competition: {competition_id}"
+                )
+
+            with use_competition(competition_id) as competition:
+                ensure_tables(competition_id)
+                if resource == "leaderboard" and method == "GET":
+                    status, body = HTTPStatus.OK, leaderboard_records(competition)
+                elif resource == "submissions" and method == "GET":
+                    status, body = (
+                        HTTPStatus.OK,
+                        submission_records(username, competition),
+                    )
+                elif resource == "submissions" and method == "POST":
+                    filename = query.get("filename", ["submission.csv"])[0]
+                    status, body = self._handle_submission(
+                        username, competition, filename
+                    )
+                else:
+                    raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed")
+            self._send_json(status, body)
+        except ApiError as e:
+            if method == "POST":
+                # 本文を読み切っていない可能性があるため、接続は再利用しない
+                self.close_connection = True
+            body = {"error": e.message}
+            if e.errors:
+                body["errors"] = e.errors
+            self._send_json(e.status, body)
+        except Exception as e:
+            logger.exception(f"API error: {method} {self.path}")
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+
+    def _authenticate(self):
+        header = self.headers.get("Authorization", "")
+        scheme, _, token = header.partition(" ")
+        username = (
+            get_username_for_token(token.strip())
+            if scheme.lower() == "bearer"
+            else None
+        )
+        if username is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Invalid or missing API token")
+        return username
+
+    def _handle_submission(self, username, competition, filename):
+        if is_code_competition(competition):
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST,
+                "Code competitions accept submissions from the submission page only",
+            )
+        content_length = int(self.headers.get("Content-Length") or 0)
+        if content_length <= 0:
+            raise ApiError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        if content_length > MAX_UPLOAD_BYTES:
+            raise ApiError(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                f"Submission exceeds {MAX_UPLOAD_BYTES} bytes",
+            )
+
+        filename = os.path.basename(filename) or "submission.csv"
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+        user_id = get_or_create_user_id(username)
+
+        # 採点が終わるまでは一時ファイルとして保存し、登録できたら正式な名前に置き換える
+        user_dir = create_user_directory(user_id, competition)
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload_", suffix=".csv", dir=user_dir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                remaining = content_length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ApiError(
+                            HTTPStatus.BAD_REQUEST, "Incomplete request body"
+                        )
+                    file.write(chunk)
+                    remaining -= len(chunk)
+
+            try:
+                result = score_and_register_submission(
+                    user_id, tmp_path, filename, timestamp, competition
+                )
+            except SubmissionValidationError as e:
+                # 行数やidの不一致、列の不足、数値でない値など提出ファイルの問題
+                raise ApiError(
+                    HTTPStatus.BAD_REQUEST, f"Invalid submission: {e}", e.errors
+                )
+            except (ValueError, KeyError) as e:
+                raise ApiError(HTTPStatus.BAD_REQUEST, f"Invalid submission: {e}")
+
+            if result.status == SUBMISSION_INSERTED:
+                os.replace(
+                    tmp_path,
+                    get_submission_file_path(user_id, filename, timestamp, competition),
+                )
+            logger.info(
+                f"API submission: user={username} "
+                f"competition={competition.competition_id} status={result.status}"
+            )
+            return (
+                SUBMISSION_STATUS_CODES.get(
+                    result.status, HTTPStatus.INTERNAL_SERVER_ERROR
+                ),
+                submission_result_body(result, competition, filename, timestamp),
+            )
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _send_json(self, status, body):
+        payload = json.dumps(
+            replace_non_finite(body), ensure_ascii=False, allow_nan=False
+        ).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+def list_competitions():
+    return [
+        {"competition_id": competition_id, "name": competition.name}
+        for competition_id, competition in get_competitions().items()
+    ]
+
+
+def is_private_score_visible(competition):
+    # 提出ページと同じく、最終提出の選択が締め切られるまでPrivateスコアは返さない
+    return competition.config["competition"]["stop_final_submission_select"]
+
+
+def leaderboard_records(competition):
+    # リーダーボードのページと同じく、leaderboard_splitの分割で順位を付ける
+    split = competition.config["competition"].get("leaderboard_split", "public")
+    return get_leaderboard(split).to_dict(orient="records")
+
+
+def submission_records(username, competition):
+    # 参照だけのリクエストでは、まだ提出していないユーザーを作らない
+    user_id = get_user_id(username)
+    if user_id is None:
+        return []
+    submissions = get_user_submissions(user_id)
+    columns = ["user_submission_id", "timestamp", "filename", "public_score"]
+    if is_private_score_visible(competition):
+        columns.append("private_score")
+    submissions = submissions.sort_values("submission_id", ascending=False)
+    return submissions[columns].to_dict(orient="records")
+
+
+def submission_result_body(result, competition, filename, timestamp):
+    body = {
+        "status": result.status,
+        "filename": filename,
+        "timestamp": timestamp,
+        "public_score": result.public_score,
+    }
+    if is_private_score_visible(competition):
+        body["private_score"] = result.private_score
+    return body
+
+
+def replace_non_finite(value):
+    """NaNと無限大をNoneに置き換える
+
+    行のない分割のスコアはNaNになるが、JSONにはNaNがないためnullとして返す。
+    """
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: replace_non_finite(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [replace_non_finite(item) for item in value]
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="minikaggle submission API")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--issue-token",
+        metavar="USERNAME",
+        help="指定したユーザーのトークンを発行して表示し、終了する",
+    )
+    args = parser.parse_args()
+
+    if args.issue_token:
+        print(issue_api_token(args.issue_token))
+        return
+
+    server = ThreadingHTTPServer((args.host, args.port), ApiRequestHandler)
+    server.daemon_threads = True
+    logger.info(f"Serving minikaggle API on http://{args.host}:{args.port}")
+    print(f"Serving minikaggle API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
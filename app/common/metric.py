@@ -1,10 +1,12 @@
 from typing import List
 
 import pandas as pd
-from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
 
 
 def classification_metrics(y_true, y_pred):
+    # sklearnはインポートに1秒以上かかるため、使うときにだけインポートする
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
     metrics = {
         "accuracy": accuracy_score(y_true, y_pred),
         "precision": precision_score(y_true, y_pred),
@@ -1,6 +1,9 @@
 import streamlit as st
 from streamlit import session_state as ss
+from streamlit.errors import DuplicateWidgetID
 
+from app.src.competition import get_competitions, get_current_competition_id
+from app.src.database import create_tables
 from app.src.logger_config import get_cached_logger
 
 logger = get_cached_logger(__name__)
@@ -32,6 +35,51 @@ def PrivateLBPageNav():
     )
 
 
+def AnalyticsPageNav():
+    st.sidebar.page_link(
+        "./pages/page_07_admin_analytics.py", label="Analytics", icon="📈"
+    )
+
+
+def UserListPageNav():
+    st.sidebar.page_link("./pages/page_06_userlist.py", label="Users", icon="🧑‍🤝‍🧑")
+
+
+def CompetitionSelector():
+    competitions = get_competitions()
+    if len(competitions) <= 1:
+        return
+
+    competition_ids = list(competitions)
+    current_id = get_current_competition_id()
+    if current_id not in competitions:
+        current_id = competition_ids[0]
+        ss.competition_id = current_id
+
+    def on_change():
+        # ウィジェットの状態はページをまたぐと消えるため、選択値は別のキーに保持する
+        ss.competition_id = ss._competition_selector
+        # コンペティションごとに異なるセッション状態はリセットする
+        ss.pop("team_name", None)
+        ss.pop("form_submitted", None)
+        create_tables()
+        logger.info(f"Competition changed to: {ss.competition_id}")
+
+    try:
+        st.sidebar.selectbox(
+            "コンペティション",
+            options=competition_ids,
+            index=competition_ids.index(current_id),
+            format_func=lambda competition_id: competitions[competition_id].name,
+            key="_competition_selector",
+            on_change=on_change,
+        )
+    except DuplicateWidgetID:
+        # account.pyのインポート時にもMenuButtonsが呼ばれるため、
+        # 同じ実行内の2回目は表示しない
+        pass
+
+
 def MenuButtons(user_roles=None):
     if user_roles is None:
         user_roles = {}
@@ -39,6 +87,8 @@ def MenuButtons(user_roles=None):
     if "authentication_status" not in ss:
         ss.authentication_status = False
 
+    CompetitionSelector()
+
     # Always show the home and login navigators.
     HomeNav()
     LoginNav()
@@ -56,4 +106,6 @@ def MenuButtons(user_roles=None):
         # Show admin page only if the logged-in user is an admin
         if ss.username in admins:
             PrivateLBPageNav()
+            AnalyticsPageNav()
+            UserListPageNav()
             logger.info(f"Admin page shown for user: {ss.username}")
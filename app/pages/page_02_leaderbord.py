@@ -1,20 +1,12 @@
-import os
-import sqlite3
-
-import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
-import yaml
-from dotenv import load_dotenv
 
 from app.nav import MenuButtons
 from app.pages.account import get_roles
+from app.src.competition import get_current_competition
+from app.src.lazy_import import lazy_import
+from app.src.leaderboard import get_leaderboard, get_optimization_direction
 
-SUBMITTION_DB_PATH = "./database/submissions.db"
-
-with open("competition_setting.yaml", "r") as file:
-    config = yaml.safe_load(file)
-OPTIMIZATION_DIRECTION = config["competition"]["optimization_direction"]
+go = lazy_import("plotly.graph_objects")
 
 
 def create_leaderboard_table(df):
@@ -27,6 +19,7 @@ def create_leaderboard_table(df):
     submit_width = max(60, len(str(max_submit)) * 10)  # 最小幅60、文字数に応じて増加
     team_width = 200  # チーム名用の固定幅
     score_width = 100  # スコア用の固定幅
+    member_width = 80  # メンバー数用の固定幅
 
     fig = go.Figure(
         data=[
@@ -49,6 +42,7 @@ def create_leaderboard_table(df):
                     rank_width,
                     team_width,
                     score_width,
+                    member_width,
                     submit_width,
                 ],  # 動的に列幅を設定
             )
@@ -63,89 +57,20 @@ def create_leaderboard_table(df):
     return fig
 
 
-def get_leaderboard():
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
-
-    if OPTIMIZATION_DIRECTION == "max":
-        query = """
-        WITH user_best_scores AS (
-            SELECT 
-                s.user_id,
-                MAX(s.public_score) as best_score,
-                COUNT(*) as submit_count
-            FROM submissions s
-            GROUP BY s.user_id
-        )
-        SELECT 
-            tu.team_name,
-            MAX(ubs.best_score) as best_score,
-            COUNT(DISTINCT tu.user_id) as member_count,
-            SUM(ubs.submit_count) as submit_count,
-            GROUP_CONCAT(u.username, ', ') as team_members
-        FROM team_users tu
-        JOIN users u ON tu.user_id = u.user_id
-        JOIN user_best_scores ubs ON u.user_id = ubs.user_id
-        GROUP BY tu.team_name
-        HAVING best_score IS NOT NULL
-        ORDER BY best_score DESC
-        """
-    else:  # min
-        query = """
-        WITH user_best_scores AS (
-            SELECT 
-                s.user_id,
-                MIN(s.public_score) as best_score,
-                COUNT(*) as submit_count
-            FROM submissions s
-            GROUP BY s.user_id
-        )
-        SELECT 
-            tu.team_name,
-            MIN(ubs.best_score) as best_score,
-            COUNT(DISTINCT tu.user_id) as member_count,
-            SUM(ubs.submit_count) as submit_count,
-            GROUP_CONCAT(u.username, ', ') as team_members
-        FROM team_users tu
-        JOIN users u ON tu.user_id = u.user_id
-        JOIN user_best_scores ubs ON u.user_id = ubs.user_id
-        GROUP BY tu.team_name
-        HAVING best_score IS NOT NULL
-        ORDER BY best_score ASC
-        """
-
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-
-    # 順位を付ける
-    df["順位"] = range(1, len(df) + 1)
-
-    # カラム名を変更
-    df = df.rename(
-        columns={
-            "team_name": "チーム名",
-            "best_score": "Public スコア",
-            "member_count": "メンバー数",
-            "submit_count": "Submit回数",
-            "team_members": "チームメンバー",
-        }
-    )
-
-    # スコアを小数点以下4桁に丸める
-    df["Public スコア"] = df["Public スコア"].round(3)
-    # カラムの順序を変更
-    df = df[["順位", "チーム名", "Public スコア", "Submit回数"]]
-
-    return df
-
-
 def show():
     MenuButtons(get_roles())
     st.title("🏆 リーダーボード 🏆")
-    st.write(
-        f"現在のPublic Scoreに基づくリーダーボードです。(最適化方向: {'最大化' if OPTIMIZATION_DIRECTION == 'max' else '最小化'})"
+    # 段階的に公開する場合は、leaderboard_splitで表示する分割を切り替える
+    split = (
+        get_current_competition()
+        .config["competition"]
+        .get("leaderboard_split", "public")
     )
+    score_name = "Public Score" if split == "public" else f"{split}のスコア"
+    direction = "最大化" if get_optimization_direction() == "max" else "最小化"
+    st.write(f"現在の{score_name}に基づくリーダーボードです。(最適化方向: {direction})")
 
-    leaderboard = get_leaderboard()
+    leaderboard = get_leaderboard(split)
 
     # ページネーション
     items_per_page = 20
@@ -1,104 +1,131 @@
-import logging
 import os
 import sqlite3
-from datetime import datetime
-from pathlib import Path
+from datetime import date, datetime
 
-import numpy as np
-import pandas as pd
 import streamlit as st
-import yaml
 from streamlit import session_state as ss
 
 from app.nav import MenuButtons
 from app.pages.account import get_roles
+from app.src.api_token import issue_api_token
+from app.src.code_execution import (
+    ACTIVE_EXECUTION_STATUSES,
+    CODE_EXTENSIONS,
+    EXECUTION_FAILED,
+    EXECUTION_QUEUED,
+    EXECUTION_RUNNING,
+    EXECUTION_SUCCEEDED,
+    CodeExecutionError,
+    get_user_code_executions,
+    has_active_execution,
+    is_code_competition,
+    save_submitted_code,
+    submit_code_execution,
+)
+from app.src.competition import get_current_competition
 from app.src.database import (
+    DAILY_SUBMISSION_LIMIT_REACHED,
+    SUBMISSION_INSERTED,
+    SUBMISSION_LIMIT_REACHED,
     create_tables,
     get_or_create_team_id,
     get_or_create_user_id,
+    get_submission_count,
     get_team_name,
     get_total_submission_count,
     get_user_submissions,
-    insert_submission,
     update_final_submissions,
 )
+from app.src.ensemble import (
+    evaluate_blends,
+    load_public_prediction_matrix,
+    search_blends,
+)
+from app.src.lazy_import import lazy_import
 from app.src.logger_config import get_cached_logger
+from app.src.prediction_cache import get_prediction_paths
+from app.src.progression import get_score_progression, get_submission_history_page
+from app.src.ranking_metrics import get_answer_format
+from app.src.scoring import is_plain_mean_scoring
+from app.src.submission import (
+    get_submission_limits,
+    save_submitted_csv,
+    score_and_register_submission,
+)
+from app.src.submission_validation import SubmissionValidationError
+
+pd = lazy_import("pandas")
+go = lazy_import("plotly.graph_objects")
 
 logger = get_cached_logger(__name__)
 
-with open("competition_setting.yaml", "r") as file:
-    config = yaml.safe_load(file)
+# ページはrerunのたびに実行されるため、
+# 選択中のコンペティションの設定がここで読み込まれる
+competition = get_current_competition()
+config = competition.config
 
 # max_submissionsの値を取得する
 max_submissions = config["competition"]["max_submissions"]
-COMPETITION_ANSWER_COLUMN = config["competition"]["answer_column"]
-SUBMISSIONS_DIR = "./temp_files/uploaded_submissions"
-SUBMITTION_DB_PATH = "./database/submissions.db"
-FINAL_SUBMISSION_DB_PATH = "./database/final_submissions.db"
+FINAL_SUBMISSION_DB_PATH = competition.final_submission_db_path
 OPTIMIZATION_DIRECTION = config["competition"]["optimization_direction"]
-MAX_SUBMISSIONS = config["competition"]["max_submissions"]  # デフォルト値を50に設定
-if config["competition"]["stop_final_submission_select"]:
-    MAX_SUBMISSIONS = 9999
-COMPETITION_TEST_CSV_PATH = "./competition/test.csv"
+# 1日あたりの提出上限は未設定ならNone (無制限)
+MAX_SUBMISSIONS, MAX_DAILY_SUBMISSIONS = get_submission_limits(competition)
 STOP_FINAL_SUBMISSION_SELECT = config["competition"]["stop_final_submission_select"]
+# 提出履歴の表の1ページあたりの件数
+HISTORY_PAGE_SIZE = 50
+# アンサンブルラボでブレンドできる提出の数
+MAX_BLEND_SUBMISSIONS = 8
+# コードコンペティションでは、提出を実行・採点して出力を提出する
+CODE_COMPETITION = is_code_competition(competition)
+# 実行中の提出がある間、実行状況を更新する間隔(秒)
+CODE_EXECUTION_POLL_SECONDS = 5
+CODE_EXECUTION_STATUS_LABELS = {
+    EXECUTION_QUEUED: "実行待ち",
+    EXECUTION_RUNNING: "実行中",
+    EXECUTION_SUCCEEDED: "完了",
+    EXECUTION_FAILED: "失敗",
+}
 
 if "authentication_status" not in ss:
     st.switch_page("./pages/account.py")
 
 
-# メトリックを計算する関数（この例ではMSEを使用）
-def calculate_metric(predictions, actual):
-    if config["competition"]["metric"] == "rmse":
-        mse = ((predictions - actual) ** 2).mean()
-        return np.sqrt(mse)
-    elif config["competition"]["metric"] == "mae":
-        return np.abs(predictions - actual).mean()
-    else:
-        raise ValueError("Unsupported metric specified in the configuration.")
-
-
-def create_user_directory(user_id):
-    """ユーザーごとのディレクトリを作成する"""
-    user_dir = os.path.join(SUBMISSIONS_DIR, str(user_id))
-    if not os.path.exists(user_dir):
-        os.makedirs(user_dir)
-    return user_dir
+# 各パネルはst.fragmentで、パネル内の操作ではそのパネルだけが再実行される。
+# パネルが読むデータはセッションのキャッシュに置き、
+# ページ全体の再実行(ページの表示や提出後)で捨てる
+def reset_page_cache():
+    ss.submission_page_cache = {}
 
 
-def save_submitted_csv(file, user_id, filename, timestamp):
-    """提出されたCSVファイルを保存する"""
-    user_dir = create_user_directory(user_id)
-    save_filename = f"TIMESTAMP_{timestamp}_FILENAME_{filename}_USER_ID{user_id}.csv"
-    file_path = os.path.join(user_dir, save_filename)
+def get_cached(name, loader, *args):
+    """キャッシュにあればそれを、なければloader(*args)の結果を保存して返す"""
+    cache = ss.setdefault("submission_page_cache", {})
+    key = (name, *args)
+    if key not in cache:
+        cache[key] = loader(*args)
+    return cache[key]
 
-    with open(file_path, "wb") as f:
-        f.write(file.getvalue())
 
-    return file_path
+def invalidate_cached(name):
+    cache = ss.setdefault("submission_page_cache", {})
+    for key in [key for key in cache if key[0] == name]:
+        del cache[key]
 
 
-def get_public_private_score(uploaded_submit_csv):
-    # CSVファイルの読み込み
-    submit_df = pd.read_csv(uploaded_submit_csv)
-
-    # 実際のデータ（この例では、これも提供されると仮定）
-    test_df = pd.read_csv(COMPETITION_TEST_CSV_PATH)
-
-    # Public scoreとPrivate scoreの計算
-    public_mask = test_df["is_public"] == 1
-    private_mask = test_df["is_public"] == 0
-
-    public_score = calculate_metric(
-        submit_df.loc[public_mask, COMPETITION_ANSWER_COLUMN],
-        test_df.loc[public_mask, COMPETITION_ANSWER_COLUMN],
-    )
-    private_score = calculate_metric(
-        submit_df.loc[private_mask, COMPETITION_ANSWER_COLUMN],
-        test_df.loc[private_mask, COMPETITION_ANSWER_COLUMN],
-    )
-    return public_score, private_score
+def get_final_submissions(user_id):
+    conn_final = sqlite3.connect(FINAL_SUBMISSION_DB_PATH)
+    query = """
+        SELECT user_submission_id, timestamp, filename, public_score
+        FROM final_submissions
+        WHERE user_id = ?
+        ORDER BY timestamp DESC
+    """
+    final_submissions = pd.read_sql_query(query, conn_final, params=(user_id,))
+    conn_final.close()
+    return final_submissions
 
 
+@st.fragment
 def show_final_submission_selection_and_display(user_id):
     def format_submission(index):
         submission = submissions.loc[index]
@@ -109,7 +136,7 @@ def show_final_submission_selection_and_display(user_id):
             f"Score: {round(submission['public_score'], 4)}"
         )
 
-    submissions = get_user_submissions(user_id)
+    submissions = get_cached("user_submissions", get_user_submissions, user_id)
     if STOP_FINAL_SUBMISSION_SELECT:
         st.warning("最終提出の選択は現在停止されています。")
     elif len(submissions) > 0:
@@ -135,6 +162,7 @@ def show_final_submission_selection_and_display(user_id):
                     selected_submissions, "submission_id"
                 ].tolist()
                 update_final_submissions(user_id, selected_ids)
+                invalidate_cached("final_submissions")
                 st.success("最終提出が更新されました。")
             else:
                 st.warning("最終提出として少なくとも1つの提出を選択してください。")
@@ -143,18 +171,7 @@ def show_final_submission_selection_and_display(user_id):
 
     # 最終提出の表示
     st.subheader("現在の最終提出")
-    conn_final = sqlite3.connect(FINAL_SUBMISSION_DB_PATH)
-
-    query = """
-        SELECT user_submission_id, timestamp, filename, public_score
-        FROM final_submissions
-        WHERE user_id = ?
-        ORDER BY timestamp DESC
-    """
-    final_submissions = pd.read_sql_query(query, conn_final, params=(user_id,))
-
-    conn_final.close()
-
+    final_submissions = get_cached("final_submissions", get_final_submissions, user_id)
     if not final_submissions.empty:
         st.dataframe(final_submissions)
     else:
@@ -168,33 +185,32 @@ def setup_page():
     create_tables()
 
 
-def get_best_public_score(user_id):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        f"""
-        SELECT {"MIN" if OPTIMIZATION_DIRECTION == "min" else "MAX"}(public_score) FROM submissions
-        WHERE user_id = ?
-    """,
-        (user_id,),
-    )
-    best_score = c.fetchone()[0]
-    conn.close()
-    return (
-        best_score
-        if best_score is not None
-        else (float("inf") if OPTIMIZATION_DIRECTION == "min" else float("-inf"))
-    )
-
-
+@st.fragment
 def handle_file_upload(user_id, team_name):
-    submission_count = get_total_submission_count(user_id)
+    submission_count = get_cached(
+        "total_submission_count", get_total_submission_count, user_id
+    )
     st.info(f"現在の提出回数: {submission_count}/{MAX_SUBMISSIONS}")
+    if MAX_DAILY_SUBMISSIONS is not None:
+        daily_count = get_cached(
+            "daily_submission_count", get_submission_count, user_id, date.today()
+        )
+        st.info(f"本日の提出回数: {daily_count}/{MAX_DAILY_SUBMISSIONS}")
 
     if "form_submitted" not in ss:
         ss.form_submitted = False
 
-    if not ss.form_submitted:
+    if CODE_COMPETITION:
+        with st.form(key="upload_form"):
+            uploaded_code = st.file_uploader(
+                "推論コード(.py / .ipynb)をアップロード", type=CODE_EXTENSIONS
+            )
+            submit_button = st.form_submit_button(label="提出")
+        if "code_submission_message" in ss:
+            st.success(ss.pop("code_submission_message"))
+        if submit_button and uploaded_code is not None:
+            process_code_submission(user_id, uploaded_code)
+    elif not ss.form_submitted:
         with st.form(key="upload_form"):
             uploaded_submit_csv = st.file_uploader(
                 "結果ファイルをアップロード", type=["csv"]
@@ -204,62 +220,149 @@ def handle_file_upload(user_id, team_name):
         if submit_button and uploaded_submit_csv is not None:
             process_submission(user_id, team_name, uploaded_submit_csv)
     else:
+        last_result = ss.pop("last_submission_result", None)
+        if last_result is not None:
+            show_submission_result(last_result)
         show_new_submission_button()
 
 
+def show_validation_errors(error):
+    st.error(error.message)
+    if error.errors:
+        if error.error_count > len(error.errors):
+            st.write(
+                f"問題のある値 {error.error_count}件のうち、"
+                f"先頭の{len(error.errors)}件:"
+            )
+        st.dataframe(
+            pd.DataFrame(error.errors), hide_index=True, use_container_width=True
+        )
+
+
 def process_submission(user_id, team_name, uploaded_submit_csv):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     st.success("ファイルがアップロードされました！")
 
-    public_score, private_score = get_public_private_score(uploaded_submit_csv)
-
     filename = uploaded_submit_csv.name
     logger.info(f"Uploaded file name: {filename}")
-    save_submitted_csv(uploaded_submit_csv, user_id, filename, timestamp)
 
-    submission_count = get_total_submission_count(user_id)
+    try:
+        result = score_and_register_submission(
+            user_id, uploaded_submit_csv, filename, timestamp, competition
+        )
+    except SubmissionValidationError as e:
+        # 形式に誤りのあるファイルは採点・保存せずに、問題のある行を表示する
+        show_validation_errors(e)
+        return
+    if not show_submission_status(result.status):
+        return
+    save_submitted_csv(uploaded_submit_csv, user_id, filename, timestamp, competition)
+
+    # 提出回数・履歴・最終提出の候補が変わるので、結果を保存してページ全体を再実行する
+    ss.last_submission_result = result
+    st.rerun()
 
-    if submission_count >= MAX_SUBMISSIONS:
-        st.error(
-            f"提出回数の上限（{MAX_SUBMISSIONS}回）に達しました。これ以上の提出はできません。"
+
+def process_code_submission(user_id, uploaded_code):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = uploaded_code.name
+    logger.info(f"Uploaded code file name: {filename}")
+
+    code_path = save_submitted_code(
+        uploaded_code, user_id, filename, timestamp, competition
+    )
+    try:
+        submit_code_execution(user_id, code_path, filename, timestamp)
+    except CodeExecutionError as e:
+        os.remove(code_path)
+        st.error(str(e))
+        return
+
+    # 実行状況の表に今回の提出を表示するため、ページ全体を再実行する
+    ss.code_submission_message = (
+        "提出を受け付けました。実行が終わると実行状況にスコアが表示されます。"
+    )
+    st.rerun()
+
+
+def show_code_executions(user_id):
+    executions = get_user_code_executions(user_id)
+    active = any(row[2] in ACTIVE_EXECUTION_STATUSES for row in executions)
+    if ss.get("code_execution_active") and not active:
+        # 実行が終わったら、提出回数や提出履歴を読み直すためページ全体を再実行する
+        ss.code_execution_active = False
+        st.rerun()
+    ss.code_execution_active = active
+
+    st.subheader("実行状況")
+    if not executions:
+        st.info("まだ実行した提出がありません。")
+        return
+    df = pd.DataFrame(
+        executions,
+        columns=[
+            "ID",
+            "ファイル名",
+            "状態",
+            "メッセージ",
+            "Public Score",
+            "提出日時",
+            "終了日時",
+        ],
+    )
+    df["状態"] = df["状態"].map(CODE_EXECUTION_STATUS_LABELS)
+    st.dataframe(df.drop(columns="メッセージ"), hide_index=True)
+
+    execution_id, filename, status, message = executions[0][:4]
+    if status == EXECUTION_FAILED and message:
+        with st.expander(f"ID {execution_id} ({filename}) の失敗の詳細", expanded=True):
+            st.code(message, language=None)
+
+
+def display_code_executions(user_id):
+    # 実行中の提出がある間だけ、実行状況を一定間隔で更新する
+    run_every = CODE_EXECUTION_POLL_SECONDS if has_active_execution(user_id) else None
+    st.fragment(run_every=run_every)(show_code_executions)(user_id)
+
+
+def show_submission_result(result):
+    st.info("結果が提出されました。データベースへスコア登録されました。")
+    public_score = result.public_score
+    best_score = result.previous_best_score
+    if (OPTIMIZATION_DIRECTION == "min" and public_score < best_score) or (
+        OPTIMIZATION_DIRECTION == "max" and public_score > best_score
+    ):
+        st.balloons()
+        st.success(
+            "🎉 おめでとうございます！ 🎉\n"
+            "新記録です！ 過去最高のPublic Scoreを更新しました！\n"
+            f"前回のベストスコア: {best_score:.4f} → "
+            f"新しいベストスコア: {public_score:.4f}"
+        )
+    elif result.previous_submission_count == 0:
+        st.success(
+            "最初の提出おめでとうございます！これからどんどん改善していきましょう。"
         )
     else:
-        best_score = get_best_public_score(user_id)
-        team_id = get_or_create_team_id(team_name)
-        save_submission_to_database(
-            user_id, team_id, public_score, private_score, timestamp, filename
+        st.success(
+            f"提出したPublic Score: {public_score:.4f}\n頑張って改善を続けましょう！"
         )
 
-        if (OPTIMIZATION_DIRECTION == "min" and public_score < best_score) or (
-            OPTIMIZATION_DIRECTION == "max" and public_score > best_score
-        ):
-            st.balloons()
-            st.success(
-                f"🎉 おめでとうございます！ 🎉\n新記録です！ 過去最高のPublic Scoreを更新しました！\n"
-                f"前回のベストスコア: {best_score:.4f} → 新しいベストスコア: {public_score:.4f}"
-            )
-        elif submission_count == 0:
-            st.success(
-                "最初の提出おめでとうございます！これからどんどん改善していきましょう。"
-            )
-        else:
-            st.success(
-                f"提出したPublic Score: {public_score:.4f}\n"
-                f"頑張って改善を続けましょう！"
-            )
-
 
-def save_submission_to_database(
-    user_id, team_id, public_score, private_score, timestamp, filename
-):
-    success = insert_submission(
-        user_id, team_id, public_score, private_score, timestamp, filename
-    )
-    if success:
-        st.info("結果が提出されました。データベースへスコア登録されました。")
+def show_submission_status(status):
+    if status == SUBMISSION_INSERTED:
         ss.form_submitted = True
+    elif status == SUBMISSION_LIMIT_REACHED:
+        st.error(
+            f"提出回数の上限（{MAX_SUBMISSIONS}回）に達しました。これ以上の提出はできません。"
+        )
+    elif status == DAILY_SUBMISSION_LIMIT_REACHED:
+        st.error(
+            f"本日の提出回数の上限（{MAX_DAILY_SUBMISSIONS}回）に達しました。明日また提出してください。"
+        )
     else:
         st.error("データベースへの登録中にエラーが発生しました。")
+    return status == SUBMISSION_INSERTED
 
 
 def show_new_submission_button():
@@ -268,42 +371,195 @@ def show_new_submission_button():
     )
     if st.button("新しい提出を行う"):
         ss.form_submitted = False
-        st.rerun()
+        st.rerun(scope="fragment")
+
+
+def display_score_progression(user_id):
+    points, best = get_cached("score_progression", get_score_progression, user_id)
+    if points.empty:
+        return
+
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=points["submitted_at"],
+            y=points["public_score"],
+            mode="markers",
+            name="Public Score",
+            marker=dict(size=6, opacity=0.6),
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=best["submitted_at"],
+            y=best["public_score"],
+            mode="lines",
+            line_shape="hv",
+            name="ベストスコア",
+        )
+    )
+    fig.update_layout(
+        height=350,
+        margin=dict(l=0, r=0, t=30, b=0),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02),
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 
+@st.fragment
 def display_submission_history(user_id):
     st.subheader("提出履歴")
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
-    query = """
-        SELECT s.user_id, s.timestamp, s.filename, u.username, s.public_score, s.private_score
-        FROM submissions s
-        JOIN users u ON s.user_id = u.user_id
-        WHERE s.user_id = ?
-        ORDER BY s.timestamp DESC
-    """
-    # もしチーム名も表示した場合はselect文に, t.team_name を追加する
-    history = pd.read_sql_query(query, conn, params=(user_id,))
-    conn.close()
+    display_score_progression(user_id)
+
+    # 全件を送らず、SQLでページ単位に取得する
+    submission_count = get_cached(
+        "total_submission_count", get_total_submission_count, user_id
+    )
+    if submission_count == 0:
+        st.info("まだ提出履歴がありません。")
+        return
+    num_pages = (submission_count - 1) // HISTORY_PAGE_SIZE + 1
+    page = 1
+    if num_pages > 1:
+        page = st.number_input(
+            f"ページ (全{num_pages}ページ)",
+            min_value=1,
+            max_value=num_pages,
+            value=1,
+            key="history_page",
+        )
+    history = get_cached(
+        "submission_history_page",
+        get_submission_history_page,
+        user_id,
+        page,
+        HISTORY_PAGE_SIZE,
+    )
 
     if not STOP_FINAL_SUBMISSION_SELECT:
         logger.info("Private score is invisible.")
         history = history.drop("private_score", axis=1)
 
-    if not history.empty:
-        st.dataframe(history, hide_index=True)
-    else:
-        st.info("まだ提出履歴がありません。")
+    st.dataframe(history, hide_index=True)
+
+
+@st.fragment
+def show_ensemble_lab(user_id):
+    def format_submission(submission_id):
+        submission = submissions.loc[submission_id]
+        return (
+            f"ID: {submission['user_submission_id']} - "
+            f"File: {submission['filename']} - "
+            f"Score: {round(submission['public_score'], 4)}"
+        )
+
+    with st.expander("アンサンブルラボ (過去の提出のブレンドを試す)"):
+        st.write(
+            "過去の提出を加重平均したときのPublic Scoreを確認できます。"
+            "ここでの評価は提出回数に含まれません。"
+        )
+        submissions = get_cached(
+            "user_submissions", get_user_submissions, user_id
+        ).set_index("submission_id")
+        cached_ids = get_prediction_paths(submissions.index, competition)
+        submissions = submissions.loc[
+            [
+                submission_id
+                for submission_id in submissions.index
+                if submission_id in cached_ids
+            ]
+        ]
+        if len(submissions) < 2:
+            st.info("ブレンドするには予測値が保存された提出が2つ以上必要です。")
+            return
+
+        selected_ids = st.multiselect(
+            "ブレンドする提出",
+            options=list(submissions.index),
+            format_func=format_submission,
+            max_selections=MAX_BLEND_SUBMISSIONS,
+            key="ensemble_submissions",
+        )
+        if len(selected_ids) < 2:
+            return
+
+        mode = st.radio(
+            "評価方法",
+            ["重みを探索", "重みを指定"],
+            horizontal=True,
+            key="ensemble_mode",
+        )
+        if mode == "重みを探索":
+            step = st.select_slider(
+                "重みの刻み幅", options=[0.5, 0.25, 0.2, 0.1, 0.05], value=0.1
+            )
+            if st.button("探索"):
+                results = search_blends(
+                    selected_ids, step=step, competition=competition
+                )
+                results = results.rename(
+                    columns={
+                        f"weight_{submission_id}": format_submission(submission_id)
+                        for submission_id in selected_ids
+                    }
+                )
+                st.dataframe(results, hide_index=True)
+        else:
+            weights = [
+                st.number_input(
+                    format_submission(submission_id),
+                    min_value=0.0,
+                    value=1.0 / len(selected_ids),
+                    step=0.05,
+                    key=f"ensemble_weight_{submission_id}",
+                )
+                for submission_id in selected_ids
+            ]
+            if st.button("評価") and sum(weights) > 0:
+                loaded_ids, matrix, target = load_public_prediction_matrix(
+                    selected_ids, competition
+                )
+                if len(loaded_ids) != len(selected_ids):
+                    st.error("予測値を読み込めない提出が含まれています。")
+                    return
+                weights = [[weight / sum(weights) for weight in weights]]
+                score = evaluate_blends(
+                    weights, matrix, target, config["competition"]["metric"]
+                )[0]
+                st.success(f"ブレンドのPublic Score: {score:.4f}")
+
+
+@st.fragment
+def show_api_token_section():
+    with st.expander("APIトークン (コマンドラインからの提出)"):
+        st.write(
+            "tool/minikaggle_cli.py やHTTP APIから提出するためのトークンを発行します。"
+            "再発行すると以前のトークンは使えなくなります。"
+        )
+        if st.button("トークンを発行"):
+            st.code(issue_api_token(ss.username), language=None)
+            st.warning("このトークンは再表示できません。安全な場所に保存してください。")
 
 
 def show():
+    # ここはページ全体の再実行のときだけ実行される
+    reset_page_cache()
     setup_page()
     user_id = get_or_create_user_id(ss.username)
     team_id = get_or_create_team_id(user_id)
     team_name = get_team_name(team_id)
 
     handle_file_upload(user_id, team_name)
+    if CODE_COMPETITION:
+        display_code_executions(user_id)
     display_submission_history(user_id)
     show_final_submission_selection_and_display(user_id)
+    # ブレンドは数値の予測を分割全体の平均で採点するコンペティションのみ
+    if get_answer_format(
+        competition.config["competition"]["metric"]
+    ) == "scalar" and is_plain_mean_scoring(competition):
+        show_ensemble_lab(user_id)
+    show_api_token_section()
 
 
 if __name__ == "__main__":
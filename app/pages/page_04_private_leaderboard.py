@@ -1,20 +1,24 @@
 import os
-import sqlite3
 
-import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
-import yaml
-from dotenv import load_dotenv
 
 from app.pages.account import get_roles
-
-SUBMISSION_DB_PATH = "./database/submissions.db"
-FINAL_SUBMISSION_DB_PATH = "./database/final_submissions.db"
-
-with open("competition_setting.yaml", "r") as file:
-    config = yaml.safe_load(file)
-OPTIMIZATION_DIRECTION = config["competition"]["optimization_direction"]
+from app.src.duplicate_detection import MAX_HAMMING_DISTANCE, get_duplicate_flags
+from app.src.export import (
+    EXPORT_DOWNLOAD_MAX_BYTES,
+    EXPORT_FORMATS,
+    export_competition_zip,
+)
+from app.src.lazy_import import lazy_import
+from app.src.leaderboard import (
+    generate_leaderboard,
+    get_leaderboard,
+    get_optimization_direction,
+    get_split_names,
+)
+from app.src.similarity import SIMILARITY_METRICS, find_similar_final_submissions
+
+go = lazy_import("plotly.graph_objects")
 
 
 def check_admin():
@@ -36,227 +40,13 @@ def check_admin():
         st.stop()
 
 
-def fetch_data_from_db():
-    """データベースから必要なデータを取得する"""
-    conn_main = sqlite3.connect(SUBMISSION_DB_PATH)
-    conn_final = sqlite3.connect(FINAL_SUBMISSION_DB_PATH)
-
-    users_df = pd.read_sql_query("SELECT * FROM users", conn_main)
-    submissions_df = pd.read_sql_query("SELECT * FROM submissions", conn_main)
-    final_submissions_df = pd.read_sql_query(
-        "SELECT * FROM final_submissions", conn_final
-    )
-
-    conn_main.close()
-    conn_final.close()
-
-    return users_df, submissions_df, final_submissions_df
-
-
-def prepare_leaderboard_data(users_df, submissions_df, final_submissions_df):
-    """リーダーボード用のデータを準備する"""
-    leaderboard_data = []
-
-    if OPTIMIZATION_DIRECTION == "max":
-        compare = lambda x: x.idxmax()
-        best_n = lambda df, col, n: df.nlargest(n, col)
-    elif OPTIMIZATION_DIRECTION == "min":
-        compare = lambda x: x.idxmin()
-        best_n = lambda df, col, n: df.nsmallest(n, col)
-    else:
-        raise ValueError("OPTIMIZATION_DIRECTION must be either 'max' or 'min'")
-
-    for _, user in users_df.iterrows():
-        user_id = user["user_id"]
-        user_final_submissions = final_submissions_df[
-            final_submissions_df["user_id"] == user_id
-        ]
-        user_submissions = submissions_df[submissions_df["user_id"] == user_id]
-
-        submission_count = len(user_submissions)
-
-        if submission_count == 0:
-            continue  # 提出がない場合はスキップ
-
-        if len(user_final_submissions) == 2:
-            for submission in user_final_submissions.to_dict("records"):
-                submission["submission_count"] = submission_count
-                leaderboard_data.append(submission)
-        elif len(user_final_submissions) == 1:
-            final_submission = user_final_submissions.iloc[0].to_dict()
-            final_submission["submission_count"] = submission_count
-            leaderboard_data.append(final_submission)
-
-            other_submissions = user_submissions[
-                user_submissions["submission_id"] != final_submission["submission_id"]
-            ]
-            if len(other_submissions) > 0:
-                best_other_submission = other_submissions.loc[
-                    compare(other_submissions["public_score"])
-                ].to_dict()
-                best_other_submission["submission_count"] = submission_count
-                leaderboard_data.append(best_other_submission)
-        else:
-            best_submissions = best_n(user_submissions, "public_score", 2)
-            for submission in best_submissions.to_dict("records"):
-                submission["submission_count"] = submission_count
-                leaderboard_data.append(submission)
-
-    return pd.DataFrame(leaderboard_data)
-
-
-def create_optimized_public_score_leaderboard(users_df, submissions_df):
-    """OPTIMIZATION_DIRECTIONに基づいて最適化されたpublic_scoreのリーダーボードを作成する"""
-    leaderboard_data = []
-
-    if OPTIMIZATION_DIRECTION == "max":
-        compare = lambda df, col: df[col].idxmax()
-        sort_ascending = False
-        rank_ascending = False
-    elif OPTIMIZATION_DIRECTION == "min":
-        compare = lambda df, col: df[col].idxmin()
-        sort_ascending = True
-        rank_ascending = True
-    else:
-        raise ValueError("OPTIMIZATION_DIRECTION must be either 'max' or 'min'")
-
-    for _, user in users_df.iterrows():
-        user_id = user["user_id"]
-        user_submissions = submissions_df[submissions_df["user_id"] == user_id]
-
-        submission_count = len(user_submissions)
-
-        if submission_count > 0:
-            # 提出がある場合、最適なpublic_scoreを持つものを選ぶ
-            best_submission = user_submissions.loc[
-                compare(user_submissions, "public_score")
-            ].to_dict()
-            best_submission["submission_count"] = submission_count
-            leaderboard_data.append(best_submission)
-
-    if len(leaderboard_data) == 0:
-        print("No submissions found for public_score leaderboard")
-        st.warning("No submissions found for public_score leaderboard")
-        return pd.DataFrame()
-    # public_scoreでソート
-    leaderboard_df = (
-        pd.DataFrame(leaderboard_data)
-        .sort_values("public_score", ascending=sort_ascending)
-        .reset_index(drop=True)
-    )
-
-    # ランクを追加
-    leaderboard_df["rank"] = (
-        leaderboard_df["public_score"]
-        .rank(method="min", ascending=rank_ascending)
-        .astype(int)
-    )
-
-    return leaderboard_df
-
-
-def get_team_name_user_df():
-    conn_main = sqlite3.connect(SUBMISSION_DB_PATH)
-    c_main = conn_main.cursor()
-    c_main.execute("SELECT user_id, team_name FROM team_users")
-    team_users_df = pd.DataFrame(c_main.fetchall(), columns=["user_id", "team_name"])
-    conn_main.close()
-    return team_users_df
-
-
-def generate_leaderboard():
-    users_df, submissions_df, final_submissions_df = fetch_data_from_db()
-    team_users_df = get_team_name_user_df()
-
-    leaderboard_df = prepare_leaderboard_data(
-        users_df, submissions_df, final_submissions_df
-    )
-    public_leaderboard_df = create_optimized_public_score_leaderboard(
-        users_df=users_df, submissions_df=submissions_df
-    )
-
-    # ユーザー名とチーム名を追加
-    leaderboard_df = leaderboard_df.merge(
-        users_df[["user_id", "username"]], on="user_id", how="left"
-    ).merge(team_users_df, on="user_id", how="left")
-
-    if OPTIMIZATION_DIRECTION == "max":
-        leaderboard = (
-            leaderboard_df.groupby("user_id")
-            .agg(
-                {
-                    "username": "first",
-                    "team_name": "first",
-                    "public_score": "max",
-                    "private_score": "max",
-                    "submission_count": "max",
-                    "timestamp": "min",  # 最も早いタイムスタンプを取得
-                }
-            )
-            .reset_index()
-        )
-        leaderboard = leaderboard.sort_values(
-            ["private_score", "timestamp"], ascending=[False, True]
-        )
-    else:  # min
-        leaderboard = (
-            leaderboard_df.groupby("user_id")
-            .agg(
-                {
-                    "username": "first",
-                    "team_name": "first",
-                    "public_score": "min",
-                    "private_score": "min",
-                    "submission_count": "max",
-                    "timestamp": "min",  # 最も早いタイムスタンプを取得
-                }
-            )
-            .reset_index()
-        )
-        leaderboard = leaderboard.sort_values(
-            ["private_score", "timestamp"], ascending=[True, True]
-        )
-
-    leaderboard["順位"] = range(1, len(leaderboard) + 1)
-
-    # public_leaderboard_dfの順位を取得
-    public_ranks = public_leaderboard_df.set_index("user_id")["rank"].to_dict()
-
-    # 順位変動を計算
-    leaderboard["public_rank"] = leaderboard["user_id"].map(public_ranks)
-    leaderboard["順位変動"] = leaderboard["public_rank"] - leaderboard["順位"]
-
-    leaderboard = leaderboard.rename(
-        columns={
-            "username": "ユーザー",
-            "team_name": "チーム名",
-            "public_score": "Public スコア",
-            "private_score": "Private スコア",
-            "submission_count": "提出回数",
-        }
-    )
-    leaderboard["Public スコア"] = leaderboard["Public スコア"].round(3)
-    leaderboard["Private スコア"] = leaderboard["Private スコア"].round(3)
-    leaderboard = leaderboard[
-        [
-            "順位変動",
-            "順位",
-            "チーム名",
-            "Private スコア",
-            "Public スコア",
-            "提出回数",
-        ]
-    ]
-
-    return leaderboard
-
-
 def display_leaderboard():
     check_admin()  # admin権限チェック
 
     st.title("🏆 リーダーボード   🏆")
+    direction = "最大化" if get_optimization_direction() == "max" else "最小化"
     st.write(
-        f"現在のPrivate Scoreに基づくリーダーボードです。(最適化方向: {'最大化' if OPTIMIZATION_DIRECTION == 'max' else '最小化'})"
+        f"現在のPrivate Scoreに基づくリーダーボードです。(最適化方向: {direction})"
     )
 
     leaderboard = generate_leaderboard()
@@ -281,6 +71,130 @@ def display_leaderboard():
     fig = create_leaderboard_table(leaderboard.iloc[start_idx:end_idx])
     leaderboard_chart.plotly_chart(fig, use_container_width=True)
 
+    display_split_leaderboard()
+    display_duplicate_flags()
+    display_similarity_check()
+    display_data_export()
+
+
+def display_split_leaderboard():
+    st.subheader("分割ごとのリーダーボード")
+    split_names = get_split_names()
+    if not split_names:
+        st.info("まだ提出がありません。")
+        return
+    st.write("各チームの全ての提出のうち、選択した分割で最も良いスコアの順に並べます。")
+    split = st.selectbox("分割", split_names)
+    st.dataframe(get_leaderboard(split), hide_index=True)
+
+
+def display_duplicate_flags():
+    st.subheader("重複の疑いがある提出")
+    flags = get_duplicate_flags()
+    if flags.empty:
+        st.info("重複の疑いがある提出は検出されていません。")
+        return
+    st.write(
+        f"登録時に別のユーザーの提出とシグネチャのハミング距離が{MAX_HAMMING_DISTANCE}以下だった提出です。"
+    )
+    flags = flags.rename(
+        columns={
+            "flagged_at": "検出日時",
+            "hamming_distance": "ハミング距離",
+            "submission_id": "提出ID",
+            "username": "ユーザー",
+            "filename": "ファイル名",
+            "matched_submission_id": "一致した提出ID",
+            "matched_username": "一致したユーザー",
+            "matched_filename": "一致したファイル名",
+        }
+    )
+    st.dataframe(flags, hide_index=True)
+
+
+def display_similarity_check():
+    st.subheader("最終提出の類似度チェック")
+    st.write(
+        "チーム間で予測値を共有していないか確認するため、最終提出どうしの類似度を計算します。"
+        "予測値キャッシュのない提出は含まれません。"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        metric = st.selectbox(
+            "類似度",
+            SIMILARITY_METRICS,
+            format_func=lambda m: {
+                "correlation": "相関係数 (大きいほど類似)",
+                "rmsd": "予測値の差のRMS (小さいほど類似)",
+            }[m],
+        )
+    with col2:
+        top_k = st.number_input("表示する組の数", min_value=1, max_value=200, value=20)
+
+    if not st.button("類似度を計算"):
+        return
+    with st.spinner("計算中..."):
+        pairs, final_df, full_matrix = find_similar_final_submissions(metric, top_k)
+    if pairs.empty:
+        st.info("比較できる最終提出が2つ以上ありません。")
+        return
+
+    st.write(f"対象の最終提出: {len(final_df)}件")
+    st.dataframe(pairs, hide_index=True)
+    if full_matrix is not None:
+        labels = [
+            f"{row.team_name} ({row.submission_id})" for row in final_df.itertuples()
+        ]
+        fig = go.Figure(
+            data=go.Heatmap(
+                z=full_matrix,
+                x=labels,
+                y=labels,
+                colorscale="Reds" if metric == "correlation" else "Reds_r",
+            )
+        )
+        fig.update_layout(height=max(400, 20 * len(labels)))
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def display_data_export():
+    st.subheader("データのエクスポート")
+    st.write(
+        "submissions、submission_scores、final_submissions、users、team_usersを"
+        "ParquetまたはArrow IPCで"
+        "zipにまとめてダウンロードします。"
+        f"zipが{EXPORT_DOWNLOAD_MAX_BYTES // 1024 // 1024}MBを超える場合は"
+        " tool/export_competition.py でサーバー上に書き出してください。"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        file_format = st.radio("形式", list(EXPORT_FORMATS), horizontal=True)
+    with col2:
+        include_predictions = st.checkbox("予測値キャッシュを含める")
+
+    if not st.button("エクスポートを作成"):
+        return
+    with st.spinner("エクスポート中..."):
+        zip_path = export_competition_zip(file_format, include_predictions)
+    try:
+        zip_size = os.path.getsize(zip_path)
+        if zip_size > EXPORT_DOWNLOAD_MAX_BYTES:
+            st.error(
+                f"zipが{zip_size / 1024 / 1024:.0f}MBあり、画面からダウンロードできる"
+                f"{EXPORT_DOWNLOAD_MAX_BYTES // 1024 // 1024}MBを超えています。"
+                " tool/export_competition.py でサーバー上に書き出してください。"
+            )
+            return
+        with open(zip_path, "rb") as file:
+            st.download_button(
+                "ダウンロード",
+                data=file.read(),
+                file_name=f"minikaggle_export_{file_format}.zip",
+                mime="application/zip",
+            )
+    finally:
+        os.remove(zip_path)
+
 
 def create_leaderboard_table(df):
     """リーダーボードテーブルを作成する"""
@@ -295,7 +209,6 @@ def create_leaderboard_table(df):
     submit_width = 60  # 最小幅60、文字数に応じて増加
     team_width = 200  # チーム名用の固定幅
     score_width = 60  # スコア用の固定幅
-    submit_count = 60
 
     # 順位変動に基づいて色を設定
     rank_change_colors = []
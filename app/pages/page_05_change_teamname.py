@@ -1,107 +1,138 @@
-import sqlite3
-
 import streamlit as st
 from streamlit import session_state as ss
 
 from app.nav import MenuButtons
 from app.pages.account import get_roles
 from app.src.database import get_or_create_user_id
+from app.src.teams import (
+    TeamError,
+    accept_merge_request,
+    cancel_merge_request,
+    get_max_team_size,
+    get_merge_requests,
+    get_team_by_name,
+    get_team_members,
+    get_team_summary,
+    get_user_team,
+    leave_team,
+    rename_team,
+    request_team_merge,
+)
+
+
+def show_team_info(team_id, team_name):
+    """チーム名・メンバー・ベストスコアを表示する"""
+    best_score, submission_count, member_count = get_team_summary(team_id)
+    st.write(f"現在のチーム名: {team_name}")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("メンバー数", member_count)
+    col2.metric("Submit回数", submission_count)
+    col3.metric("ベストスコア", "-" if best_score is None else f"{best_score:.3f}")
+    st.write("メンバー: " + ", ".join(get_team_members(team_id)))
+
+
+def show_rename_form(team_id, team_name):
+    new_team_name = st.text_input("新しいチーム名", value=team_name)
+
+    # 更新ボタン
+    if st.button("チーム名を更新"):
+        if new_team_name and new_team_name != team_name:
+            try:
+                rename_team(team_id, new_team_name)
+            except TeamError as e:
+                st.error(str(e))
+                return
+            # 再実行後のチーム情報に新しい名前を表示してから、結果を表示する
+            ss.team_message = (
+                f"チーム名を '{team_name}' から '{new_team_name}' に更新しました。"
+            )
+            st.rerun()
+        else:
+            st.warning("チーム名が変更されていないか、新しい名前が入力されていません。")
+
 
-# データベースのパス
-SUBMITTION_DB_PATH = "./database/submissions.db"
-
-
-# ユーザーのチーム情報を取得する関数
-def get_user_team(user_id):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        """
-        SELECT team_id, team_name 
-        FROM team_users
-        WHERE user_id = ?
-    """,
-        (user_id,),
-    )
-    team = c.fetchone()
-    conn.close()
-    return team
-
-
-# チーム名を更新する関数
-def update_team_name(team_id, new_name):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute(
-            "UPDATE team_users SET team_name = ? WHERE team_id = ?", (new_name, team_id)
+def show_merge_section(team_id, user_id):
+    st.subheader("チームの合流")
+    max_team_size = get_max_team_size()
+    if max_team_size is not None:
+        st.caption(f"チームの上限は{max_team_size}人です。")
+
+    incoming, outgoing = get_merge_requests(team_id)
+    for source_team_id, source_team_name in incoming:
+        col1, col2, col3 = st.columns([3, 1, 1])
+        col1.write(f"'{source_team_name}' から合流リクエストが届いています。")
+        if col2.button("承認", key=f"accept_{source_team_id}"):
+            try:
+                accept_merge_request(source_team_id, team_id)
+            except TeamError as e:
+                st.error(str(e))
+            else:
+                st.rerun()
+        if col3.button("拒否", key=f"reject_{source_team_id}"):
+            cancel_merge_request(source_team_id, team_id)
+            st.rerun()
+
+    for target_team_id, target_team_name in outgoing:
+        col1, col2 = st.columns([4, 1])
+        col1.write(f"'{target_team_name}' に合流リクエストを送っています。")
+        if col2.button("取り消し", key=f"cancel_{target_team_id}"):
+            cancel_merge_request(team_id, target_team_id)
+            st.rerun()
+
+    target_team_name = st.text_input("合流先のチーム名")
+    if st.button("合流をリクエスト"):
+        target_team = get_team_by_name(target_team_name)
+        if target_team is None:
+            st.error(f"チーム '{target_team_name}' は存在しません。")
+            return
+        try:
+            request_team_merge(team_id, target_team[0], user_id)
+        except TeamError as e:
+            st.error(str(e))
+            return
+        st.success(
+            f"'{target_team_name}' に合流リクエストを送りました。"
+            "相手のチームが承認すると合流します。"
         )
-        conn.commit()
-        success = True
-    except sqlite3.Error:
-        success = False
-    finally:
-        conn.close()
-    return success
-
-
-# 新しいチームを作成する関数
-def create_new_team(user_id, team_name):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO team_users (team_name, user_id) VALUES (?, ?)",
-        (team_name, user_id),
-    )
-    team_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return team_id
+
+
+def show_leave_section(team_id, user_id):
+    _, _, member_count = get_team_summary(team_id)
+    if member_count <= 1:
+        return
+    st.subheader("チームからの脱退")
+    st.caption("脱退すると、これまでの提出は新しい1人のチームのものになります。")
+    if st.button("チームから脱退"):
+        try:
+            leave_team(user_id)
+        except TeamError as e:
+            st.error(str(e))
+        else:
+            st.rerun()
 
 
 # Streamlitアプリケーション
 def show():
     MenuButtons(get_roles())
-    st.title("チーム名変更")
+    st.title("チーム")
 
     # ユーザーIDを取得
     user_id = get_or_create_user_id(ss.username)
 
-    # ユーザーのチーム情報を取得
+    # ユーザーのチーム情報を取得 (未所属なら1人のチームを作る)
     team = get_user_team(user_id)
-
-    if team:
-        team_id, current_team_name = team
-    else:
-        # ユーザーがチームに所属していない場合、新しいチームを作成
-        current_team_name = ss.username
-        team_id = create_new_team(user_id, current_team_name)
-        st.info(f"新しいチーム '{current_team_name}' を作成しました。")
-
-    # 現在のチーム名を表示
-    if "team_name" not in ss:
-        ss.team_name = current_team_name
-    st.write(f"現在のチーム名: {ss.team_name}")
-
-    # 新しいチーム名の入力
-    new_team_name = st.text_input("新しいチーム名", value=ss.team_name)
-
-    # 更新ボタン
-    if st.button("チーム名を更新"):
-        if new_team_name and new_team_name != ss.team_name:
-            success = update_team_name(team_id, new_team_name)
-            if success:
-                st.success(
-                    f"チーム名を '{ss.team_name}' から '{new_team_name}' に更新しました。"
-                )
-                # セッション状態を更新して、再読み込み後も新しいチーム名が表示されるようにする
-                ss.team_name = new_team_name
-            else:
-                st.error(
-                    "チーム名の更新中にエラーが発生しました。もう一度お試しください。"
-                )
-        else:
-            st.warning("チーム名が変更されていないか、新しい名前が入力されていません。")
+    if team is None:
+        # ユーザーが登録されていない (ユーザーIDを取得できなかった) 場合
+        st.error("チーム情報を取得できませんでした。時間をおいて再度お試しください。")
+        return
+    team_id, team_name = team
+
+    show_team_info(team_id, team_name)
+    if "team_message" in ss:
+        st.success(ss.pop("team_message"))
+    show_rename_form(team_id, team_name)
+    show_merge_section(team_id, user_id)
+    show_leave_section(team_id, user_id)
 
 
 if __name__ == "__main__":
@@ -1,40 +1,64 @@
-import sqlite3
+import math
 
-import polars as pl
 import streamlit as st
+from streamlit import session_state as ss
 
+from app.nav import MenuButtons
+from app.pages.account import get_roles
+from app.pages.page_04_private_leaderboard import check_admin
+from app.src.lazy_import import lazy_import
+from app.src.user_directory import USER_DIRECTORY_PAGE_SIZE, search_users, sync_accounts
 
-# データベースから全ユーザーを取得する関数
-def get_all_users():
-    conn = sqlite3.connect("./database/users.db")
-    c = conn.cursor()
-    c.execute("SELECT username, email FROM users")
-    users = c.fetchall()
-    conn.close()
-    return users
+pl = lazy_import("polars")
+
+
+def reset_page():
+    # 検索語が変わったら1ページ目から表示する
+    ss.user_directory_page = 1
 
 
 # Streamlitアプリケーション
 def show():
+    MenuButtons(get_roles())
+    check_admin()
+
     st.title("登録ユーザー一覧")
 
-    # データベースからユーザー情報を取得
-    users = get_all_users()
+    # 認証設定ファイルが更新されていれば、アカウントとメールアドレスを反映する
+    sync_accounts()
 
-    if users:
-        # ユーザー情報をPolars DataFrameに変換
-        df = pl.DataFrame(
-            {
-                "ユーザー名": [user[0] for user in users],
-                "メールアドレス": [user[1] for user in users],
-            }
+    query = st.text_input(
+        "検索 (ユーザー名・メールアドレス・チーム名の部分一致、空白区切りでAND。"
+        "2文字以下の語だけの場合はユーザー名の前方一致)",
+        key="user_directory_query",
+        on_change=reset_page,
+    )
+    if "user_directory_page" not in ss:
+        ss.user_directory_page = 1
+
+    users, total = search_users(query, ss.user_directory_page)
+    if total == 0:
+        st.write(
+            "該当するユーザーはいません。"
+            if query
+            else "登録されているユーザーはいません。"
         )
+        return
+
+    page_count = math.ceil(total / USER_DIRECTORY_PAGE_SIZE)
+    if ss.user_directory_page > page_count:
+        ss.user_directory_page = page_count
+        users, total = search_users(query, ss.user_directory_page)
+    st.number_input(
+        "ページ", min_value=1, max_value=page_count, key="user_directory_page"
+    )
 
-        # ユーザー情報をテーブルとして表示
-        st.write("登録されているユーザー:")
-        st.dataframe(df)
-    else:
-        st.write("登録されているユーザーはいません。")
+    start = (ss.user_directory_page - 1) * USER_DIRECTORY_PAGE_SIZE
+    st.write(f"全{total}件中 {start + 1}〜{start + len(users)}件目")
+    df = pl.DataFrame(
+        users, schema=["ユーザー名", "メールアドレス", "チーム名"], orient="row"
+    )
+    st.dataframe(df, hide_index=True, use_container_width=True)
 
 
 if __name__ == "__main__":
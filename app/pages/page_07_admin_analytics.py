@@ -0,0 +1,116 @@
+import time
+
+import streamlit as st
+
+from app.nav import MenuButtons
+from app.pages.account import get_roles
+from app.pages.page_04_private_leaderboard import check_admin
+from app.src.database import get_hourly_activity
+from app.src.lazy_import import lazy_import
+from app.src.leaderboard import get_optimization_direction
+from app.src.retention import get_user_storage
+
+go = lazy_import("plotly.graph_objects")
+plotly_subplots = lazy_import("plotly.subplots")
+
+# 表示期間の選択肢 (日数、Noneは全期間)
+PERIOD_OPTIONS = {"過去24時間": 1, "過去7日間": 7, "過去30日間": 30, "全期間": None}
+
+
+def create_activity_chart(activity):
+    fig = plotly_subplots.make_subplots(
+        rows=3,
+        cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.06,
+        subplot_titles=(
+            "1時間あたりの提出数",
+            "アクティブユーザー数",
+            "ベストスコアの推移",
+        ),
+    )
+    fig.add_trace(
+        go.Bar(x=activity["hour"], y=activity["submission_count"], name="提出数"),
+        row=1,
+        col=1,
+    )
+    fig.add_trace(
+        go.Bar(
+            x=activity["hour"], y=activity["active_users"], name="アクティブユーザー"
+        ),
+        row=2,
+        col=1,
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=activity["hour"],
+            y=activity["best_score"],
+            mode="lines+markers",
+            line_shape="hv",
+            name="ベストスコア",
+        ),
+        row=3,
+        col=1,
+    )
+    fig.update_layout(height=800, showlegend=False, margin=dict(l=0, r=0, t=40, b=0))
+    return fig
+
+
+def show():
+    MenuButtons(get_roles())
+    check_admin()
+
+    st.title("📈 提出状況の分析")
+    direction = "最大化" if get_optimization_direction() == "max" else "最小化"
+    st.write(
+        "1時間ごとの提出数、アクティブユーザー数、"
+        f"その時点までのベストPublic Scoreです。(最適化方向: {direction})"
+    )
+
+    period = st.radio("表示期間", list(PERIOD_OPTIONS), index=1, horizontal=True)
+    days = PERIOD_OPTIONS[period]
+    since = int(time.time()) - days * 24 * 3600 if days is not None else None
+    activity = get_hourly_activity(since)
+    if activity.empty:
+        st.info("この期間の提出はありません。")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("提出数", int(activity["submission_count"].sum()))
+    col2.metric("最大アクティブユーザー数(1時間)", int(activity["active_users"].max()))
+    col3.metric("現在のベストスコア", f"{activity['best_score'].iloc[-1]:.4f}")
+
+    st.plotly_chart(create_activity_chart(activity), use_container_width=True)
+    display_user_storage()
+
+
+def display_user_storage():
+    st.subheader("提出ファイルの使用量")
+    storage = get_user_storage()
+    if storage.empty:
+        st.info(
+            "使用量はまだ集計されていません。"
+            "tool/compact_submissions.py を実行すると記録されます。"
+        )
+        return
+    col1, col2 = st.columns(2)
+    col1.metric("未圧縮", f"{storage['hot_bytes'].sum() / 1024**2:.1f} MB")
+    col2.metric("圧縮済み", f"{storage['archive_bytes'].sum() / 1024**2:.1f} MB")
+    st.dataframe(
+        storage.rename(
+            columns={
+                "username": "ユーザー",
+                "hot_files": "未圧縮のファイル数",
+                "hot_bytes": "未圧縮(バイト)",
+                "archived_files": "圧縮済みのファイル数",
+                "archived_bytes": "圧縮前(バイト)",
+                "archive_bytes": "zip(バイト)",
+                "updated_at": "集計日時",
+            }
+        ),
+        hide_index=True,
+    )
+
+
+if __name__ == "__main__":
+    show()
@@ -0,0 +1,416 @@
+"""正解データ(test.csv)のバイナリ形式
+
+test.csvを列ごとの.npyに変換しておき、スコア計算時は np.load(mmap_mode="r") で読み込む。
+複数のStreamlitプロセスやスコア計算ワーカーがページキャッシュ上の1つのコピーを共有でき、
+CSVのパースも不要になる。
+
+<test.csvのディレクトリ>/answer_key/
+    ids.npy        id列 (昇順にソート済み)
+    target.npy     正解列 (ids順)。項目のリストの場合は全行の項目のコード、
+                   多クラスの場合はclass_columnsでのクラスの番号
+    target_offsets.npy  項目のリストの各行の開始位置 (項目のリストのみ)
+    vocab.npy      項目のコードに対応する項目名 (項目のリストのみ)
+    split.npy      分割ラベル uint8 (ids順)。0=private、1=public、
+                   2以降はその他の分割 (meta.jsonのsplits)
+    weight.npy     行の重み (weight_columnを設定した場合のみ)
+    segment.npy    各行の (分割, グループ) の番号 int32
+                   (group_columnを設定した場合のみ。それ以外は分割ラベルをそのまま番号とする)。
+                   番号は分割ラベルの順に、分割ごとの全グループをgroup_columnの値の順に並べる
+    segment_split.npy   各番号の分割ラベル
+    segment_weight.npy  各番号の重みの合計 (重みがない場合は行数)
+    row_index.npy  ids順の各行がtest.csvの何行目だったか (id列のない提出の位置合わせ用)
+    meta.json      変換元ファイルの情報
+
+ラベルはビット単位に詰めると各プロセスで展開したコピーが必要になり共有の意味がなくなるため、
+1行1バイトのuint8で保持する。
+
+分割はis_public列(1=public, 0=private)か、split_columnで指定した列の分割名で決まる。
+split_columnではpublicとprivate以外の任意の分割(段階的な公開用、分析用など)を追加できる。
+
+スコアは、行ごとの誤差を segment.npy の番号ごとに np.bincount で合計し、
+番号ごとのスコアを分割ごとに平均して、全ての分割について1回で求める。
+番号と重みの合計は変換時に計算しておくため、採点時のグループ分けの処理は不要で、
+分割やグループが増えても採点時間はほぼ変わらない。
+"""
+
+import errno
+import json
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.src.lazy_import import lazy_import
+from app.src.logger_config import get_logger
+from app.src.ranking_metrics import (
+    encode_answer_lists,
+    encode_prediction_lists,
+    get_answer_format,
+)
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+pa = lazy_import("pyarrow")
+
+logger = get_logger(__name__)
+
+ANSWER_KEY_DIRNAME = "answer_key"
+FORMAT_VERSION = 3
+PUBLIC_SPLIT_LABEL = 1
+PRIVATE_SPLIT_LABEL = 0
+PUBLIC_SPLIT_NAME = "public"
+PRIVATE_SPLIT_NAME = "private"
+# 分割ラベルはuint8で持つ
+MAX_SPLITS = 256
+
+# 同じプロセスの複数のスレッドが同時に変換しないようにする
+_compile_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class AnswerKey:
+    ids: "np.ndarray"
+    target: "np.ndarray"
+    split: "np.ndarray"
+    row_index: "np.ndarray"
+    meta: dict
+    # 項目のリストの正解のみ (それ以外はNone)
+    target_offsets: "np.ndarray | None" = None
+    vocab: "pa.Array | None" = None
+    # weight_columnを設定した場合のみ (それ以外はNone)
+    weight: "np.ndarray | None" = None
+    # (分割, グループ) ごとの番号 (build_segments)
+    segment: "np.ndarray | None" = None
+    segment_split: "np.ndarray | None" = None
+    segment_weight: "np.ndarray | None" = None
+
+    def __len__(self):
+        return len(self.split)
+
+    @property
+    def splits(self):
+        """分割ラベルの順の分割名"""
+        return self.meta["splits"]
+
+    def split_mask(self, name):
+        return self.split == self.splits.index(name)
+
+    @property
+    def public_mask(self):
+        return self.split == PUBLIC_SPLIT_LABEL
+
+    @property
+    def private_mask(self):
+        return self.split == PRIVATE_SPLIT_LABEL
+
+
+def get_answer_key_dir(competition):
+    return os.path.join(os.path.dirname(competition.test_csv_path), ANSWER_KEY_DIRNAME)
+
+
+def _source_signature(test_csv_path):
+    stat = os.stat(test_csv_path)
+    return {"source_mtime_ns": stat.st_mtime_ns, "source_size": stat.st_size}
+
+
+def _read_meta(answer_key_dir):
+    meta_path = os.path.join(answer_key_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as file:
+        return json.load(file)
+
+
+def is_answer_key_fresh(competition):
+    """変換済みの正解データがtest.csvと設定に対して最新かどうか"""
+    meta = _read_meta(get_answer_key_dir(competition))
+    if meta is None or meta.get("format_version") != FORMAT_VERSION:
+        return False
+    config = competition.config["competition"]
+    return (
+        meta["answer_column"] == config["answer_column"]
+        and meta["id_column"] == config.get("id_column", "id")
+        and meta["answer_format"] == get_answer_format(config["metric"])
+        and meta.get("class_columns") == config.get("class_columns")
+        and meta.get("split_column") == config.get("split_column")
+        and meta.get("group_column") == config.get("group_column")
+        and meta.get("weight_column") == config.get("weight_column")
+        and all(
+            meta[key] == value
+            for key, value in _source_signature(competition.test_csv_path).items()
+        )
+    )
+
+
+def encode_splits(test_df, split_column=None):
+    """test.csvの各行の分割ラベルと、分割ラベルの順の分割名を返す
+
+    split_columnがない場合はis_public列を使う。privateを0、publicを1とし、
+    それ以外の分割は名前の順に2からラベルを振る。
+    """
+    if not split_column:
+        return (
+            test_df["is_public"].to_numpy().astype(np.uint8),
+            [PRIVATE_SPLIT_NAME, PUBLIC_SPLIT_NAME],
+        )
+    values = test_df[split_column]
+    if values.isna().any():
+        raise ValueError(f"{split_column} must not contain missing values.")
+    values = values.astype(str)
+    extra = sorted(set(values.unique()) - {PRIVATE_SPLIT_NAME, PUBLIC_SPLIT_NAME})
+    splits = [PRIVATE_SPLIT_NAME, PUBLIC_SPLIT_NAME, *extra]
+    if len(splits) > MAX_SPLITS:
+        raise ValueError(f"{split_column} must have at most {MAX_SPLITS} splits.")
+    labels = pd.Categorical(values, categories=splits).codes.astype(np.uint8)
+    return labels, splits
+
+
+def build_segments(split, num_splits, groups=None, weights=None):
+    """(分割, グループ) ごとの番号を振る
+
+    (segment, segment_split, segment_weight) を返す。
+    groupsがNoneの場合は分割ラベルをそのまま番号にする (segmentはNone)。
+    """
+    if groups is None:
+        segment, num_groups = None, 1
+    else:
+        codes, uniques = pd.factorize(groups, sort=True)
+        if (codes < 0).any():
+            raise ValueError("group_column must not contain missing values.")
+        num_groups = max(len(uniques), 1)
+        segment = (split.astype(np.int64) * num_groups + codes).astype(np.int32)
+    num_segments = num_splits * num_groups
+    segment_split = (np.arange(num_segments) // num_groups).astype(np.uint8)
+    segment_weight = np.bincount(
+        split if segment is None else segment, weights=weights, minlength=num_segments
+    )
+    return segment, segment_split, segment_weight.astype(np.float64)
+
+
+def _sort_ids(test_df, id_column):
+    """ids順に並べ替えるための (row_index, ids) を返す"""
+    if id_column not in test_df.columns:
+        # id列がない場合は行番号をidとして扱う
+        row_index = np.arange(len(test_df))
+        return row_index, row_index.copy()
+    row_index = np.argsort(test_df[id_column].to_numpy(), kind="stable")
+    ids = test_df[id_column].to_numpy()[row_index]
+    if len(ids) > 1 and (ids[1:] == ids[:-1]).any():
+        raise ValueError(f"{id_column} must be unique to compile the answer key.")
+    return row_index, ids
+
+
+def _save_target(tmp_dir, answers, answer_format, config):
+    """正解列を正解の形式に合わせて変換して保存する"""
+    if answer_format == "list":
+        target, vocab = encode_answer_lists(answers)
+        np.save(os.path.join(tmp_dir, "target.npy"), target.values)
+        np.save(os.path.join(tmp_dir, "target_offsets.npy"), target.offsets)
+        np.save(os.path.join(tmp_dir, "vocab.npy"), vocab)
+    elif answer_format == "class":
+        class_columns = config.get("class_columns")
+        if not class_columns:
+            raise ValueError(f"{config['metric']} requires class_columns.")
+        labels = pd.Index(class_columns).get_indexer(answers)
+        if (labels < 0).any():
+            raise ValueError(
+                f"{config['answer_column']} has labels not in class_columns."
+            )
+        np.save(os.path.join(tmp_dir, "target.npy"), labels)
+    else:
+        np.save(os.path.join(tmp_dir, "target.npy"), answers)
+
+
+def _save_splits(tmp_dir, test_df, row_index, config):
+    """分割ラベル・行の重み・(分割, グループ) の番号を保存し、分割名のリストを返す"""
+    split, splits = encode_splits(test_df, config.get("split_column"))
+    split = split[row_index]
+    np.save(os.path.join(tmp_dir, "split.npy"), split)
+    group_column = config.get("group_column")
+    weight_column = config.get("weight_column")
+    weights = None
+    if weight_column:
+        weights = pd.to_numeric(test_df[weight_column]).to_numpy(dtype=np.float64)[
+            row_index
+        ]
+        if np.isnan(weights).any() or (weights < 0).any():
+            raise ValueError(f"{weight_column} must be non-negative numbers.")
+        np.save(os.path.join(tmp_dir, "weight.npy"), weights)
+    groups = test_df[group_column].to_numpy()[row_index] if group_column else None
+    segment, segment_split, segment_weight = build_segments(
+        split, len(splits), groups, weights
+    )
+    if segment is not None:
+        np.save(os.path.join(tmp_dir, "segment.npy"), segment)
+    np.save(os.path.join(tmp_dir, "segment_split.npy"), segment_split)
+    np.save(os.path.join(tmp_dir, "segment_weight.npy"), segment_weight)
+    return splits
+
+
+def _replace_answer_key_dir(tmp_dir, answer_key_dir, parent_dir):
+    """書き出し終えた一時ディレクトリを正解データのディレクトリに置き換える"""
+    old_dir = None
+    if os.path.exists(answer_key_dir):
+        old_dir = tempfile.mkdtemp(prefix=".answer_key_old_", dir=parent_dir)
+        os.replace(answer_key_dir, os.path.join(old_dir, ANSWER_KEY_DIRNAME))
+    try:
+        os.replace(tmp_dir, answer_key_dir)
+    except OSError as e:
+        if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+            raise
+        # 別のプロセスが同じtest.csvから変換して先に置いたので、そちらを使う
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def compile_answer_key(competition):
+    """test.csvを列ごとの.npyに変換する
+
+    一時ディレクトリに書き出してから置き換えるため、読み込み中のプロセスが
+    書きかけのファイルを見ることはない。
+    """
+    config = competition.config["competition"]
+    answer_column = config["answer_column"]
+    id_column = config.get("id_column", "id")
+    answer_format = get_answer_format(config["metric"])
+    class_columns = config.get("class_columns")
+    split_column = config.get("split_column")
+    group_column = config.get("group_column")
+    weight_column = config.get("weight_column")
+    signature = _source_signature(competition.test_csv_path)
+
+    # 項目のリストやクラス名の先頭の0が数値として読まれないよう、正解列は文字列で読む
+    test_df = pd.read_csv(
+        competition.test_csv_path,
+        dtype={answer_column: str} if answer_format != "scalar" else None,
+    )
+    if answer_format == "scalar" and not pd.api.types.is_numeric_dtype(
+        test_df[answer_column]
+    ):
+        raise ValueError(f"{answer_column} must be numeric to compile the answer key.")
+
+    row_index, ids = _sort_ids(test_df, id_column)
+
+    answer_key_dir = get_answer_key_dir(competition)
+    parent_dir = os.path.dirname(answer_key_dir) or "."
+    tmp_dir = tempfile.mkdtemp(prefix=".answer_key_", dir=parent_dir)
+    try:
+        np.save(os.path.join(tmp_dir, "ids.npy"), ids)
+        answers = test_df[answer_column].to_numpy()[row_index]
+        _save_target(tmp_dir, answers, answer_format, config)
+        splits = _save_splits(tmp_dir, test_df, row_index, config)
+        np.save(os.path.join(tmp_dir, "row_index.npy"), row_index)
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "answer_column": answer_column,
+            "id_column": id_column,
+            "has_id_column": id_column in test_df.columns,
+            "answer_format": answer_format,
+            "class_columns": class_columns,
+            "split_column": split_column,
+            "splits": splits,
+            "group_column": group_column,
+            "weight_column": weight_column,
+            "num_rows": len(test_df),
+            **signature,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as file:
+            json.dump(meta, file, indent=2)
+        _replace_answer_key_dir(tmp_dir, answer_key_dir, parent_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"Compiled answer key: {answer_key_dir} ({len(ids)} rows)")
+    return answer_key_dir
+
+
+@lru_cache(maxsize=16)
+def _load_compiled_answer_key(answer_key_dir, meta_mtime_ns):
+    # meta.jsonのmtimeをキーに含めることで、再変換されたら読み直す
+    meta = _read_meta(answer_key_dir)
+    target_offsets, vocab = None, None
+    if meta["answer_format"] == "list":
+        target_offsets = np.load(
+            os.path.join(answer_key_dir, "target_offsets.npy"), mmap_mode="r"
+        )
+        # 予測の項目をコードに変換するときの検索用に、pyarrowの配列にしておく
+        vocab = pa.array(np.load(os.path.join(answer_key_dir, "vocab.npy")))
+    weight = None
+    if meta["weight_column"]:
+        weight = np.load(os.path.join(answer_key_dir, "weight.npy"), mmap_mode="r")
+    split = np.load(os.path.join(answer_key_dir, "split.npy"), mmap_mode="r")
+    segment = split
+    if meta["group_column"]:
+        segment = np.load(os.path.join(answer_key_dir, "segment.npy"), mmap_mode="r")
+    return AnswerKey(
+        ids=np.load(os.path.join(answer_key_dir, "ids.npy"), mmap_mode="r"),
+        target=np.load(os.path.join(answer_key_dir, "target.npy"), mmap_mode="r"),
+        split=split,
+        row_index=np.load(os.path.join(answer_key_dir, "row_index.npy"), mmap_mode="r"),
+        meta=meta,
+        target_offsets=target_offsets,
+        vocab=vocab,
+        weight=weight,
+        segment=segment,
+        segment_split=np.load(os.path.join(answer_key_dir, "segment_split.npy")),
+        segment_weight=np.load(os.path.join(answer_key_dir, "segment_weight.npy")),
+    )
+
+
+def load_answer_key(competition):
+    """変換済みの正解データをメモリマップで読み込む。古い場合は変換し直す"""
+    if not is_answer_key_fresh(competition):
+        with _compile_lock:
+            # 待っている間に別のスレッドが変換していれば、変換し直さない
+            if not is_answer_key_fresh(competition):
+                compile_answer_key(competition)
+    answer_key_dir = get_answer_key_dir(competition)
+    meta_mtime_ns = os.stat(os.path.join(answer_key_dir, "meta.json")).st_mtime_ns
+    return _load_compiled_answer_key(answer_key_dir, meta_mtime_ns)
+
+
+def get_submission_order(submit_df, answer_key):
+    """提出の行を正解データのids順に並べ替えるインデックスを返す"""
+    id_column = answer_key.meta["id_column"]
+    if len(submit_df) != len(answer_key):
+        raise ValueError(
+            f"提出ファイルの行数({len(submit_df)})が正解データの行数({len(answer_key)})と一致しません。"
+        )
+
+    if answer_key.meta["has_id_column"] and id_column in submit_df.columns:
+        submit_ids = submit_df[id_column].to_numpy()
+        order = np.argsort(submit_ids, kind="stable")
+        if not np.array_equal(submit_ids[order], answer_key.ids):
+            raise ValueError(f"提出ファイルの{id_column}が正解データと一致しません。")
+        return order
+
+    # id列がない提出はtest.csvと同じ行順とみなす
+    return answer_key.row_index
+
+
+def align_predictions(submit_df, answer_key, answer_column, order=None):
+    """提出の予測値を正解データのids順に並べ替える
+
+    数値の予測は1次元の配列、項目のリストはItemLists、クラスごとの確率は
+    (行数 x クラス数) の配列で返す。order (並べ替えのインデックス) を省略すると
+    get_submission_order で求める。
+    """
+    answer_format = answer_key.meta["answer_format"]
+    if answer_format == "class":
+        columns = answer_key.meta["class_columns"]
+        missing = [column for column in columns if column not in submit_df.columns]
+        if missing:
+            raise ValueError(f"提出ファイルに列 {', '.join(missing)} がありません。")
+        predictions = submit_df[columns].to_numpy(dtype=np.float64)
+    else:
+        predictions = submit_df[answer_column].to_numpy()
+    if order is None:
+        order = get_submission_order(submit_df, answer_key)
+
+    if answer_format == "list":
+        return encode_prediction_lists(predictions, answer_key.vocab).take(order)
+    return predictions[order]
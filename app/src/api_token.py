@@ -0,0 +1,74 @@
+"""HTTP API(app/api/server.py)用のアクセストークン
+
+トークンはコンペティションをまたいで使えるように、コンペティションごとのDBではなく
+共通のDBの置き場所 (get_shared_database_dir) の api_tokens.db に保存する。
+平文は発行時に一度だけ返し、DBにはSHA-256のみを残す。
+"""
+
+import hashlib
+import os
+import secrets
+import sqlite3
+from datetime import datetime
+
+from app.src.competition import get_shared_database_dir
+from app.src.database import TIMESTAMP_FORMAT
+
+API_TOKEN_DB_FILENAME = "api_tokens.db"
+
+
+def get_api_token_db_path():
+    return os.path.join(get_shared_database_dir(), API_TOKEN_DB_FILENAME)
+
+
+def _connect():
+    db_path = get_api_token_db_path()
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE IF NOT EXISTS api_tokens
+                    (token_hash TEXT PRIMARY KEY,
+                     username TEXT NOT NULL,
+                     created_at TEXT)""")
+    return conn
+
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_api_token(username):
+    """新しいトークンを発行して平文を返す。既存のトークンは無効になる"""
+    token = secrets.token_urlsafe(32)
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM api_tokens WHERE username = ?", (username,))
+        conn.execute(
+            "INSERT INTO api_tokens (token_hash, username, created_at)"
+            " VALUES (?, ?, ?)",
+            (
+                _hash_token(token),
+                username,
+                datetime.now().strftime(TIMESTAMP_FORMAT),
+            ),
+        )
+    conn.close()
+    return token
+
+
+def get_username_for_token(token):
+    """トークンに対応するユーザー名を返す。無効なトークンならNone"""
+    if not token:
+        return None
+    conn = _connect()
+    row = conn.execute(
+        "SELECT username FROM api_tokens WHERE token_hash = ?", (_hash_token(token),)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def revoke_api_tokens(username):
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM api_tokens WHERE username = ?", (username,))
+    conn.close()
@@ -0,0 +1,310 @@
+"""提出データベースのオンラインバックアップと復元
+
+SQLiteのオンラインバックアップAPI (sqlite3.Connection.backup) で、数百ページずつ
+コピーしては短く休むことを繰り返す。各ステップで読み取りロックを持つのは一瞬だけなので、
+提出の登録などの書き込みはほとんど待たされない。コピー中に書き込みがあるとSQLiteが
+最初からコピーし直すため、やり直しが続く場合は1ステップでまとめてコピーする。
+
+final_submissions.db の行は submissions.db の提出を参照し、提出は削除されないため、
+final_submissions.db → submissions.db の順にコピーすれば、2つのバックアップの間で
+参照先の提出が欠けることはない。
+
+<backup_root>/<competition_id>/<YYYYmmdd_HHMMSS>/
+    submissions.db.gz
+    final_submissions.db.gz
+    manifest.json  (各ファイルのsha256、サイズ、テーブルごとの行数)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.src.competition import get_current_competition
+from app.src.database import TIMESTAMP_FORMAT
+from app.src.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+BACKUP_ROOT = "./backups"
+# 1ステップでコピーするページ数と、ステップ間の待ち時間(秒)
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP_SEC = 0.005
+# 書き込みによるやり直しがこの回数を超えたら1ステップでコピーする
+MAX_BACKUP_RESTARTS = 5
+# 保持するバックアップ: 新しいものからBACKUP_KEEP_LAST個と、
+# 過去BACKUP_KEEP_DAYS日の各日の最新
+BACKUP_KEEP_LAST = 24
+BACKUP_KEEP_DAYS = 7
+MANIFEST_FILENAME = "manifest.json"
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _database_paths(competition):
+    # 参照する側(最終提出)を先にコピーする
+    return {
+        "final_submissions.db": competition.final_submission_db_path,
+        "submissions.db": competition.submission_db_path,
+    }
+
+
+def _online_backup(source_path, target_path):
+    """source_pathをtarget_pathに少しずつコピーし、やり直した回数を返す"""
+    restarts = 0
+    previous_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, previous_remaining
+        # 書き込みでコピーがやり直されると残りページ数が増える
+        if previous_remaining is not None and remaining > previous_remaining:
+            restarts += 1
+            if restarts > MAX_BACKUP_RESTARTS:
+                raise _TooManyRestarts()
+        previous_remaining = remaining
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(
+                target,
+                pages=BACKUP_PAGES_PER_STEP,
+                progress=progress,
+                sleep=BACKUP_STEP_SLEEP_SEC,
+            )
+        except _TooManyRestarts:
+            logger.warning(
+                f"Backup of {source_path} restarted {restarts} times; "
+                "copying in one step"
+            )
+            source.backup(target, pages=-1)
+    finally:
+        target.close()
+        source.close()
+    return restarts
+
+
+def snapshot_databases(target_dir, competition=None):
+    """提出データベースをtarget_dirにコピーし、{ファイル名: やり直した回数} を返す
+
+    エクスポートのように長く読み続ける処理は、元のデータベースではなくこのコピーを読めば、
+    読み取りロックで提出の登録を待たせない。存在しないデータベースはコピーしない。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    restarts = {}
+    for name, source_path in _database_paths(competition).items():
+        if os.path.exists(source_path):
+            restarts[name] = _online_backup(source_path, os.path.join(target_dir, name))
+    return restarts
+
+
+def _inspect_database(path):
+    """(integrity_checkの結果, テーブルごとの行数) を返す"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        tables = [
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            )
+        ]
+        row_counts = {
+            table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            for table in tables
+        }
+    finally:
+        conn.close()
+    return integrity, row_counts
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_backup(backup_root=BACKUP_ROOT, competition=None):
+    """現在のデータベースのバックアップを作成し、バックアップのディレクトリを返す"""
+    if competition is None:
+        competition = get_current_competition()
+    started = time.perf_counter()
+    created_at = datetime.now()
+    backup_dir = os.path.join(
+        backup_root, competition.competition_id, created_at.strftime(TIMESTAMP_FORMAT)
+    )
+    # 同じ秒に作成したバックアップがあれば連番を付ける
+    n = 1
+    while os.path.exists(backup_dir):
+        backup_dir = os.path.join(
+            backup_root,
+            competition.competition_id,
+            f"{created_at.strftime(TIMESTAMP_FORMAT)}_{n}",
+        )
+        n += 1
+    os.makedirs(os.path.dirname(backup_dir), exist_ok=True)
+    # 完成するまでは一時ディレクトリに書き、最後に名前を変える
+    work_dir = tempfile.mkdtemp(prefix=".backup_", dir=os.path.dirname(backup_dir))
+    manifest = {
+        "competition_id": competition.competition_id,
+        "created_at": created_at.strftime(TIMESTAMP_FORMAT),
+        "databases": {},
+    }
+    try:
+        for name, restarts in snapshot_databases(work_dir, competition).items():
+            copy_path = os.path.join(work_dir, name)
+            integrity, row_counts = _inspect_database(copy_path)
+            if integrity != "ok":
+                raise RuntimeError(f"Integrity check failed for {name}: {integrity}")
+
+            with (
+                open(copy_path, "rb") as src,
+                gzip.open(f"{copy_path}.gz", "wb") as dst,
+            ):
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            manifest["databases"][name] = {
+                "file": f"{name}.gz",
+                "sha256": _sha256(copy_path),
+                "size": os.path.getsize(copy_path),
+                "row_counts": row_counts,
+                "restarts": restarts,
+            }
+            os.remove(copy_path)
+
+        manifest["elapsed_sec"] = round(time.perf_counter() - started, 3)
+        with open(os.path.join(work_dir, MANIFEST_FILENAME), "w") as file:
+            json.dump(manifest, file, indent=2, ensure_ascii=False)
+        os.replace(work_dir, backup_dir)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    logger.info(f"Created backup {backup_dir} ({manifest['elapsed_sec']}s)")
+    return backup_dir
+
+
+def list_backups(backup_root=BACKUP_ROOT, competition=None):
+    """完成しているバックアップのディレクトリを新しい順に返す"""
+    if competition is None:
+        competition = get_current_competition()
+    competition_dir = os.path.join(backup_root, competition.competition_id)
+    if not os.path.isdir(competition_dir):
+        return []
+    return [
+        os.path.join(competition_dir, name)
+        for name in sorted(os.listdir(competition_dir), reverse=True)
+        if not name.startswith(".")
+        and os.path.exists(os.path.join(competition_dir, name, MANIFEST_FILENAME))
+    ]
+
+
+def apply_retention(
+    backup_root=BACKUP_ROOT,
+    keep_last=BACKUP_KEEP_LAST,
+    keep_days=BACKUP_KEEP_DAYS,
+    competition=None,
+):
+    """保持ポリシーに含まれないバックアップを削除し、削除したディレクトリを返す"""
+    backups = list_backups(backup_root, competition)
+    keep = set(backups[:keep_last])
+    oldest_day = (datetime.now() - timedelta(days=keep_days)).date()
+    kept_days = set()
+    for backup_dir in backups:
+        # ディレクトリ名は作成日時 (同じ秒のものは後ろに連番)
+        name = os.path.basename(backup_dir)
+        created_at = datetime.strptime(name[: len("YYYYmmdd_HHMMSS")], TIMESTAMP_FORMAT)
+        day = created_at.date()
+        if day > oldest_day and day not in kept_days:
+            kept_days.add(day)
+            keep.add(backup_dir)
+
+    removed = [backup_dir for backup_dir in backups if backup_dir not in keep]
+    for backup_dir in removed:
+        shutil.rmtree(backup_dir)
+    return removed
+
+
+def _load_manifest(backup_dir):
+    with open(os.path.join(backup_dir, MANIFEST_FILENAME)) as file:
+        return json.load(file)
+
+
+def _extract_verified(backup_dir, name, info, work_dir):
+    """バックアップを展開し、sha256と整合性を確認して展開先のパスを返す"""
+    path = os.path.join(work_dir, name)
+    with (
+        gzip.open(os.path.join(backup_dir, info["file"]), "rb") as src,
+        open(path, "wb") as dst,
+    ):
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    if _sha256(path) != info["sha256"]:
+        raise ValueError(f"{name}: checksum mismatch")
+    integrity, row_counts = _inspect_database(path)
+    if integrity != "ok":
+        raise ValueError(f"{name}: integrity check failed ({integrity})")
+    if row_counts != info["row_counts"]:
+        raise ValueError(f"{name}: row counts do not match the manifest")
+    return path
+
+
+def verify_backup(backup_dir):
+    """バックアップを一時ディレクトリに展開して検証する。問題があればValueError"""
+    manifest = _load_manifest(backup_dir)
+    with tempfile.TemporaryDirectory(prefix="minikaggle_verify_") as work_dir:
+        for name, info in manifest["databases"].items():
+            _extract_verified(backup_dir, name, info, work_dir)
+    return manifest
+
+
+def restore_backup(backup_dir, competition=None):
+    """検証したバックアップで現在のデータベースを置き換える
+
+    置き換えもバックアップAPIで書き込むため、アプリが動いていてもロックを取って整合性を保つ。
+    復元後に行数が一致することを確認する。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    manifest = _load_manifest(backup_dir)
+    if manifest["competition_id"] != competition.competition_id:
+        raise ValueError(
+            f"Backup is for competition {manifest['competition_id']}, "
+            f"not {competition.competition_id}"
+        )
+    database_paths = _database_paths(competition)
+
+    with tempfile.TemporaryDirectory(prefix="minikaggle_restore_") as work_dir:
+        # 全ファイルを検証してから書き込む
+        extracted = {
+            name: _extract_verified(backup_dir, name, info, work_dir)
+            for name, info in manifest["databases"].items()
+        }
+        for name, path in extracted.items():
+            target_path = database_paths[name]
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            source = sqlite3.connect(path)
+            target = sqlite3.connect(target_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+
+            integrity, row_counts = _inspect_database(target_path)
+            if (
+                integrity != "ok"
+                or row_counts != manifest["databases"][name]["row_counts"]
+            ):
+                raise RuntimeError(f"Restored {name} does not match the backup")
+            logger.info(f"Restored {target_path} from {backup_dir}")
+    return manifest
@@ -0,0 +1,479 @@
+"""コードコンペティションの提出の実行
+
+competition_setting.yaml で submission_type: "code" としたコンペティションでは、参加者は
+推論用のスクリプト(.py)かノートブック(.ipynb)を提出する。提出はキューに入れ、
+ワーカースレッドが1件ずつ隔離したサブプロセス(app/src/sandbox_launcher.py)で実行する。
+
+- 作業ディレクトリの input/ に正解を含まないテストデータ(test_features.csv)を置き、
+  スクリプトは作業ディレクトリに submission.csv を書き出す
+- CPU時間・メモリ・実行時間の上限を超えた場合や、
+  ネットワークを使おうとした場合は失敗になる
+- 出力はCSVの提出と同じ score_and_register_submission で採点・登録する
+
+ワーカーはサブプロセスの終了を待つだけなので、Streamlitのプロセス内のスレッドで足りる。
+同時に実行する数(max_workers)と待ち行列の長さ(max_queue_size)を上限とし、
+それを超える提出は受け付けない。実行の状態は code_executions テーブルに記録する。
+"""
+
+import importlib
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app.src.competition import (
+    get_competitions,
+    get_current_competition,
+    use_competition,
+)
+from app.src.database import (
+    SUBMISSION_INSERTED,
+    SUBMISSION_LIMIT_REACHED,
+    TIMESTAMP_FORMAT,
+)
+from app.src.lazy_import import lazy_import
+from app.src.logger_config import get_logger
+from app.src.sandbox_launcher import SETUP_FAILED_EXIT_CODE
+from app.src.submission import (
+    create_user_directory,
+    get_submission_file_path,
+    score_and_register_submission,
+)
+from app.src.submission_validation import SubmissionValidationError
+
+nbformat = lazy_import("nbformat")
+
+logger = get_logger(__name__)
+
+CODE_EXTENSIONS = ["py", "ipynb"]
+SCRIPT_FILENAME = "main.py"
+INPUT_DIRNAME = "input"
+OUTPUT_FILENAME = "submission.csv"
+TEST_FEATURES_FILENAME = "test_features.csv"
+LAUNCHER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sandbox_launcher.py"
+)
+# 作業ディレクトリの親。実行中の提出からは空のtmpfsで隠す
+SANDBOX_ROOT = os.path.join(tempfile.gettempdir(), "minikaggle_sandbox")
+# 実行中の提出から見た作業ディレクトリのパス
+SANDBOX_MOUNT_POINT = os.path.join(SANDBOX_ROOT, "work")
+SANDBOX_JOBS_ROOT = os.path.join(SANDBOX_ROOT, "jobs")
+# 実行中の提出から隠すパス (各コンペティションのDB・test.csv・提出ファイルも隠す)
+HIDDEN_PATHS = [
+    "./database",
+    "./competition",
+    "./competitions",
+    "./temp_files",
+    "./backups",
+    "./logs",
+    "./authenticator_config.yaml",
+    "./.env",
+]
+# 失敗時に表示する出力の末尾の文字数
+LOG_TAIL_CHARS = 4000
+
+DEFAULT_EXECUTION_SETTINGS = {
+    "test_features_path": None,
+    "cpu_time_limit": 600,
+    "memory_limit_mb": 4096,
+    "wall_time_limit": 900,
+    "max_output_mb": 1024,
+    "max_workers": 2,
+    "max_queue_size": 20,
+}
+
+# code_executions.status
+EXECUTION_QUEUED = "queued"
+EXECUTION_RUNNING = "running"
+EXECUTION_SUCCEEDED = "succeeded"
+EXECUTION_FAILED = "failed"
+ACTIVE_EXECUTION_STATUSES = (EXECUTION_QUEUED, EXECUTION_RUNNING)
+
+_executors = {}
+_pending_counts = {}
+_executor_lock = threading.Lock()
+
+
+class CodeExecutionError(Exception):
+    pass
+
+
+def is_code_competition(competition=None):
+    if competition is None:
+        competition = get_current_competition()
+    return competition.config["competition"].get("submission_type", "csv") == "code"
+
+
+def get_execution_settings(competition=None):
+    """code_execution の設定をデフォルト値で補って返す"""
+    if competition is None:
+        competition = get_current_competition()
+    settings = competition.config["competition"].get("code_execution") or {}
+    return {**DEFAULT_EXECUTION_SETTINGS, **settings}
+
+
+def get_test_features_path(competition=None):
+    if competition is None:
+        competition = get_current_competition()
+    return get_execution_settings(competition)["test_features_path"] or os.path.join(
+        os.path.dirname(competition.test_csv_path), TEST_FEATURES_FILENAME
+    )
+
+
+def get_hidden_paths():
+    paths = set(HIDDEN_PATHS)
+    for competition in get_competitions().values():
+        paths.update(
+            [
+                os.path.dirname(competition.test_csv_path),
+                competition.database_dir,
+                competition.submissions_dir,
+            ]
+        )
+    return sorted(os.path.abspath(path) for path in paths if os.path.exists(path))
+
+
+def notebook_to_script(notebook_path):
+    """ノートブックのコードセルをつなげたスクリプトを返す
+
+    IPythonのマジック(%)とシェルコマンド(!)の行は実行できないためコメントにする。
+    """
+    with open(notebook_path, "r", encoding="utf-8") as f:
+        notebook = nbformat.read(f, as_version=4)
+    cells = []
+    for cell in notebook.cells:
+        if cell.cell_type != "code":
+            continue
+        lines = [
+            f"# {line}" if line.lstrip().startswith(("%", "!")) else line
+            for line in cell.source.splitlines()
+        ]
+        cells.append("\n".join(lines))
+    return "\n\n".join(cells) + "\n"
+
+
+def prepare_workdir(code_path, competition):
+    """作業ディレクトリにスクリプトとテストデータを置き、そのパスを返す"""
+    test_features_path = get_test_features_path(competition)
+    if not os.path.exists(test_features_path):
+        raise CodeExecutionError(f"テストデータ {test_features_path} がありません。")
+
+    os.makedirs(SANDBOX_JOBS_ROOT, exist_ok=True)
+    os.makedirs(SANDBOX_MOUNT_POINT, exist_ok=True)
+    workdir = tempfile.mkdtemp(dir=SANDBOX_JOBS_ROOT)
+    script_path = os.path.join(workdir, SCRIPT_FILENAME)
+    if code_path.endswith(".ipynb"):
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(notebook_to_script(code_path))
+    else:
+        shutil.copyfile(code_path, script_path)
+
+    input_dir = os.path.join(workdir, INPUT_DIRNAME)
+    os.makedirs(input_dir)
+    input_path = os.path.join(input_dir, os.path.basename(test_features_path))
+    # 大きなテストデータをコピーしないよう、同じファイルシステムならハードリンクにする
+    try:
+        os.link(test_features_path, input_path)
+    except OSError:
+        shutil.copyfile(test_features_path, input_path)
+    return workdir
+
+
+def run_in_sandbox(workdir, competition):
+    """作業ディレクトリのスクリプトを隔離して実行し、出力のCSVのパスを返す"""
+    settings = get_execution_settings(competition)
+    log_path = os.path.join(workdir, "execution.log")
+    command = [
+        sys.executable,
+        "-I",
+        LAUNCHER_PATH,
+        "--workdir",
+        workdir,
+        "--mount-point",
+        SANDBOX_MOUNT_POINT,
+        "--jobs-root",
+        SANDBOX_JOBS_ROOT,
+        "--cpu-seconds",
+        str(settings["cpu_time_limit"]),
+        "--memory-bytes",
+        str(settings["memory_limit_mb"] * 1024 * 1024),
+        "--file-size-bytes",
+        str(settings["max_output_mb"] * 1024 * 1024),
+        *[f"--hide={path}" for path in get_hidden_paths()],
+        SCRIPT_FILENAME,
+    ]
+    env = {
+        "PATH": os.environ.get("PATH", ""),
+        "HOME": SANDBOX_MOUNT_POINT,
+        "LANG": "C.UTF-8",
+        "MINIKAGGLE_INPUT_DIR": os.path.join(SANDBOX_MOUNT_POINT, INPUT_DIRNAME),
+        "MINIKAGGLE_OUTPUT_PATH": os.path.join(SANDBOX_MOUNT_POINT, OUTPUT_FILENAME),
+    }
+    with open(log_path, "wb") as log_file:
+        # 子プロセスもまとめて止められるよう、新しいプロセスグループで起動する
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            env=env,
+            start_new_session=True,
+        )
+        try:
+            returncode = process.wait(timeout=settings["wall_time_limit"])
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            raise CodeExecutionError(
+                f"実行時間の上限({settings['wall_time_limit']}秒)を超えました。\n"
+                + read_log_tail(log_path)
+            )
+        finally:
+            # スクリプトが残した子プロセスも止める
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    if returncode == SETUP_FAILED_EXIT_CODE:
+        raise CodeExecutionError(
+            "実行環境を隔離できなかったため実行しませんでした。管理者に連絡してください。\n"
+            + read_log_tail(log_path)
+        )
+    if returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+        raise CodeExecutionError(
+            f"CPU時間の上限({settings['cpu_time_limit']}秒)を超えたため停止しました。\n"
+            + read_log_tail(log_path)
+        )
+    if returncode != 0:
+        raise CodeExecutionError(
+            f"スクリプトが終了コード{returncode}で終了しました。\n"
+            + read_log_tail(log_path)
+        )
+    output_path = os.path.join(workdir, OUTPUT_FILENAME)
+    if not os.path.exists(output_path):
+        raise CodeExecutionError(
+            f"スクリプトが{OUTPUT_FILENAME}を出力しませんでした。\n"
+            + read_log_tail(log_path)
+        )
+    return output_path
+
+
+def read_log_tail(log_path):
+    if not os.path.exists(log_path):
+        return ""
+    with open(log_path, "rb") as f:
+        f.seek(max(0, os.path.getsize(log_path) - LOG_TAIL_CHARS))
+        return f.read().decode("utf-8", errors="replace")
+
+
+def save_submitted_code(file, user_id, filename, timestamp, competition=None):
+    """提出されたスクリプト・ノートブックを保存する"""
+    code_dir = os.path.join(create_user_directory(user_id, competition), "code")
+    os.makedirs(code_dir, exist_ok=True)
+    n = 0
+    while True:
+        suffix = f"_{n}" if n else ""
+        code_path = os.path.join(
+            code_dir, f"TIMESTAMP_{timestamp}{suffix}_FILENAME_{filename}"
+        )
+        if not os.path.exists(code_path):
+            break
+        n += 1
+    with open(code_path, "wb") as f:
+        f.write(file.getvalue())
+    return code_path
+
+
+def create_code_execution(user_id, filename, code_path, timestamp):
+    conn = sqlite3.connect(get_current_competition().submission_db_path)
+    with conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO code_executions
+                (user_id, filename, code_path, status, submitted_at)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            (user_id, filename, code_path, EXECUTION_QUEUED, timestamp),
+        )
+    conn.close()
+    return cursor.lastrowid
+
+
+def update_code_execution(execution_id, status, message=None, public_score=None):
+    finished_at = (
+        None
+        if status in ACTIVE_EXECUTION_STATUSES
+        else datetime.now().strftime(TIMESTAMP_FORMAT)
+    )
+    conn = sqlite3.connect(get_current_competition().submission_db_path)
+    with conn:
+        conn.execute(
+            """
+            UPDATE code_executions
+            SET status = ?, message = ?, public_score = ?, finished_at = ?
+            WHERE execution_id = ?
+        """,
+            (status, message, public_score, finished_at, execution_id),
+        )
+    conn.close()
+
+
+def get_user_code_executions(user_id, limit=10):
+    """ユーザーの最近の実行を新しい順に返す"""
+    conn = sqlite3.connect(get_current_competition().submission_db_path)
+    rows = conn.execute(
+        """
+        SELECT execution_id, filename, status, message, public_score,
+               submitted_at, finished_at
+        FROM code_executions
+        WHERE user_id = ?
+        ORDER BY execution_id DESC
+        LIMIT ?
+    """,
+        (user_id, limit),
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def fail_interrupted_executions():
+    """プロセスの再起動で実行されなくなった提出を失敗にする"""
+    conn = sqlite3.connect(get_current_competition().submission_db_path)
+    with conn:
+        conn.execute(
+            f"""
+            UPDATE code_executions SET status = ?, message = ?, finished_at = ?
+            WHERE status IN ({", ".join("?" * len(ACTIVE_EXECUTION_STATUSES))})
+        """,
+            (
+                EXECUTION_FAILED,
+                "サーバーの再起動により中断されました。もう一度提出してください。",
+                datetime.now().strftime(TIMESTAMP_FORMAT),
+                *ACTIVE_EXECUTION_STATUSES,
+            ),
+        )
+    conn.close()
+
+
+def execute_submission(execution_id, user_id, code_path, filename, timestamp):
+    """キューから取り出した提出を実行・採点する (ワーカースレッドで実行)"""
+    update_code_execution(execution_id, EXECUTION_RUNNING)
+    competition = get_current_competition()
+    workdir = None
+    try:
+        workdir = prepare_workdir(code_path, competition)
+        output_path = run_in_sandbox(workdir, competition)
+        result = score_and_register_submission(
+            user_id, output_path, filename, timestamp, competition
+        )
+        if result.status != SUBMISSION_INSERTED:
+            message = (
+                "提出回数の上限に達したため登録されませんでした。"
+                if result.status == SUBMISSION_LIMIT_REACHED
+                else "本日の提出回数の上限に達したため登録されませんでした。"
+            )
+            update_code_execution(execution_id, EXECUTION_FAILED, message)
+            return
+        shutil.copyfile(
+            output_path,
+            get_submission_file_path(user_id, filename, timestamp, competition),
+        )
+        update_code_execution(
+            execution_id, EXECUTION_SUCCEEDED, public_score=result.public_score
+        )
+    except SubmissionValidationError as e:
+        # 出力ファイルの形式の誤りは、問題のある行も含めて表示する
+        update_code_execution(execution_id, EXECUTION_FAILED, e.report())
+    except (CodeExecutionError, ValueError) as e:
+        update_code_execution(execution_id, EXECUTION_FAILED, str(e))
+    except Exception:
+        logger.exception(f"Code execution {execution_id} failed")
+        update_code_execution(
+            execution_id, EXECUTION_FAILED, "実行中にエラーが発生しました。"
+        )
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_queued_execution(competition_id, *args):
+    try:
+        with use_competition(competition_id):
+            execute_submission(*args)
+    finally:
+        with _executor_lock:
+            _pending_counts[competition_id] -= 1
+
+
+def _get_executor(competition):
+    # 呼び出し元で _executor_lock を取得していること
+    competition_id = competition.competition_id
+    if competition_id not in _executors:
+        # ワーカースレッドを起動する前に、採点で使う重いモジュールを読み込んでおく
+        importlib.import_module("numpy")
+        importlib.import_module("pandas")
+        fail_interrupted_executions()
+        _executors[competition_id] = ThreadPoolExecutor(
+            max_workers=get_execution_settings(competition)["max_workers"],
+            thread_name_prefix=f"code-execution-{competition_id}",
+        )
+        _pending_counts[competition_id] = 0
+    return _executors[competition_id]
+
+
+def has_active_execution(user_id):
+    conn = sqlite3.connect(get_current_competition().submission_db_path)
+    placeholders = ", ".join("?" * len(ACTIVE_EXECUTION_STATUSES))
+    row = conn.execute(
+        f"""
+        SELECT 1 FROM code_executions
+        WHERE user_id = ? AND status IN ({placeholders})
+        LIMIT 1
+    """,
+        (user_id, *ACTIVE_EXECUTION_STATUSES),
+    ).fetchone()
+    conn.close()
+    return row is not None
+
+
+def submit_code_execution(user_id, code_path, filename, timestamp):
+    """提出を実行キューに入れ、execution_idを返す
+
+    ユーザーの実行待ちの提出がある場合や、キューが一杯の場合はCodeExecutionError。
+    """
+    competition = get_current_competition()
+    settings = get_execution_settings(competition)
+    with _executor_lock:
+        executor = _get_executor(competition)
+        if has_active_execution(user_id):
+            raise CodeExecutionError(
+                "実行待ちまたは実行中の提出があります。終わってから提出してください。"
+            )
+        competition_id = competition.competition_id
+        if (
+            _pending_counts[competition_id]
+            >= settings["max_workers"] + settings["max_queue_size"]
+        ):
+            raise CodeExecutionError(
+                "実行待ちの提出が多いため受け付けられませんでした。しばらくしてから提出してください。"
+            )
+        execution_id = create_code_execution(user_id, filename, code_path, timestamp)
+        _pending_counts[competition_id] += 1
+        executor.submit(
+            _run_queued_execution,
+            competition_id,
+            execution_id,
+            user_id,
+            code_path,
+            filename,
+            timestamp,
+        )
+    logger.info(f"Queued code execution {execution_id} ({filename})")
+    return execution_id
@@ -0,0 +1,165 @@
+"""コンペティションのレジストリ
+
+1つのプロセスで複数のコンペティションを扱えるように、
+DB・test.csv・設定ファイル・アップロード先をコンペティションごとにまとめる。
+
+- "default": 従来のレイアウト
+  (competition_setting.yaml, ./competition/test.csv, ./database)
+- ./competitions/<competition_id>/ : competition_setting.yaml と test.csv を
+  置くと登録される (database/ と uploaded_submissions/ は自動で作成される)
+
+現在のコンペティションは use_competition() のコンテキスト、セッション状態の
+competition_id、環境変数 MINIKAGGLE_COMPETITION、"default" の順に決まる。
+"""
+
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+from streamlit import session_state as ss
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+DEFAULT_COMPETITION_ID = "default"
+DEFAULT_SETTING_PATH = "competition_setting.yaml"
+COMPETITIONS_DIR = "./competitions"
+SETTING_FILENAME = "competition_setting.yaml"
+
+_competition_override = ContextVar("competition_override", default=None)
+
+
+@lru_cache(maxsize=64)
+def _load_setting(setting_path, mtime):
+    # mtimeをキーに含めることで、設定ファイルが更新されたら読み直す
+    with open(setting_path, "r") as file:
+        return yaml.safe_load(file)
+
+
+@dataclass(frozen=True)
+class Competition:
+    competition_id: str
+    setting_path: str
+    test_csv_path: str
+    database_dir: str
+    submissions_dir: str
+
+    @property
+    def submission_db_path(self):
+        return os.path.join(self.database_dir, "submissions.db")
+
+    @property
+    def final_submission_db_path(self):
+        return os.path.join(self.database_dir, "final_submissions.db")
+
+    @property
+    def prediction_cache_dir(self):
+        return os.path.join(self.database_dir, "predictions")
+
+    @property
+    def config(self):
+        return _load_setting(self.setting_path, os.path.getmtime(self.setting_path))
+
+    @property
+    def name(self):
+        return self.config["competition"].get("name", self.competition_id)
+
+
+def _default_competition():
+    database_dir = "./database"
+    if os.path.exists(DEFAULT_SETTING_PATH):
+        setting = _load_setting(
+            DEFAULT_SETTING_PATH, os.path.getmtime(DEFAULT_SETTING_PATH)
+        )
+        database_dir = (setting or {}).get("database_dir", database_dir)
+    return Competition(
+        competition_id=DEFAULT_COMPETITION_ID,
+        setting_path=DEFAULT_SETTING_PATH,
+        test_csv_path="./competition/test.csv",
+        database_dir=database_dir,
+        submissions_dir="./temp_files/uploaded_submissions",
+    )
+
+
+def get_shared_database_dir():
+    """コンペティションをまたいで使うDBの置き場所
+
+    defaultのコンペティションと同じく、competition_setting.yaml の database_dir に従う。
+    """
+    return _default_competition().database_dir
+
+
+def get_competitions():
+    """登録されているコンペティションを {competition_id: Competition} で返す"""
+    competitions = {}
+    if os.path.exists(DEFAULT_SETTING_PATH):
+        competitions[DEFAULT_COMPETITION_ID] = _default_competition()
+
+    competitions_dir = Path(COMPETITIONS_DIR)
+    if competitions_dir.is_dir():
+        for competition_dir in sorted(competitions_dir.iterdir()):
+            if not (competition_dir / SETTING_FILENAME).exists():
+                continue
+            competitions[competition_dir.name] = _directory_competition(competition_dir)
+    return competitions
+
+
+def _directory_competition(competition_dir):
+    return Competition(
+        competition_id=competition_dir.name,
+        setting_path=str(competition_dir / SETTING_FILENAME),
+        test_csv_path=str(competition_dir / "test.csv"),
+        database_dir=str(competition_dir / "database"),
+        submissions_dir=str(competition_dir / "uploaded_submissions"),
+    )
+
+
+def get_current_competition_id():
+    competition_id = _competition_override.get()
+    if competition_id:
+        return competition_id
+    # APIサーバーやワーカースレッドなど、Streamlitのスクリプト実行外では
+    # セッション状態を見ない
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        competition_id = ss.get("competition_id")
+    return (
+        competition_id
+        or os.environ.get("MINIKAGGLE_COMPETITION")
+        or DEFAULT_COMPETITION_ID
+    )
+
+
+def get_competition(competition_id):
+    # 全てのディレクトリを列挙せず、指定されたコンペティションだけを確認する
+    competition_dir = Path(COMPETITIONS_DIR) / competition_id
+    if (
+        competition_id not in ("", ".", "..")
+        and competition_dir.name == competition_id
+        and (competition_dir / SETTING_FILENAME).exists()
+    ):
+        return _directory_competition(competition_dir)
+    if competition_id == DEFAULT_COMPETITION_ID and os.path.exists(
+        DEFAULT_SETTING_PATH
+    ):
+        return _default_competition()
+    raise KeyError(f"Unknown competition: {competition_id}")
+
+
+def get_current_competition():
+    competition_id = get_current_competition_id()
+    if competition_id == DEFAULT_COMPETITION_ID:
+        # defaultは設定ファイルがなくてもパスを返せるようにする
+        return _default_competition()
+    return get_competition(competition_id)
+
+
+@contextmanager
+def use_competition(competition_id):
+    """ツールやワーカースレッドから特定のコンペティションを対象に処理するためのコンテキスト"""
+    token = _competition_override.set(competition_id)
+    try:
+        yield get_current_competition()
+    finally:
+        _competition_override.reset(token)
@@ -1,27 +1,68 @@
-import logging
 import os
 import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
 
-import pandas as pd
 from dotenv import load_dotenv
 
+from app.src.competition import get_current_competition
+from app.src.lazy_import import lazy_import
 from app.src.logger_config import get_logger
 
+pd = lazy_import("pandas")
+
 load_dotenv(".env")
 logger = get_logger(__name__)
 
-FINAL_SUBMISSION_DB_PATH = "./database/final_submissions.db"
-SUBMITTION_DB_PATH = "./database/submissions.db"
 OPTIMIZATION_DIRECTION = os.environ.get("OPTIMIZATION_DIRECTION", "min").lower()
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# insert_submission_within_quota の結果
+SUBMISSION_INSERTED = "inserted"
+SUBMISSION_LIMIT_REACHED = "limit_reached"
+DAILY_SUBMISSION_LIMIT_REACHED = "daily_limit_reached"
+SUBMISSION_ERROR = "error"
+
+# 分析ページ用の集計の単位(秒)
+ROLLUP_BUCKET_SECONDS = 3600
+
+
+@dataclass(frozen=True)
+class SubmissionRecord:
+    """insert_submission_within_quota で登録する提出1件分の値"""
+
+    user_id: int
+    public_score: float
+    private_score: float
+    timestamp: str
+    filename: str
+    # ユーザーの所属チームが決まらない場合に記録するチーム
+    team_id: int | None = None
+    prediction_path: str | None = None
+    # {分割名: スコア}。Noneならpublic/privateのみ登録する
+    split_scores: dict | None = None
+
+
+def get_submission_db_path():
+    """現在のコンペティションの提出データベースのパス"""
+    return get_current_competition().submission_db_path
+
+
+def get_final_submission_db_path():
+    """現在のコンペティションの最終提出データベースのパス"""
+    return get_current_competition().final_submission_db_path
 
 
 def create_tables():
+    os.makedirs(get_current_competition().database_dir, exist_ok=True)
+
     # メイン提出データベースのテーブル作成
-    conn_main = sqlite3.connect(SUBMITTION_DB_PATH)
+    conn_main = sqlite3.connect(get_submission_db_path())
     c_main = conn_main.cursor()
 
     # 最終提出データベースのテーブル作成
-    conn_final = sqlite3.connect(FINAL_SUBMISSION_DB_PATH)
+    conn_final = sqlite3.connect(get_final_submission_db_path())
     c_final = conn_final.cursor()
 
     # Users テーブル (メインデータベースのみ)
@@ -34,12 +75,33 @@ def create_tables():
                      (team_id INTEGER PRIMARY KEY AUTOINCREMENT,
                       team_name TEXT UNIQUE)""")
 
-    # TeamUsers テーブルを追加 (チーム情報とユーザーの関係を管理)
-    c_main.execute("""CREATE TABLE IF NOT EXISTS team_users
-                    (team_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    team_name TEXT UNIQUE,
-                    user_id INTEGER,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id))""")
+    # チームのメンバー (メインデータベースのみ)。ユーザーは1つのチームにだけ所属する
+    c_main.execute("""CREATE TABLE IF NOT EXISTS team_members
+                     (user_id INTEGER PRIMARY KEY,
+                      team_id INTEGER NOT NULL,
+                      joined_at TEXT,
+                      FOREIGN KEY (user_id) REFERENCES users(user_id),
+                      FOREIGN KEY (team_id) REFERENCES teams(team_id))""")
+    c_main.execute("""CREATE INDEX IF NOT EXISTS idx_team_members_team
+                     ON team_members (team_id)""")
+
+    # チームリーダーボード用のチームごとの集計 (メインデータベースのみ)
+    c_main.execute("""CREATE TABLE IF NOT EXISTS team_summaries
+                     (team_id INTEGER PRIMARY KEY,
+                      best_public_score REAL,
+                      submission_count INTEGER NOT NULL DEFAULT 0,
+                      member_count INTEGER NOT NULL DEFAULT 0,
+                      FOREIGN KEY (team_id) REFERENCES teams(team_id))""")
+    c_main.execute("""CREATE INDEX IF NOT EXISTS idx_team_summaries_best
+                     ON team_summaries (best_public_score)""")
+
+    # チームの合流リクエスト (source_team_id のメンバーが target_team_id に合流する)
+    c_main.execute("""CREATE TABLE IF NOT EXISTS team_merge_requests
+                     (source_team_id INTEGER,
+                      target_team_id INTEGER,
+                      requested_by INTEGER,
+                      requested_at TEXT,
+                      PRIMARY KEY (source_team_id, target_team_id))""")
 
     # Submissions テーブル (メインデータベースのみ)
     c_main.execute("""CREATE TABLE IF NOT EXISTS submissions
@@ -51,9 +113,105 @@ def create_tables():
                       private_score REAL,
                       timestamp TEXT,
                       user_submission_id INTEGER,
+                      submitted_at INTEGER,
+                      prediction_path TEXT,
                       FOREIGN KEY (user_id) REFERENCES users(user_id),
                       FOREIGN KEY (team_id) REFERENCES teams(team_id))""")
 
+    # 提出の分割ごとのスコア (メインデータベースのみ)。
+    # public/privateはsubmissionsにも持つ
+    c_main.execute("""CREATE TABLE IF NOT EXISTS submission_scores
+                     (submission_id INTEGER,
+                      split TEXT,
+                      score REAL,
+                      PRIMARY KEY (submission_id, split),
+                      FOREIGN KEY (submission_id)
+                          REFERENCES submissions(submission_id))""")
+    c_main.execute("""CREATE INDEX IF NOT EXISTS idx_submission_scores_split
+                     ON submission_scores (split, score)""")
+
+    # 提出回数の上限チェック用のユーザーごとのカウンター (メインデータベースのみ)
+    c_main.execute("""CREATE TABLE IF NOT EXISTS submission_counters
+                     (user_id INTEGER PRIMARY KEY,
+                      total_count INTEGER NOT NULL DEFAULT 0,
+                      daily_window_start INTEGER,
+                      daily_count INTEGER NOT NULL DEFAULT 0,
+                      best_public_score REAL,
+                      FOREIGN KEY (user_id) REFERENCES users(user_id))""")
+
+    # 重複提出の検出用のLSHシグネチャ (メインデータベースのみ)
+    c_main.execute("""CREATE TABLE IF NOT EXISTS submission_signatures
+                     (submission_id INTEGER PRIMARY KEY,
+                      user_id INTEGER,
+                      signature BLOB,
+                      FOREIGN KEY (submission_id)
+                          REFERENCES submissions(submission_id))""")
+    c_main.execute("""CREATE TABLE IF NOT EXISTS submission_signature_bands
+                     (band INTEGER,
+                      band_hash INTEGER,
+                      submission_id INTEGER,
+                      FOREIGN KEY (submission_id)
+                          REFERENCES submissions(submission_id))""")
+    c_main.execute("""CREATE INDEX IF NOT EXISTS idx_submission_signature_bands
+                     ON submission_signature_bands (band, band_hash)""")
+    c_main.execute("""CREATE TABLE IF NOT EXISTS duplicate_flags
+                     (submission_id INTEGER,
+                      matched_submission_id INTEGER,
+                      hamming_distance INTEGER,
+                      flagged_at TEXT,
+                      PRIMARY KEY (submission_id, matched_submission_id))""")
+
+    # 管理者向け分析ページ用の1時間ごとの集計 (メインデータベースのみ)
+    c_main.execute("""CREATE TABLE IF NOT EXISTS hourly_activity
+                     (hour_start INTEGER PRIMARY KEY,
+                      submission_count INTEGER NOT NULL DEFAULT 0,
+                      active_users INTEGER NOT NULL DEFAULT 0,
+                      best_score REAL)""")
+    c_main.execute("""CREATE TABLE IF NOT EXISTS hourly_active_users
+                     (hour_start INTEGER,
+                      user_id INTEGER,
+                      PRIMARY KEY (hour_start, user_id))""")
+
+    # 提出ファイルの保持・圧縮用 (メインデータベースのみ)
+    c_main.execute("""CREATE TABLE IF NOT EXISTS archived_submission_files
+                     (user_id INTEGER,
+                      file_name TEXT,
+                      archive_name TEXT,
+                      original_size INTEGER,
+                      archived_at TEXT,
+                      PRIMARY KEY (user_id, file_name))""")
+    c_main.execute("""CREATE TABLE IF NOT EXISTS user_storage
+                     (user_id INTEGER PRIMARY KEY,
+                      hot_files INTEGER NOT NULL DEFAULT 0,
+                      hot_bytes INTEGER NOT NULL DEFAULT 0,
+                      archived_files INTEGER NOT NULL DEFAULT 0,
+                      archived_bytes INTEGER NOT NULL DEFAULT 0,
+                      archive_bytes INTEGER NOT NULL DEFAULT 0,
+                      updated_at TEXT)""")
+
+    # コードコンペティションの提出の実行状態 (メインデータベースのみ)
+    c_main.execute("""CREATE TABLE IF NOT EXISTS code_executions
+                     (execution_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER,
+                      filename TEXT,
+                      code_path TEXT,
+                      status TEXT,
+                      message TEXT,
+                      public_score REAL,
+                      submitted_at TEXT,
+                      finished_at TEXT,
+                      FOREIGN KEY (user_id) REFERENCES users(user_id))""")
+    c_main.execute("""CREATE INDEX IF NOT EXISTS idx_code_executions_user
+                     ON code_executions (user_id, status)""")
+
+    migrate_submissions(c_main)
+    team_id_changes = migrate_teams(c_main)
+    migrate_user_directory(c_main)
+    c_main.execute("""CREATE INDEX IF NOT EXISTS idx_submissions_user_submitted_at
+                     ON submissions (user_id, submitted_at)""")
+    c_main.execute("""CREATE INDEX IF NOT EXISTS idx_submissions_prediction_path
+                     ON submissions (prediction_path)""")
+
     # Final Submissions テーブル (最終提出データベースのみ)
     c_final.execute("""CREATE TABLE IF NOT EXISTS final_submissions
                      (submission_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -64,15 +222,378 @@ def create_tables():
                       private_score REAL,
                       timestamp TEXT,
                       user_submission_id INTEGER)""")
+    remap_team_ids(c_final, "final_submissions", team_id_changes)
 
-    conn_main.commit()
+    # 移行をやり直す場合に元のteam_usersが残るよう、最終提出のデータベースを先に確定する
     conn_final.commit()
+    conn_main.commit()
     conn_main.close()
     conn_final.close()
 
 
+def timestamp_to_epoch(timestamp):
+    """%Y%m%d_%H%M%S形式のタイムスタンプをUNIX時間(秒)に変換する"""
+    try:
+        return int(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_daily_window(epoch):
+    """epochを含む日(ローカル時間)の開始と終了のUNIX時間を返す"""
+    day = datetime.fromtimestamp(epoch).date()
+    start = datetime.combine(day, datetime.min.time())
+    return int(start.timestamp()), int((start + timedelta(days=1)).timestamp())
+
+
+def migrate_submissions(cursor):
+    """既存のDBにsubmitted_at列・prediction_path列と提出回数カウンター・1時間ごとの集計を追加する"""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(submissions)")]
+    if "prediction_path" not in columns:
+        # 既存の提出はtool/build_prediction_cache.pyで後から埋める
+        cursor.execute("ALTER TABLE submissions ADD COLUMN prediction_path TEXT")
+    if "submitted_at" not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN submitted_at INTEGER")
+        rows = cursor.execute("SELECT submission_id, timestamp FROM submissions")
+        cursor.executemany(
+            "UPDATE submissions SET submitted_at = ? WHERE submission_id = ?",
+            [
+                (timestamp_to_epoch(timestamp), submission_id)
+                for submission_id, timestamp in rows.fetchall()
+            ],
+        )
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM submission_scores)")
+    if not cursor.fetchone()[0]:
+        # 分割ごとのスコアの導入前の提出は、publicとprivateのスコアだけを持つ
+        for split, column in [("public", "public_score"), ("private", "private_score")]:
+            cursor.execute(
+                f"""
+                INSERT OR IGNORE INTO submission_scores (submission_id, split, score)
+                SELECT submission_id, ?, {column} FROM submissions
+            """,
+                (split,),
+            )
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM hourly_activity)")
+    if not cursor.fetchone()[0]:
+        rebuild_hourly_activity(cursor)
+
+    best_func = "MAX" if get_optimization_direction() == "max" else "MIN"
+    counter_columns = [
+        row[1] for row in cursor.execute("PRAGMA table_info(submission_counters)")
+    ]
+    if "best_public_score" not in counter_columns:
+        cursor.execute(
+            "ALTER TABLE submission_counters ADD COLUMN best_public_score REAL"
+        )
+        cursor.execute(
+            f"""
+            UPDATE submission_counters SET best_public_score = (
+                SELECT {best_func}(public_score) FROM submissions
+                WHERE submissions.user_id = submission_counters.user_id
+            )
+        """
+        )
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM submission_counters)")
+    if not cursor.fetchone()[0]:
+        window_start, window_end = get_daily_window(time.time())
+        cursor.execute(
+            f"""
+            INSERT INTO submission_counters
+                (user_id, total_count, daily_window_start, daily_count,
+                 best_public_score)
+            SELECT user_id, COUNT(*), ?,
+                   SUM(submitted_at >= ? AND submitted_at < ?),
+                   {best_func}(public_score)
+            FROM submissions
+            GROUP BY user_id
+        """,
+            (window_start, window_start, window_end),
+        )
+
+
+def remap_team_ids(cursor, table, team_id_changes):
+    """tableの提出のteam_idを、migrate_teamsで変わったチームのidに付け替える
+
+    付け替え先のidが別のユーザーの移行前のidと重なることがあるため、ユーザーごとに付け替える。
+    """
+    cursor.executemany(
+        f"UPDATE {table} SET team_id = ? WHERE user_id = ? AND team_id = ?",
+        [
+            (new_team_id, user_id, old_team_id)
+            for user_id, old_team_id, new_team_id in team_id_changes
+        ],
+    )
+
+
+def migrate_teams(cursor):
+    """1人1チームのteam_usersをteams・team_membersに移し、チームごとの集計を作る
+
+    移行後のteam_usersは同じ列を持つビューとして残すため、読み出し側はそのまま使える。
+    チームのidが変わったユーザーの提出はsubmissionsも付け替え、
+    (user_id, 移行前のteam_id, 移行後のteam_id) のリストを返す。
+    """
+    team_id_changes = []
+    row = cursor.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'team_users'"
+    ).fetchone()
+    if row is not None and row[0] == "table":
+        rows = cursor.execute(
+            "SELECT team_id, team_name, user_id FROM team_users ORDER BY team_id"
+        ).fetchall()
+        for legacy_team_id, team_name, user_id in rows:
+            existing = cursor.execute(
+                "SELECT team_id FROM teams WHERE team_name = ?", (team_name,)
+            ).fetchone()
+            if existing is None:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO teams (team_id, team_name) VALUES (?, ?)",
+                    (legacy_team_id, team_name),
+                )
+                if not cursor.rowcount:
+                    # team_idが使われていれば新しいidを振る
+                    cursor.execute(
+                        "INSERT INTO teams (team_name) VALUES (?)", (team_name,)
+                    )
+                team_id = cursor.lastrowid
+            else:
+                team_id = existing[0]
+            cursor.execute(
+                "INSERT OR IGNORE INTO team_members (user_id, team_id) VALUES (?, ?)",
+                (user_id, team_id),
+            )
+            if team_id != legacy_team_id:
+                team_id_changes.append((user_id, legacy_team_id, team_id))
+        cursor.execute("DROP TABLE team_users")
+        remap_team_ids(cursor, "submissions", team_id_changes)
+    cursor.execute(
+        """CREATE VIEW IF NOT EXISTS team_users AS
+           SELECT tm.team_id, t.team_name, tm.user_id
+           FROM team_members tm JOIN teams t ON tm.team_id = t.team_id"""
+    )
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM team_summaries)")
+    if not cursor.fetchone()[0]:
+        rebuild_team_summaries(cursor)
+    return team_id_changes
+
+
+# ユーザー一覧の検索用テーブルを、元のテーブルの変更に追従させるトリガー
+USER_DIRECTORY_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS user_directory_ai AFTER INSERT ON user_directory
+    BEGIN
+        INSERT INTO user_directory_fts (rowid, username, email, team_name)
+        VALUES (new.entry_id, new.username, new.email, new.team_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_directory_ad AFTER DELETE ON user_directory
+    BEGIN
+        INSERT INTO user_directory_fts
+            (user_directory_fts, rowid, username, email, team_name)
+        VALUES ('delete', old.entry_id, old.username, old.email, old.team_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_directory_au AFTER UPDATE ON user_directory
+    BEGIN
+        INSERT INTO user_directory_fts
+            (user_directory_fts, rowid, username, email, team_name)
+        VALUES ('delete', old.entry_id, old.username, old.email, old.team_name);
+        INSERT INTO user_directory_fts (rowid, username, email, team_name)
+        VALUES (new.entry_id, new.username, new.email, new.team_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_directory_ai AFTER INSERT ON users
+    BEGIN
+        INSERT OR IGNORE INTO user_directory (username) VALUES (new.username);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS team_members_directory_ai
+    AFTER INSERT ON team_members
+    BEGIN
+        UPDATE user_directory
+        SET team_name = (SELECT team_name FROM teams WHERE team_id = new.team_id)
+        WHERE username = (SELECT username FROM users WHERE user_id = new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS team_members_directory_au
+    AFTER UPDATE OF team_id ON team_members
+    BEGIN
+        UPDATE user_directory
+        SET team_name = (SELECT team_name FROM teams WHERE team_id = new.team_id)
+        WHERE username = (SELECT username FROM users WHERE user_id = new.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS team_members_directory_ad
+    AFTER DELETE ON team_members
+    BEGIN
+        UPDATE user_directory SET team_name = NULL
+        WHERE username = (SELECT username FROM users WHERE user_id = old.user_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS teams_directory_au
+    AFTER UPDATE OF team_name ON teams
+    BEGIN
+        UPDATE user_directory SET team_name = new.team_name
+        WHERE username IN (
+            SELECT u.username FROM team_members tm
+            JOIN users u ON tm.user_id = u.user_id
+            WHERE tm.team_id = new.team_id
+        );
+    END""",
+]
+
+
+def migrate_user_directory(cursor):
+    """ユーザー一覧の検索用テーブルと全文検索インデックス(FTS5)を作る
+
+    user_directoryはトリガーでusers・team_members・teamsの変更に追従し、
+    user_directory_ftsはuser_directoryの変更に追従する。メールアドレスは
+    app/src/user_directory.pyが認証設定ファイルから反映する。
+    """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS user_directory
+                     (entry_id INTEGER PRIMARY KEY,
+                      username TEXT UNIQUE NOT NULL,
+                      email TEXT,
+                      team_name TEXT)""")
+    # 部分一致で検索できるようにtrigramで分割する
+    cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS user_directory_fts
+                     USING fts5(username, email, team_name,
+                                content='user_directory', content_rowid='entry_id',
+                                tokenize='trigram')""")
+    # 反映済みの認証設定ファイルの更新時刻
+    cursor.execute("""CREATE TABLE IF NOT EXISTS user_directory_sources
+                     (source TEXT PRIMARY KEY,
+                      mtime REAL)""")
+
+    for trigger in USER_DIRECTORY_TRIGGERS:
+        cursor.execute(trigger)
+
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM user_directory)")
+    if not cursor.fetchone()[0]:
+        cursor.execute(
+            """
+            INSERT INTO user_directory (username, team_name)
+            SELECT u.username, t.team_name FROM users u
+            LEFT JOIN team_members tm ON u.user_id = tm.user_id
+            LEFT JOIN teams t ON tm.team_id = t.team_id
+            ORDER BY u.user_id
+        """
+        )
+
+
+def rebuild_team_summaries(cursor):
+    """チームごとの集計をメンバーの提出回数カウンターから作り直す"""
+    best_func = "MAX" if get_optimization_direction() == "max" else "MIN"
+    cursor.execute("DELETE FROM team_summaries")
+    cursor.execute(
+        f"""
+        INSERT INTO team_summaries
+            (team_id, best_public_score, submission_count, member_count)
+        SELECT tm.team_id, {best_func}(c.best_public_score),
+               COALESCE(SUM(c.total_count), 0), COUNT(*)
+        FROM team_members tm
+        LEFT JOIN submission_counters c ON tm.user_id = c.user_id
+        GROUP BY tm.team_id
+    """
+    )
+
+
+def get_optimization_direction():
+    """現在のコンペティションの最適化方向 (max or min)"""
+    return get_current_competition().config["competition"]["optimization_direction"]
+
+
+def better_score(optimization_direction, a, b):
+    """2つのスコアのうち良い方を返す。Noneは無視する"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b) if optimization_direction == "max" else min(a, b)
+
+
+def get_hour_start(epoch):
+    return epoch - epoch % ROLLUP_BUCKET_SECONDS
+
+
+def update_hourly_activity(
+    cursor, user_id, public_score, submitted_at, optimization_direction=None
+):
+    """提出1件分を1時間ごとの集計に反映する。提出を登録するトランザクション内で呼ぶ
+
+    best_scoreはその時間までの全提出のベストスコア。
+    """
+    if optimization_direction is None:
+        optimization_direction = get_current_competition().config["competition"][
+            "optimization_direction"
+        ]
+    hour_start = get_hour_start(submitted_at)
+    cursor.execute(
+        "INSERT OR IGNORE INTO hourly_active_users (hour_start, user_id) VALUES (?, ?)",
+        (hour_start, user_id),
+    )
+    new_active_user = cursor.rowcount
+    row = cursor.execute(
+        """
+        SELECT best_score FROM hourly_activity
+        WHERE hour_start <= ? ORDER BY hour_start DESC LIMIT 1
+    """,
+        (hour_start,),
+    ).fetchone()
+    previous_best = row[0] if row is not None else None
+    if previous_best is None or public_score is None:
+        best_score = public_score if previous_best is None else previous_best
+    elif optimization_direction == "max":
+        best_score = max(previous_best, public_score)
+    else:
+        best_score = min(previous_best, public_score)
+    cursor.execute(
+        """
+        INSERT INTO hourly_activity
+            (hour_start, submission_count, active_users, best_score)
+        VALUES (?, 1, ?, ?)
+        ON CONFLICT (hour_start) DO UPDATE SET
+            submission_count = submission_count + 1,
+            active_users = active_users + excluded.active_users,
+            best_score = excluded.best_score
+    """,
+        (hour_start, new_active_user, best_score),
+    )
+
+
+def update_team_summary(cursor, team_id, public_score, optimization_direction):
+    """提出1件分をチームの集計に反映する。提出を登録するトランザクション内で呼ぶ"""
+    row = cursor.execute(
+        "SELECT best_public_score FROM team_summaries WHERE team_id = ?", (team_id,)
+    ).fetchone()
+    if row is None:
+        return
+    cursor.execute(
+        """
+        UPDATE team_summaries
+        SET submission_count = submission_count + 1, best_public_score = ?
+        WHERE team_id = ?
+    """,
+        (better_score(optimization_direction, row[0], public_score), team_id),
+    )
+
+
+def rebuild_hourly_activity(cursor):
+    """1時間ごとの集計をsubmissionsから作り直す"""
+    optimization_direction = get_current_competition().config["competition"][
+        "optimization_direction"
+    ]
+    cursor.execute("DELETE FROM hourly_activity")
+    cursor.execute("DELETE FROM hourly_active_users")
+    rows = cursor.execute(
+        """
+        SELECT user_id, public_score, submitted_at FROM submissions
+        WHERE submitted_at IS NOT NULL ORDER BY submitted_at, submission_id
+    """
+    ).fetchall()
+    for user_id, public_score, submitted_at in rows:
+        update_hourly_activity(
+            cursor, user_id, public_score, submitted_at, optimization_direction
+        )
+
+
 # def create_final_submission_table():
-#     conn = sqlite3.connect(FINAL_SUBMISSION_DB_PATH)
+#     conn = sqlite3.connect(get_final_submission_db_path())
 #     cursor = conn.cursor()
 #     cursor.execute("""
 #     CREATE TABLE IF NOT EXISTS final_submissions
@@ -90,8 +611,18 @@ def create_tables():
 #     conn.close()
 
 
+def get_user_id(username):
+    """ユーザー名のuser_idを返す。登録されていなければNone (ユーザーは作らない)"""
+    conn = sqlite3.connect(get_submission_db_path())
+    row = conn.execute(
+        "SELECT user_id FROM users WHERE username = ?", (username,)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
 def get_or_create_user_id(username):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
+    conn = sqlite3.connect(get_submission_db_path())
     c = conn.cursor()
     c.execute("SELECT user_id FROM users WHERE username = ?", (username,))
     result = c.fetchone()
@@ -106,7 +637,7 @@ def get_or_create_user_id(username):
 
 
 # def get_or_create_user_id(username):
-#     conn = sqlite3.connect(SUBMITTION_DB_PATH)
+#     conn = sqlite3.connect(get_submission_db_path())
 #     c = conn.cursor()
 
 #     try:
@@ -140,45 +671,70 @@ def get_or_create_user_id(username):
 #         conn.close()
 
 
+def ensure_team_membership(cursor, user_id):
+    """ユーザーの所属チームのidを返す。未所属ならユーザー名の1人チームを作る
+
+    提出を登録するトランザクション内からも呼ぶため、コミットはしない。
+    """
+    row = cursor.execute(
+        "SELECT team_id FROM team_members WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if row is not None:
+        return row[0]
+
+    row = cursor.execute(
+        "SELECT username FROM users WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    username = row[0]
+    team_name = username
+    # ユーザー名と同じ名前のチームがあれば、user_id (それも使われていれば連番) を付ける
+    n = 0
+    while cursor.execute(
+        "SELECT 1 FROM teams WHERE team_name = ?", (team_name,)
+    ).fetchone():
+        n += 1
+        team_name = f"{username}_{user_id}" if n == 1 else f"{username}_{user_id}_{n}"
+    cursor.execute("INSERT INTO teams (team_name) VALUES (?)", (team_name,))
+    team_id = cursor.lastrowid
+    cursor.execute(
+        "INSERT INTO team_members (user_id, team_id, joined_at) VALUES (?, ?, ?)",
+        (user_id, team_id, datetime.now().strftime(TIMESTAMP_FORMAT)),
+    )
+    # 既に提出していれば、その回数とベストスコアを引き継ぐ
+    cursor.execute(
+        """
+        INSERT INTO team_summaries
+            (team_id, best_public_score, submission_count, member_count)
+        SELECT ?, c.best_public_score, COALESCE(c.total_count, 0), 1
+        FROM (SELECT 1) LEFT JOIN submission_counters c ON c.user_id = ?
+    """,
+        (team_id, user_id),
+    )
+    return team_id
+
+
 def get_or_create_team_id(user_id):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
+    conn = sqlite3.connect(get_submission_db_path(), isolation_level=None)
     c = conn.cursor()
 
     try:
-        # ユーザーの情報を取得
-        c.execute("SELECT username FROM users WHERE user_id = ?", (user_id,))
-        user_result = c.fetchone()
-
-        if not user_result:
+        # 同じユーザーのチームが並列に作られないよう、先に書き込みロックを取る
+        c.execute("BEGIN IMMEDIATE")
+        team_id = ensure_team_membership(c, user_id)
+        if team_id is None:
             # ユーザーが存在しない場合
             print(f"エラー: ユーザーID {user_id} は存在しません。")
+            conn.rollback()
             return None
-
-        username = user_result[0]
-
-        # team_usersテーブルからチーム情報を取得
-        c.execute(
-            "SELECT team_id, team_name FROM team_users WHERE user_id = ?", (user_id,)
-        )
-        team_result = c.fetchone()
-
-        if team_result:
-            # ユーザーに関連付けられたチームが存在する場合
-            team_id = team_result[0]
-        else:
-            # ユーザーに関連付けられたチームが存在しない場合、新しいエントリーを作成
-            team_id = user_id  # team_idをuser_idと同じ値に設定
-            c.execute(
-                "INSERT INTO team_users (team_id, team_name, user_id) VALUES (?, ?, ?)",
-                (team_id, username, user_id),
-            )
-
         conn.commit()
         return team_id
 
     except sqlite3.Error as e:
         print(f"データベースエラー: {e}")
-        conn.rollback()
+        if conn.in_transaction:
+            conn.rollback()
         return None
 
     finally:
@@ -186,7 +742,7 @@ def get_or_create_team_id(user_id):
 
 
 def get_team_name(team_id):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
+    conn = sqlite3.connect(get_submission_db_path())
     c = conn.cursor()
 
     try:
@@ -207,47 +763,149 @@ def get_team_name(team_id):
         conn.close()
 
 
-def insert_submission(
-    user_id, team_id, public_score, private_score, timestamp, filename
+def insert_submission(record):
+    status, _ = insert_submission_within_quota(record)
+    return status == SUBMISSION_INSERTED
+
+
+def insert_submission_within_quota(
+    record, max_submissions=None, max_daily_submissions=None, competition=None
 ):
-    query = """
-    INSERT INTO submissions (user_id, team_id, filename, public_score, private_score, timestamp, user_submission_id)
-    VALUES (:user_id, :team_id, :filename, :public_score, :private_score, :timestamp,
-            (SELECT COALESCE(MAX(user_submission_id), 0) + 1 FROM submissions WHERE user_id = :user_id))
+    """提出回数の上限チェックと提出の登録を1つのトランザクションで行う
+
+    BEGIN IMMEDIATEで先に書き込みロックを取るため、同じユーザーが並列に提出しても
+    上限を超えて登録されることはない。上限はsubmission_countersのカウンターで判定し、
+    submissionsを数え直すことはない。ユーザーとチームのベストスコア・提出回数と、
+    record.split_scores ({分割名: スコア}) の submission_scores への登録も
+    同じトランザクションで行う。(結果, 登録した提出のsubmission_id) を返す。
+    登録しなかった場合のsubmission_idはNone。
     """
-    data = {
-        "user_id": user_id,
-        "team_id": team_id,
-        "filename": filename,
-        "public_score": public_score,
-        "private_score": private_score,
-        "timestamp": timestamp,
-    }
+    if competition is None:
+        competition = get_current_competition()
+    submitted_at = timestamp_to_epoch(record.timestamp) or int(time.time())
+    window_start, _ = get_daily_window(submitted_at)
+    optimization_direction = competition.config["competition"]["optimization_direction"]
 
+    conn = sqlite3.connect(competition.submission_db_path, isolation_level=None)
     try:
-        with sqlite3.connect(SUBMITTION_DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, data)
-            conn.commit()
-        return True
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            """
+            SELECT total_count, daily_window_start, daily_count, best_public_score
+            FROM submission_counters WHERE user_id = ?
+        """,
+            (record.user_id,),
+        ).fetchone()
+        total_count, daily_window_start, daily_count, best_public_score = row or (
+            0,
+            None,
+            0,
+            None,
+        )
+        if daily_window_start != window_start:
+            # 日付が変わったら日ごとのカウンターをリセットする
+            daily_count = 0
+
+        if max_submissions is not None and total_count >= max_submissions:
+            conn.rollback()
+            return SUBMISSION_LIMIT_REACHED, None
+        if max_daily_submissions is not None and daily_count >= max_daily_submissions:
+            conn.rollback()
+            return DAILY_SUBMISSION_LIMIT_REACHED, None
+
+        # 提出はユーザーの現在のチームに記録する
+        team_id = (
+            ensure_team_membership(conn.cursor(), record.user_id) or record.team_id
+        )
+        cursor = conn.execute(
+            """
+            INSERT INTO submissions
+                (user_id, team_id, filename, public_score, private_score,
+                 timestamp, user_submission_id, submitted_at, prediction_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                record.user_id,
+                team_id,
+                record.filename,
+                record.public_score,
+                record.private_score,
+                record.timestamp,
+                total_count + 1,
+                submitted_at,
+                record.prediction_path,
+            ),
+        )
+        submission_id = cursor.lastrowid
+        split_scores = record.split_scores
+        if split_scores is None:
+            split_scores = {
+                "public": record.public_score,
+                "private": record.private_score,
+            }
+        conn.executemany(
+            "INSERT INTO submission_scores (submission_id, split, score)"
+            " VALUES (?, ?, ?)",
+            [(submission_id, split, score) for split, score in split_scores.items()],
+        )
+        conn.execute(
+            """
+            INSERT INTO submission_counters
+                (user_id, total_count, daily_window_start, daily_count,
+                 best_public_score)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_count = excluded.total_count,
+                daily_window_start = excluded.daily_window_start,
+                daily_count = excluded.daily_count,
+                best_public_score = excluded.best_public_score
+        """,
+            (
+                record.user_id,
+                total_count + 1,
+                window_start,
+                daily_count + 1,
+                better_score(
+                    optimization_direction, best_public_score, record.public_score
+                ),
+            ),
+        )
+        update_team_summary(
+            conn.cursor(), team_id, record.public_score, optimization_direction
+        )
+        update_hourly_activity(
+            conn.cursor(),
+            record.user_id,
+            record.public_score,
+            submitted_at,
+            optimization_direction,
+        )
+        conn.commit()
+        return SUBMISSION_INSERTED, submission_id
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
-        return False
+        if conn.in_transaction:
+            conn.rollback()
+        return SUBMISSION_ERROR, None
+    finally:
+        conn.close()
 
 
 def get_best_scores():
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
+    conn = sqlite3.connect(get_submission_db_path())
     c = conn.cursor()
 
     agg_func = "MIN" if OPTIMIZATION_DIRECTION == "min" else "MAX"
+    order = "ASC" if OPTIMIZATION_DIRECTION == "min" else "DESC"
 
     # ユーザーごとの最高スコア
     c.execute(f"""
-        SELECT users.username, {agg_func}(submissions.public_score) as best_public_score
+        SELECT users.username,
+               {agg_func}(submissions.public_score) as best_public_score
         FROM submissions
         JOIN users ON submissions.user_id = users.user_id
         GROUP BY users.user_id
-        ORDER BY best_public_score {"ASC" if OPTIMIZATION_DIRECTION == "min" else "DESC"}
+        ORDER BY best_public_score {order}
     """)
     user_leaderboard = pd.DataFrame(
         c.fetchall(), columns=["username", "best_public_score"]
@@ -255,11 +913,12 @@ def get_best_scores():
 
     # チームごとの最高スコア
     c.execute(f"""
-        SELECT teams.team_name, {agg_func}(submissions.public_score) as best_public_score
+        SELECT teams.team_name,
+               {agg_func}(submissions.public_score) as best_public_score
         FROM submissions
         JOIN teams ON submissions.team_id = teams.team_id
         GROUP BY teams.team_id
-        ORDER BY best_public_score {"ASC" if OPTIMIZATION_DIRECTION == "min" else "DESC"}
+        ORDER BY best_public_score {order}
     """)
     team_leaderboard = pd.DataFrame(c.fetchall(), columns=["team", "best_public_score"])
 
@@ -267,23 +926,51 @@ def get_best_scores():
     return user_leaderboard, team_leaderboard
 
 
-def get_submission_count(user_id, date):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
+def get_submission_count(user_id, day):
+    """指定した日(date, datetime または YYYY-MM-DD)の提出回数を返す"""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    window_start, window_end = get_daily_window(
+        datetime.combine(day, datetime.min.time()).timestamp()
+    )
+
+    conn = sqlite3.connect(get_submission_db_path())
     c = conn.cursor()
+    # (user_id, submitted_at) のインデックスによる範囲スキャンになる
     c.execute(
         """
         SELECT COUNT(*) FROM submissions
-        WHERE user_id = ? AND DATE(timestamp) = DATE(?)
+        WHERE user_id = ? AND submitted_at >= ? AND submitted_at < ?
     """,
-        (user_id, date),
+        (user_id, window_start, window_end),
     )
     count = c.fetchone()[0]
     conn.close()
     return count
 
 
+def get_hourly_activity(since=None):
+    """1時間ごとの集計を返す。sinceを指定するとその時刻(UNIX時間)以降のみ"""
+    conn = sqlite3.connect(get_submission_db_path())
+    query = """
+    SELECT hour_start, submission_count, active_users, best_score
+    FROM hourly_activity
+    WHERE hour_start >= ?
+    ORDER BY hour_start
+    """
+    activity = pd.read_sql_query(query, conn, params=(since or 0,))
+    conn.close()
+    # 集計はUTCの時間単位なので、表示用にローカル時間へ変換する
+    activity["hour"] = (
+        pd.to_datetime(activity["hour_start"], unit="s", utc=True)
+        .dt.tz_convert(datetime.now().astimezone().tzinfo)
+        .dt.tz_localize(None)
+    )
+    return activity
+
+
 def select_final_submissions(user_id, limit=2):
-    conn_original = sqlite3.connect(SUBMITTION_DB_PATH)
+    conn_original = sqlite3.connect(get_submission_db_path())
     query = """
     SELECT submissions.*, users.username, teams.team_name 
     FROM submissions 
@@ -296,7 +983,7 @@ def select_final_submissions(user_id, limit=2):
     final_submissions = pd.read_sql_query(query, conn_original, params=(user_id, limit))
     conn_original.close()
 
-    conn_final = sqlite3.connect(FINAL_SUBMISSION_DB_PATH)
+    conn_final = sqlite3.connect(get_final_submission_db_path())
     cursor = conn_final.cursor()
 
     cursor.execute("DELETE FROM final_submissions WHERE user_id = ?", (user_id,))
@@ -305,7 +992,8 @@ def select_final_submissions(user_id, limit=2):
         cursor.execute(
             """
         INSERT INTO final_submissions 
-        (user_id, team_id, filename, public_score, private_score, timestamp, user_submission_id) 
+        (user_id, team_id, filename, public_score, private_score, timestamp,
+         user_submission_id) 
         VALUES (?, ?, ?, ?, ?, ?, ?)
         """,
             (
@@ -326,10 +1014,10 @@ def select_final_submissions(user_id, limit=2):
 
 
 def get_user_submissions(user_id):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
+    conn = sqlite3.connect(get_submission_db_path())
     query = """
-    SELECT s.submission_id, s.user_id, s.team_id, s.filename, s.public_score, s.private_score, s.timestamp,
-           u.username, s.user_submission_id
+    SELECT s.submission_id, s.user_id, s.team_id, s.filename, s.public_score,
+           s.private_score, s.timestamp, u.username, s.user_submission_id
     FROM submissions s
     JOIN users u ON s.user_id = u.user_id
     WHERE s.user_id = ?
@@ -341,8 +1029,8 @@ def get_user_submissions(user_id):
 
 
 def update_final_submissions(user_id, selected_ids):
-    conn_original = sqlite3.connect(SUBMITTION_DB_PATH)
-    conn_final = sqlite3.connect(FINAL_SUBMISSION_DB_PATH)
+    conn_original = sqlite3.connect(get_submission_db_path())
+    conn_final = sqlite3.connect(get_final_submission_db_path())
 
     query = """
     SELECT submissions.*, users.username
@@ -360,7 +1048,8 @@ def update_final_submissions(user_id, selected_ids):
         cursor.execute(
             """
         INSERT INTO final_submissions 
-        (submission_id, user_id, team_id, filename, public_score, private_score, timestamp, user_submission_id) 
+        (submission_id, user_id, team_id, filename, public_score, private_score,
+         timestamp, user_submission_id) 
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """,
             (
@@ -380,16 +1069,45 @@ def update_final_submissions(user_id, selected_ids):
     conn_final.close()
 
 
-def get_total_submission_count(user_id):
-    conn = sqlite3.connect(SUBMITTION_DB_PATH)
+def get_total_submission_count(user_id, competition=None):
+    if competition is None:
+        competition = get_current_competition()
+    conn = sqlite3.connect(competition.submission_db_path)
     c = conn.cursor()
     c.execute(
         """
-        SELECT COUNT(*) FROM submissions
+        SELECT total_count FROM submission_counters
         WHERE user_id = ?
     """,
         (user_id,),
     )
-    count = c.fetchone()[0]
+    result = c.fetchone()
     conn.close()
-    return count
+    return result[0] if result else 0
+
+
+def get_submission_counter(user_id, submitted_at, competition=None):
+    """(総提出回数, submitted_atの日の提出回数, ベストのPublicスコア) を返す
+
+    submission_countersのカウンターを読み、submissionsを数え直すことはない。
+    ベストスコアは提出がなければNone。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    conn = sqlite3.connect(competition.submission_db_path)
+    try:
+        row = conn.execute(
+            """
+            SELECT total_count, daily_window_start, daily_count, best_public_score
+            FROM submission_counters WHERE user_id = ?
+        """,
+            (user_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return 0, 0, None
+    total_count, daily_window_start, daily_count, best_public_score = row
+    if daily_window_start != get_daily_window(submitted_at)[0]:
+        daily_count = 0
+    return total_count, daily_count, best_public_score
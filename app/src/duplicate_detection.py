@@ -0,0 +1,170 @@
+"""LSHシグネチャによる重複提出の検出
+
+提出の登録時に、予測値からSimHash(ランダムな超平面への射影の符号)で128ビットのシグネチャを作り、
+16ビットずつ8つのバンドに分けてインデックス付きのテーブルに保存する。
+別のユーザーの提出とバンドが1つでも一致したものだけを候補として取り出し、
+ハミング距離がしきい値以下ならduplicate_flagsに記録する。
+全提出との総当たりは行わないため、提出数が増えても登録時の処理はほぼ一定の時間で済む。
+
+射影には正解データのids順で固定の行をサンプルして使う。中心化してから射影するため、
+ハミング距離は予測値の相関の角度に比例する
+(距離d のとき相関はおよそ cos(pi * d / 128))。
+定数の予測値は中心化すると0になり、相関が定まらないためシグネチャを作らない。
+"""
+
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+from app.src.competition import get_current_competition
+from app.src.database import TIMESTAMP_FORMAT
+from app.src.lazy_import import lazy_import
+from app.src.logger_config import get_logger
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+logger = get_logger(__name__)
+
+SIGNATURE_BITS = 128
+SIGNATURE_BANDS = 8
+# 射影に使う行数。コピーされた予測値はどの行でも一致するため全行は必要ない
+SIGNATURE_SAMPLE_ROWS = 2**16
+SIGNATURE_SEED = 0
+# これ以下のハミング距離を重複の疑いとする (相関およそ0.995以上)
+MAX_HAMMING_DISTANCE = 4
+# 中心化した予測値の二乗平均平方根が、予測値の大きさ(1未満なら1)に対して
+# これ以下なら定数の予測とみなす
+MIN_RELATIVE_SPREAD = 1e-6
+
+
+@lru_cache(maxsize=4)
+def _get_projection(num_rows):
+    """行数ごとに固定の (サンプルする行, 超平面) を返す"""
+    rng = np.random.default_rng(SIGNATURE_SEED)
+    sample = np.unique(
+        rng.integers(0, num_rows, size=min(num_rows, SIGNATURE_SAMPLE_ROWS))
+    )
+    planes = rng.standard_normal((SIGNATURE_BITS, len(sample)), dtype=np.float32)
+    return sample, planes
+
+
+def compute_signature(predictions):
+    """ids順に並んだ予測値からSIGNATURE_BITSビットのシグネチャ(bytes)を計算する
+
+    サンプルした行の予測値がほぼ定数の場合はNoneを返す。
+    """
+    sample, planes = _get_projection(len(predictions))
+    values = np.asarray(predictions[sample], dtype=np.float32)
+    mean = values.mean()
+    values = values - mean
+    # 中心化した値が丸め誤差だけになると符号がほぼ揃い、
+    # 定数の提出どうしが全て重複と判定されてしまう
+    spread = np.sqrt(np.mean(np.square(values, dtype=np.float64)))
+    if spread <= MIN_RELATIVE_SPREAD * max(abs(float(mean)), 1.0):
+        return None
+    return np.packbits(planes @ values >= 0).tobytes()
+
+
+def split_bands(signature):
+    band_size = len(signature) // SIGNATURE_BANDS
+    return [
+        int.from_bytes(signature[band * band_size : (band + 1) * band_size], "big")
+        for band in range(SIGNATURE_BANDS)
+    ]
+
+
+def hamming_distance(signature_a, signature_b):
+    return (
+        int.from_bytes(signature_a, "big") ^ int.from_bytes(signature_b, "big")
+    ).bit_count()
+
+
+def register_submission_signature(
+    submission_id, user_id, predictions, competition=None
+):
+    """提出のシグネチャを保存し、別のユーザーの提出で重複の疑いがあるものを記録して返す
+
+    戻り値は [(一致した提出のid, ハミング距離)]。
+    予測値が定数の場合はシグネチャを保存せず、重複も判定しない。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    signature = compute_signature(predictions)
+    if signature is None:
+        logger.info(
+            f"Skipped duplicate detection for constant predictions: {submission_id}"
+        )
+        return []
+    flagged_at = datetime.now().strftime(TIMESTAMP_FORMAT)
+    bands = split_bands(signature)
+
+    conn = sqlite3.connect(competition.submission_db_path)
+    try:
+        with conn:
+            # インデックスで同じバンドを持つ提出だけを候補として取り出す
+            candidates = conn.execute(
+                """
+                SELECT DISTINCT s.submission_id, s.signature
+                FROM submission_signature_bands b
+                JOIN submission_signatures s ON b.submission_id = s.submission_id
+                WHERE ({}) AND s.user_id != ?
+            """.format(" OR ".join(["(b.band = ? AND b.band_hash = ?)"] * len(bands))),
+                [value for band in enumerate(bands) for value in band] + [user_id],
+            ).fetchall()
+            matches = [
+                (matched_id, distance)
+                for matched_id, matched_signature in candidates
+                if (distance := hamming_distance(signature, matched_signature))
+                <= MAX_HAMMING_DISTANCE
+            ]
+
+            conn.execute(
+                "INSERT OR REPLACE INTO submission_signatures VALUES (?, ?, ?)",
+                (submission_id, user_id, signature),
+            )
+            conn.executemany(
+                "INSERT INTO submission_signature_bands VALUES (?, ?, ?)",
+                [
+                    (band, band_hash, submission_id)
+                    for band, band_hash in enumerate(bands)
+                ],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO duplicate_flags VALUES (?, ?, ?, ?)",
+                [
+                    (submission_id, matched_id, distance, flagged_at)
+                    for matched_id, distance in matches
+                ],
+            )
+    finally:
+        conn.close()
+
+    for matched_id, distance in matches:
+        logger.warning(
+            f"Possible duplicate submission: {submission_id} (user {user_id}) "
+            f"matches {matched_id} (hamming distance {distance})"
+        )
+    return matches
+
+
+def get_duplicate_flags(competition=None):
+    """記録された重複の疑いを新しい順に返す"""
+    if competition is None:
+        competition = get_current_competition()
+    conn = sqlite3.connect(competition.submission_db_path)
+    query = """
+    SELECT f.flagged_at, f.hamming_distance,
+           f.submission_id, ua.username AS username, sa.filename AS filename,
+           f.matched_submission_id, ub.username AS matched_username,
+           sb.filename AS matched_filename
+    FROM duplicate_flags f
+    JOIN submissions sa ON f.submission_id = sa.submission_id
+    JOIN users ua ON sa.user_id = ua.user_id
+    JOIN submissions sb ON f.matched_submission_id = sb.submission_id
+    JOIN users ub ON sb.user_id = ub.user_id
+    ORDER BY f.flagged_at DESC
+    """
+    flags = pd.read_sql_query(query, conn)
+    conn.close()
+    return flags
@@ -0,0 +1,122 @@
+"""過去の提出のブレンド(加重平均)の評価
+
+予測値キャッシュ(app/src/prediction_cache.py)からPublic分割の行だけを取り出して
+(提出数 x Public行数) の行列にし、重みの行列との積で多数のブレンドを一度に計算する。
+Private scoreは計算しない。
+"""
+
+import itertools
+
+from app.src.answer_key import load_answer_key
+from app.src.competition import get_current_competition
+from app.src.lazy_import import lazy_import
+from app.src.prediction_cache import load_submission_predictions
+from app.src.scoring import calculate_metric_batch
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# グリッドの組み合わせがこれを超える場合はランダムな重みで代用する
+MAX_WEIGHT_COMBINATIONS = 5000
+# 1回の行列積で作るブレンドの要素数 (ブレンド数 x Public行数) の上限
+BLEND_BLOCK_ELEMENTS = 2**22
+
+
+def load_public_prediction_matrix(submission_ids, competition=None):
+    """(読み込めた提出のid, Public行の予測値の行列, Public行の正解) を返す"""
+    if competition is None:
+        competition = get_current_competition()
+    answer_key = load_answer_key(competition)
+    public_mask = answer_key.public_mask
+    predictions = load_submission_predictions(submission_ids, competition)
+
+    loaded_ids = [
+        submission_id
+        for submission_id in submission_ids
+        if submission_id in predictions
+    ]
+    matrix = np.empty((len(loaded_ids), int(public_mask.sum())), dtype=np.float32)
+    for i, submission_id in enumerate(loaded_ids):
+        matrix[i] = predictions[submission_id][public_mask]
+    target = np.asarray(answer_key.target[public_mask], dtype=np.float32)
+    return loaded_ids, matrix, target
+
+
+def generate_weight_grid(num_submissions, step=0.1, seed=0):
+    """合計が1になる重みの組み合わせを (組み合わせ数 x 提出数) の行列で返す
+
+    stepごとの全組み合わせが多すぎる場合は、同じ数のディリクレ分布の乱数で代用する。
+    """
+    divisions = int(round(1 / step))
+    # 重複組み合わせの数 C(divisions + n - 1, n - 1)
+    num_combinations = np.prod(
+        [(divisions + i) / i for i in range(1, num_submissions)], dtype=float
+    )
+    if num_combinations > MAX_WEIGHT_COMBINATIONS:
+        rng = np.random.default_rng(seed)
+        weights = rng.dirichlet(np.ones(num_submissions), size=MAX_WEIGHT_COMBINATIONS)
+        # 単独の提出も必ず含める
+        return np.vstack([np.eye(num_submissions), weights]).astype(np.float32)
+
+    weights = [
+        counts
+        for counts in itertools.product(
+            range(divisions + 1), repeat=num_submissions - 1
+        )
+        if sum(counts) <= divisions
+    ]
+    weights = np.array(weights, dtype=np.float32).reshape(-1, num_submissions - 1)
+    last = divisions - weights.sum(axis=1, keepdims=True)
+    return np.hstack([weights, last]) / divisions
+
+
+def evaluate_blends(weights, matrix, target, metric):
+    """各重みの組み合わせのブレンドのスコアを返す"""
+    weights = np.asarray(weights, dtype=np.float32)
+    if metric == "rmse":
+        # 二乗誤差は w^T (P P^T) w - 2 w^T (P y) + y^T y に展開できるため、
+        # 行数に比例する計算はグラム行列を作る1回だけで済む
+        matrix64 = matrix.astype(np.float64)
+        gram = matrix64 @ matrix64.T
+        cross = matrix64 @ target.astype(np.float64)
+        weights64 = weights.astype(np.float64)
+        squared_error = (
+            np.einsum("ij,jk,ik->i", weights64, gram, weights64)
+            - 2 * weights64 @ cross
+            + target.astype(np.float64) @ target.astype(np.float64)
+        )
+        return np.sqrt(np.maximum(squared_error, 0) / matrix.shape[1])
+
+    scores = np.empty(len(weights), dtype=np.float64)
+    block_size = max(1, BLEND_BLOCK_ELEMENTS // max(1, matrix.shape[1]))
+    for start in range(0, len(weights), block_size):
+        blends = weights[start : start + block_size] @ matrix
+        scores[start : start + block_size] = calculate_metric_batch(
+            blends, target, metric
+        )
+    return scores
+
+
+def search_blends(submission_ids, step=0.1, top_n=20, competition=None):
+    """重みのグリッドを評価し、Public scoreの良い順に上位top_n件を返す"""
+    if competition is None:
+        competition = get_current_competition()
+    config = competition.config["competition"]
+    loaded_ids, matrix, target = load_public_prediction_matrix(
+        submission_ids, competition
+    )
+    if not loaded_ids:
+        return pd.DataFrame()
+
+    weights = generate_weight_grid(len(loaded_ids), step)
+    scores = evaluate_blends(weights, matrix, target, config["metric"])
+    order = np.argsort(scores, kind="stable")
+    if config["optimization_direction"] == "max":
+        order = order[::-1]
+    order = order[:top_n]
+
+    results = pd.DataFrame(
+        weights[order], columns=[f"weight_{i}" for i in loaded_ids]
+    ).round(3)
+    results["public_score"] = scores[order]
+    return results
@@ -0,0 +1,286 @@
+"""提出データのParquet / Arrow IPCへの一括エクスポート
+
+コンペティション終了後にノートブックで分析するため、submissions、submission_scores、
+final_submissions、users、team_usersを、SQLiteのカーソルから一定行数のバッチずつ読んで
+ArrowのRecordBatchに変換し、テーブルごとのディレクトリにパーティション分割したファイルとして書き出す。
+メモリに載るのは1バッチ分だけなので、数百万行の提出でも使うメモリは小さい。
+
+<output_dir>/<テーブル名>/part-00000.parquet (または .arrow)
+<output_dir>/manifest.json
+
+include_predictionsを指定すると、予測値キャッシュ(app/src/prediction_cache.py)を
+(submission_id, id, is_public, prediction) の縦持ちのテーブル
+submission_predictions として書き出す。
+ディレクトリごと pd.read_parquet("<output_dir>/submissions") のように読み込める。
+
+エクスポートの間ずっと読み取りトランザクションを持つと、その間は提出の登録が書き込めない。
+そのため、オンラインバックアップ(app/src/backup.py)で一時ディレクトリにコピーしたデータベースから読む。
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.src.answer_key import load_answer_key
+from app.src.backup import snapshot_databases
+from app.src.competition import get_current_competition
+from app.src.database import TIMESTAMP_FORMAT
+from app.src.lazy_import import lazy_import
+from app.src.prediction_cache import load_prediction_cache
+
+pa = lazy_import("pyarrow")
+
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+# テーブル名: (データベース, 並べ替えの列)。
+# 最終提出のデータベースは final としてATTACHする
+EXPORT_TABLES = {
+    "submissions": ("main", "submission_id"),
+    "submission_scores": ("main", "submission_id"),
+    "final_submissions": ("final", "submission_id"),
+    "users": ("main", "user_id"),
+    "team_users": ("main", "team_id"),
+}
+PREDICTIONS_TABLE = "submission_predictions"
+# 1回にSQLiteから読む行数
+EXPORT_BATCH_ROWS = 50_000
+# 1ファイルあたりの最大行数
+EXPORT_PARTITION_ROWS = 1_000_000
+# 画面からダウンロードできるzipの最大サイズ。
+# st.download_button はファイル全体をメモリに読み込むため、これより大きい場合は
+# tool/export_competition.py でサーバー上に書き出す
+EXPORT_DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class ExportOptions:
+    file_format: str = "parquet"
+    # Noneなら EXPORT_TABLES の全てのテーブル
+    tables: list | None = None
+    include_predictions: bool = False
+    batch_rows: int = EXPORT_BATCH_ROWS
+    partition_rows: int = EXPORT_PARTITION_ROWS
+
+
+def _arrow_type(declared_type):
+    """SQLiteの宣言型からArrowの型を決める (型の親和性の規則に合わせる)"""
+    declared_type = (declared_type or "").upper()
+    if "INT" in declared_type:
+        return pa.int64()
+    if any(name in declared_type for name in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    if "BLOB" in declared_type:
+        return pa.binary()
+    return pa.string()
+
+
+def _get_schema(conn, database, table):
+    columns = conn.execute(f"PRAGMA {database}.table_info({table})").fetchall()
+    return pa.schema([(column[1], _arrow_type(column[2])) for column in columns])
+
+
+def _to_arrow_array(values, arrow_type):
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # SQLiteは宣言型と異なる型の値も保存できるため、文字列に変換して書き出す
+        if arrow_type == pa.string():
+            return pa.array(
+                [None if v is None else str(v) for v in values], pa.string()
+            )
+        raise
+
+
+def _iter_query_batches(conn, query, schema, batch_rows):
+    cursor = conn.execute(query)
+    while rows := cursor.fetchmany(batch_rows):
+        columns = zip(*rows)
+        yield pa.record_batch(
+            [
+                _to_arrow_array(list(values), field.type)
+                for values, field in zip(columns, schema)
+            ],
+            schema=schema,
+        )
+
+
+def _get_prediction_schema(answer_key):
+    return pa.schema(
+        [
+            ("submission_id", pa.int64()),
+            ("id", pa.array(answer_key.ids[:0]).type),
+            ("is_public", pa.bool_()),
+            ("prediction", pa.float32()),
+        ]
+    )
+
+
+def _iter_prediction_batches(conn, schema, batch_rows, competition):
+    answer_key = load_answer_key(competition)
+    ids = pa.array(answer_key.ids)
+    is_public = pa.array(answer_key.public_mask)
+    rows = conn.execute(
+        """
+        SELECT submission_id, prediction_path FROM main.submissions
+        WHERE prediction_path IS NOT NULL ORDER BY submission_id
+    """
+    ).fetchall()
+    for submission_id, prediction_path in rows:
+        predictions = load_prediction_cache(prediction_path, competition)
+        if predictions is None:
+            continue
+        for start in range(0, len(predictions), batch_rows):
+            stop = min(start + batch_rows, len(predictions))
+            yield pa.record_batch(
+                [
+                    pa.repeat(pa.scalar(submission_id, pa.int64()), stop - start),
+                    ids[start:stop],
+                    is_public[start:stop],
+                    pa.array(predictions[start:stop]),
+                ],
+                schema=schema,
+            )
+
+
+def _open_writer(path, schema, file_format):
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(path, schema, compression="zstd")
+    return pa.ipc.new_file(
+        path, schema, options=pa.ipc.IpcWriteOptions(compression="zstd")
+    )
+
+
+def _write_partitioned(batches, schema, table_dir, file_format, partition_rows):
+    """バッチをpartition_rows行ごとのファイルに書く
+
+    (ファイル名のリスト, 行数) を返す。
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    files, total_rows = [], 0
+    writer, file_rows = None, 0
+    try:
+        for batch in batches:
+            offset = 0
+            while offset < batch.num_rows:
+                if writer is None or file_rows >= partition_rows:
+                    if writer is not None:
+                        writer.close()
+                    file_name = f"part-{len(files):05d}{EXPORT_FORMATS[file_format]}"
+                    files.append(file_name)
+                    writer = _open_writer(
+                        os.path.join(table_dir, file_name), schema, file_format
+                    )
+                    file_rows = 0
+                length = min(batch.num_rows - offset, partition_rows - file_rows)
+                writer.write_batch(batch.slice(offset, length))
+                offset += length
+                file_rows += length
+                total_rows += length
+        if writer is None:
+            # 0行のテーブルもスキーマだけのファイルを作っておく
+            file_name = f"part-00000{EXPORT_FORMATS[file_format]}"
+            files.append(file_name)
+            writer = _open_writer(
+                os.path.join(table_dir, file_name), schema, file_format
+            )
+    finally:
+        if writer is not None:
+            writer.close()
+    return files, total_rows
+
+
+def export_competition_data(output_dir, options=None, competition=None):
+    """提出データをoutput_dirに書き出し、manifest.jsonの内容を返す"""
+    if options is None:
+        options = ExportOptions()
+    file_format = options.file_format
+    batch_rows, partition_rows = options.batch_rows, options.partition_rows
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    if competition is None:
+        competition = get_current_competition()
+    tables = list(EXPORT_TABLES) if options.tables is None else options.tables
+    for table in tables:
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown export table: {table}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {
+        "competition_id": competition.competition_id,
+        "exported_at": datetime.now().strftime(TIMESTAMP_FORMAT),
+        "format": file_format,
+        "tables": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="minikaggle_snapshot_") as snapshot_dir:
+        # 全テーブルを同じ時点のコピーから読み、エクスポート中の提出と不整合にしない
+        snapshot_databases(snapshot_dir, competition)
+        conn = sqlite3.connect(os.path.join(snapshot_dir, "submissions.db"))
+        try:
+            conn.execute(
+                "ATTACH DATABASE ? AS final",
+                (os.path.join(snapshot_dir, "final_submissions.db"),),
+            )
+            for table in tables:
+                database, order_column = EXPORT_TABLES[table]
+                schema = _get_schema(conn, database, table)
+                query = f"SELECT * FROM {database}.{table} ORDER BY {order_column}"
+                files, rows = _write_partitioned(
+                    _iter_query_batches(conn, query, schema, batch_rows),
+                    schema,
+                    os.path.join(output_dir, table),
+                    file_format,
+                    partition_rows,
+                )
+                manifest["tables"][table] = {"files": files, "rows": rows}
+
+            if options.include_predictions:
+                schema = _get_prediction_schema(load_answer_key(competition))
+                files, rows = _write_partitioned(
+                    _iter_prediction_batches(conn, schema, batch_rows, competition),
+                    schema,
+                    os.path.join(output_dir, PREDICTIONS_TABLE),
+                    file_format,
+                    partition_rows,
+                )
+                manifest["tables"][PREDICTIONS_TABLE] = {"files": files, "rows": rows}
+        finally:
+            conn.close()
+
+    with open(os.path.join(output_dir, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def export_competition_zip(
+    file_format="parquet", include_predictions=False, competition=None
+):
+    """エクスポートしたファイルをzipにまとめ、一時ファイルのパスを返す
+
+    一時ファイルの削除は呼び出し側で行う。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    with tempfile.TemporaryDirectory(prefix="minikaggle_export_") as export_dir:
+        export_competition_data(
+            export_dir,
+            ExportOptions(
+                file_format=file_format, include_predictions=include_predictions
+            ),
+            competition,
+        )
+        fd, zip_path = tempfile.mkstemp(prefix="minikaggle_export_", suffix=".zip")
+        # Parquet / Arrowのファイルはzstdで圧縮済みなので、zipでは圧縮しない
+        with (
+            os.fdopen(fd, "wb") as file,
+            zipfile.ZipFile(file, "w", zipfile.ZIP_STORED) as archive,
+        ):
+            for root, _, file_names in os.walk(export_dir):
+                for file_name in sorted(file_names):
+                    path = os.path.join(root, file_name)
+                    archive.write(path, os.path.relpath(path, export_dir))
+    return zip_path
@@ -0,0 +1,60 @@
+"""重いモジュールの遅延インポート
+
+pandas や plotly はインポートだけで数百ミリ秒かかるため、モジュールの先頭で
+`pd = lazy_import("pandas")` のようにしておき、
+属性に初めてアクセスした時点でインポートする。これにより、それらを使わないページ
+(ホーム、アカウント、チーム名変更など)の初回表示が速くなる。
+"""
+
+import importlib
+import sys
+import threading
+import types
+
+# 同じモジュールの別々のプロキシ(モジュールごとの `pd = lazy_import("pandas")`)からも
+# 同時に読み込まれないよう、全てのプロキシで1つのロックを使う
+_load_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    """属性へのアクセス時に本体のモジュールをインポートして委譲するプロキシ"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            # importlibのロックでは、別のスレッドがインポート中のモジュールを
+            # 初期化の途中の状態で受け取ることがある。プロキシ側でもロックを取り、
+            # import_moduleが戻ってから(初期化が終わってから)公開する
+            with _load_lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.__name__)
+                module = self._module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name):
+    """nameのモジュールを遅延インポートする。インポート済みならそのまま返す
+
+    別のスレッドがインポートしている途中のモジュールもsys.modulesに入っているため、
+    初期化が終わっていないモジュールはそのまま返さずにプロキシを返す。
+    """
+    module = sys.modules.get(name)
+    if module is not None and not getattr(
+        getattr(module, "__spec__", None), "_initializing", False
+    ):
+        return module
+    return LazyModule(name)
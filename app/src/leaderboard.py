@@ -0,0 +1,315 @@
+import sqlite3
+
+from app.src.database import (
+    get_final_submission_db_path,
+    get_optimization_direction,
+    get_submission_db_path,
+)
+from app.src.lazy_import import lazy_import
+from app.src.logger_config import get_logger
+
+pd = lazy_import("pandas")
+
+logger = get_logger(__name__)
+
+
+def get_split_names():
+    """スコアが登録されている分割の名前"""
+    conn = sqlite3.connect(get_submission_db_path())
+    rows = conn.execute(
+        "SELECT DISTINCT split FROM submission_scores ORDER BY split"
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def get_leaderboard(split="public"):
+    """チームごとのリーダーボード
+
+    publicは提出のたびに更新されるteam_summariesを、best_public_scoreのインデックス順に読む。
+    それ以外の分割は submission_scores からチームごとのベストスコアを集計する。
+    """
+    optimization_direction = get_optimization_direction()
+    order = "DESC" if optimization_direction == "max" else "ASC"
+    agg_func = "MAX" if optimization_direction == "max" else "MIN"
+    conn = sqlite3.connect(get_submission_db_path())
+
+    if split == "public":
+        query = f"""
+        SELECT
+            t.team_name,
+            ts.best_public_score as best_score,
+            ts.member_count,
+            ts.submission_count as submit_count
+        FROM team_summaries ts
+        JOIN teams t ON ts.team_id = t.team_id
+        WHERE ts.best_public_score IS NOT NULL
+        ORDER BY ts.best_public_score {order}
+        """
+        params = ()
+    else:
+        query = f"""
+        SELECT
+            t.team_name,
+            {agg_func}(sc.score) as best_score,
+            ts.member_count,
+            COUNT(*) as submit_count
+        FROM submission_scores sc
+        JOIN submissions s ON sc.submission_id = s.submission_id
+        JOIN teams t ON s.team_id = t.team_id
+        LEFT JOIN team_summaries ts ON s.team_id = ts.team_id
+        WHERE sc.split = ? AND sc.score IS NOT NULL
+        GROUP BY s.team_id
+        ORDER BY best_score {order}
+        """
+        params = (split,)
+
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+
+    # 順位を付ける
+    df["順位"] = range(1, len(df) + 1)
+
+    # カラム名を変更
+    score_column = "Public スコア" if split == "public" else f"{split} スコア"
+    df = df.rename(
+        columns={
+            "team_name": "チーム名",
+            "best_score": score_column,
+            "member_count": "メンバー数",
+            "submit_count": "Submit回数",
+        }
+    )
+
+    # スコアを小数点以下4桁に丸める
+    # 提出が0件のときはobject型になりroundできないためfloatに揃える
+    df[score_column] = df[score_column].astype(float).round(3)
+    # カラムの順序を変更
+    df = df[["順位", "チーム名", score_column, "メンバー数", "Submit回数"]]
+
+    return df
+
+
+def fetch_data_from_db():
+    """データベースから必要なデータを取得する"""
+    conn_main = sqlite3.connect(get_submission_db_path())
+    conn_final = sqlite3.connect(get_final_submission_db_path())
+
+    users_df = pd.read_sql_query("SELECT * FROM users", conn_main)
+    submissions_df = pd.read_sql_query("SELECT * FROM submissions", conn_main)
+    final_submissions_df = pd.read_sql_query(
+        "SELECT * FROM final_submissions", conn_final
+    )
+
+    conn_main.close()
+    conn_final.close()
+
+    return users_df, submissions_df, final_submissions_df
+
+
+def _best_index(scores, optimization_direction):
+    """最適化方向で最も良いスコアの行のインデックス"""
+    return scores.idxmax() if optimization_direction == "max" else scores.idxmin()
+
+
+def _best_n(df, column, n, optimization_direction):
+    """最適化方向でcolumnの最も良いn行"""
+    if optimization_direction == "max":
+        return df.nlargest(n, column)
+    return df.nsmallest(n, column)
+
+
+def prepare_leaderboard_data(users_df, submissions_df, final_submissions_df):
+    """リーダーボード用のデータを準備する"""
+    optimization_direction = get_optimization_direction()
+    leaderboard_data = []
+
+    if optimization_direction not in ("max", "min"):
+        raise ValueError("optimization_direction must be either 'max' or 'min'")
+
+    for _, user in users_df.iterrows():
+        user_id = user["user_id"]
+        user_final_submissions = final_submissions_df[
+            final_submissions_df["user_id"] == user_id
+        ]
+        user_submissions = submissions_df[submissions_df["user_id"] == user_id]
+
+        submission_count = len(user_submissions)
+
+        if submission_count == 0:
+            continue  # 提出がない場合はスキップ
+
+        if len(user_final_submissions) == 2:
+            for submission in user_final_submissions.to_dict("records"):
+                submission["submission_count"] = submission_count
+                leaderboard_data.append(submission)
+        elif len(user_final_submissions) == 1:
+            final_submission = user_final_submissions.iloc[0].to_dict()
+            final_submission["submission_count"] = submission_count
+            leaderboard_data.append(final_submission)
+
+            other_submissions = user_submissions[
+                user_submissions["submission_id"] != final_submission["submission_id"]
+            ]
+            if len(other_submissions) > 0:
+                best_other_submission = other_submissions.loc[
+                    _best_index(
+                        other_submissions["public_score"], optimization_direction
+                    )
+                ].to_dict()
+                best_other_submission["submission_count"] = submission_count
+                leaderboard_data.append(best_other_submission)
+        else:
+            best_submissions = _best_n(
+                user_submissions, "public_score", 2, optimization_direction
+            )
+            for submission in best_submissions.to_dict("records"):
+                submission["submission_count"] = submission_count
+                leaderboard_data.append(submission)
+
+    return pd.DataFrame(leaderboard_data)
+
+
+def create_optimized_public_score_leaderboard(users_df, submissions_df):
+    """最適化方向に基づいて最適化されたpublic_scoreのリーダーボードを作成する"""
+    optimization_direction = get_optimization_direction()
+    leaderboard_data = []
+
+    if optimization_direction == "max":
+        sort_ascending = False
+        rank_ascending = False
+    elif optimization_direction == "min":
+        sort_ascending = True
+        rank_ascending = True
+    else:
+        raise ValueError("optimization_direction must be either 'max' or 'min'")
+
+    for _, user in users_df.iterrows():
+        user_id = user["user_id"]
+        user_submissions = submissions_df[submissions_df["user_id"] == user_id]
+
+        submission_count = len(user_submissions)
+
+        if submission_count > 0:
+            # 提出がある場合、最適なpublic_scoreを持つものを選ぶ
+            best_submission = user_submissions.loc[
+                _best_index(user_submissions["public_score"], optimization_direction)
+            ].to_dict()
+            best_submission["submission_count"] = submission_count
+            leaderboard_data.append(best_submission)
+
+    if len(leaderboard_data) == 0:
+        logger.warning("No submissions found for public_score leaderboard")
+        return pd.DataFrame()
+    # public_scoreでソート
+    leaderboard_df = (
+        pd.DataFrame(leaderboard_data)
+        .sort_values("public_score", ascending=sort_ascending)
+        .reset_index(drop=True)
+    )
+
+    # ランクを追加
+    leaderboard_df["rank"] = (
+        leaderboard_df["public_score"]
+        .rank(method="min", ascending=rank_ascending)
+        .astype(int)
+    )
+
+    return leaderboard_df
+
+
+def get_team_name_user_df():
+    conn_main = sqlite3.connect(get_submission_db_path())
+    c_main = conn_main.cursor()
+    c_main.execute("SELECT user_id, team_name FROM team_users")
+    team_users_df = pd.DataFrame(c_main.fetchall(), columns=["user_id", "team_name"])
+    conn_main.close()
+    return team_users_df
+
+
+def generate_leaderboard():
+    optimization_direction = get_optimization_direction()
+    users_df, submissions_df, final_submissions_df = fetch_data_from_db()
+    team_users_df = get_team_name_user_df()
+
+    leaderboard_df = prepare_leaderboard_data(
+        users_df, submissions_df, final_submissions_df
+    )
+    public_leaderboard_df = create_optimized_public_score_leaderboard(
+        users_df=users_df, submissions_df=submissions_df
+    )
+
+    # ユーザー名とチーム名を追加
+    leaderboard_df = leaderboard_df.merge(
+        users_df[["user_id", "username"]], on="user_id", how="left"
+    ).merge(team_users_df, on="user_id", how="left")
+
+    if optimization_direction == "max":
+        leaderboard = (
+            leaderboard_df.groupby("user_id")
+            .agg(
+                {
+                    "username": "first",
+                    "team_name": "first",
+                    "public_score": "max",
+                    "private_score": "max",
+                    "submission_count": "max",
+                    "timestamp": "min",  # 最も早いタイムスタンプを取得
+                }
+            )
+            .reset_index()
+        )
+        leaderboard = leaderboard.sort_values(
+            ["private_score", "timestamp"], ascending=[False, True]
+        )
+    else:  # min
+        leaderboard = (
+            leaderboard_df.groupby("user_id")
+            .agg(
+                {
+                    "username": "first",
+                    "team_name": "first",
+                    "public_score": "min",
+                    "private_score": "min",
+                    "submission_count": "max",
+                    "timestamp": "min",  # 最も早いタイムスタンプを取得
+                }
+            )
+            .reset_index()
+        )
+        leaderboard = leaderboard.sort_values(
+            ["private_score", "timestamp"], ascending=[True, True]
+        )
+
+    leaderboard["順位"] = range(1, len(leaderboard) + 1)
+
+    # public_leaderboard_dfの順位を取得
+    public_ranks = public_leaderboard_df.set_index("user_id")["rank"].to_dict()
+
+    # 順位変動を計算
+    leaderboard["public_rank"] = leaderboard["user_id"].map(public_ranks)
+    leaderboard["順位変動"] = leaderboard["public_rank"] - leaderboard["順位"]
+
+    leaderboard = leaderboard.rename(
+        columns={
+            "username": "ユーザー",
+            "team_name": "チーム名",
+            "public_score": "Public スコア",
+            "private_score": "Private スコア",
+            "submission_count": "提出回数",
+        }
+    )
+    leaderboard["Public スコア"] = leaderboard["Public スコア"].round(3)
+    leaderboard["Private スコア"] = leaderboard["Private スコア"].round(3)
+    leaderboard = leaderboard[
+        [
+            "順位変動",
+            "順位",
+            "チーム名",
+            "Private スコア",
+            "Public スコア",
+            "提出回数",
+        ]
+    ]
+
+    return leaderboard
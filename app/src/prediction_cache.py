@@ -0,0 +1,98 @@
+"""提出された予測値のキャッシュ
+
+登録された提出の予測値を、正解データ(answer_key)のids順に並べたfloat32の.npyとして保存し、
+submissions.prediction_path から参照する。再採点やブレンド、提出間の相関などの分析では
+CSVを読み直さずに np.load(mmap_mode="r") で読み込める。
+
+<database_dir>/predictions/<user_id>/<uuid>.npy
+
+test.csvが差し替えられて行数が変わったキャッシュは読み込まない。
+"""
+
+import os
+import sqlite3
+import tempfile
+import uuid
+
+from app.src.answer_key import load_answer_key
+from app.src.competition import get_current_competition
+from app.src.lazy_import import lazy_import
+from app.src.logger_config import get_logger
+
+np = lazy_import("numpy")
+
+logger = get_logger(__name__)
+
+PREDICTION_DTYPE = "float32"
+
+
+def save_prediction_cache(predictions, user_id, competition=None):
+    """ids順に並んだ予測値を保存し、submissions.prediction_pathに入れるパスを返す"""
+    if competition is None:
+        competition = get_current_competition()
+    user_dir = os.path.join(competition.prediction_cache_dir, str(user_id))
+    os.makedirs(user_dir, exist_ok=True)
+    prediction_path = os.path.join(user_dir, f"{uuid.uuid4().hex}.npy")
+
+    # 書きかけのファイルを読まれないよう、一時ファイルに書いてから置き換える
+    fd, tmp_path = tempfile.mkstemp(prefix=".prediction_", suffix=".npy", dir=user_dir)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, np.asarray(predictions, dtype=PREDICTION_DTYPE))
+        os.replace(tmp_path, prediction_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return prediction_path
+
+
+def remove_prediction_cache(prediction_path):
+    if prediction_path and os.path.exists(prediction_path):
+        os.remove(prediction_path)
+
+
+def load_prediction_cache(prediction_path, competition=None):
+    """キャッシュをメモリマップで読み込む。存在しないか正解データと行数が合わなければNone"""
+    if not prediction_path or not os.path.exists(prediction_path):
+        return None
+    if competition is None:
+        competition = get_current_competition()
+    predictions = np.load(prediction_path, mmap_mode="r")
+    if len(predictions) != len(load_answer_key(competition)):
+        logger.warning(f"Stale prediction cache: {prediction_path}")
+        return None
+    return predictions
+
+
+def get_prediction_paths(submission_ids, competition=None):
+    """{submission_id: prediction_path} を返す。キャッシュのない提出は含まれない"""
+    if competition is None:
+        competition = get_current_competition()
+    submission_ids = [int(submission_id) for submission_id in submission_ids]
+    if not submission_ids:
+        return {}
+    conn = sqlite3.connect(competition.submission_db_path)
+    rows = conn.execute(
+        """
+        SELECT submission_id, prediction_path FROM submissions
+        WHERE prediction_path IS NOT NULL AND submission_id IN ({})
+    """.format(",".join(["?"] * len(submission_ids))),
+        submission_ids,
+    ).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def load_submission_predictions(submission_ids, competition=None):
+    """{submission_id: 予測値(メモリマップ)} を返す。読み込めない提出は含まれない"""
+    if competition is None:
+        competition = get_current_competition()
+    predictions = {}
+    for submission_id, prediction_path in get_prediction_paths(
+        submission_ids, competition
+    ).items():
+        cached = load_prediction_cache(prediction_path, competition)
+        if cached is not None:
+            predictions[submission_id] = cached
+    return predictions
@@ -0,0 +1,130 @@
+"""ユーザーごとのスコアの推移
+
+提出ページのグラフ用に、提出のPublic scoreを時系列で取得してLTTB
+(Largest-Triangle-Three-Buckets)で一定の点数まで間引く。
+ベストスコアの推移は更新があった点だけを返すので、提出数が多くても点数は増えにくい。
+提出履歴の表はSQLのLIMIT/OFFSETでページ単位に取得する。
+"""
+
+import sqlite3
+from datetime import datetime
+
+from app.src.competition import get_current_competition
+from app.src.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# グラフに送る提出の点数の上限
+MAX_PROGRESSION_POINTS = 500
+
+
+def lttb_downsample(x, y, threshold):
+    """LTTBで (x, y) をthreshold点に間引き、残す点のインデックスを返す
+
+    最初と最後の点は必ず残る。各バケットからは、前に選んだ点と次のバケットの平均点と
+    作る三角形の面積が最大になる点を選ぶため、外れ値や急な変化が残りやすい。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # 最初と最後の点を除いた範囲をthreshold - 2個のバケットに分ける
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_stop = n - 1, n
+        next_x = x[next_start:next_stop].mean()
+        next_y = y[next_start:next_stop].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def get_score_progression(user_id, max_points=MAX_PROGRESSION_POINTS, competition=None):
+    """(間引いた提出の点, ベストスコアが更新された点) のDataFrameを返す
+
+    どちらも submitted_at(datetime) と public_score の列を持つ。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    optimization_direction = competition.config["competition"]["optimization_direction"]
+
+    # (user_id, submitted_at) のインデックスで時系列順に読む
+    conn = sqlite3.connect(competition.submission_db_path)
+    rows = conn.execute(
+        """
+        SELECT submitted_at, public_score FROM submissions
+        WHERE user_id = ? AND submitted_at IS NOT NULL
+        ORDER BY submitted_at, submission_id
+    """,
+        (user_id,),
+    ).fetchall()
+    conn.close()
+
+    columns = ["submitted_at", "public_score"]
+    if not rows:
+        return pd.DataFrame(columns=columns), pd.DataFrame(columns=columns)
+
+    submitted_at = np.array([row[0] for row in rows], dtype=np.int64)
+    scores = np.array([row[1] for row in rows], dtype=np.float64)
+
+    if optimization_direction == "max":
+        best_so_far = np.fmax.accumulate(scores)
+    else:
+        best_so_far = np.fmin.accumulate(scores)
+    improved = np.concatenate([[True], best_so_far[1:] != best_so_far[:-1]])
+    # 最後の時点までベストスコアの線を伸ばす
+    improved[-1] = True
+
+    selected = lttb_downsample(submitted_at, scores, max_points)
+    points = pd.DataFrame(
+        {"submitted_at": submitted_at[selected], "public_score": scores[selected]}
+    )
+    best = pd.DataFrame(
+        {"submitted_at": submitted_at[improved], "public_score": best_so_far[improved]}
+    )
+    local_timezone = datetime.now().astimezone().tzinfo
+    for df in (points, best):
+        df["submitted_at"] = (
+            pd.to_datetime(df["submitted_at"], unit="s", utc=True)
+            .dt.tz_convert(local_timezone)
+            .dt.tz_localize(None)
+        )
+    return points, best
+
+
+def get_submission_history_page(user_id, page, page_size, competition=None):
+    """提出履歴を新しい順にpageページ目(1始まり)だけ返す"""
+    if competition is None:
+        competition = get_current_competition()
+    conn = sqlite3.connect(competition.submission_db_path)
+    query = """
+        SELECT s.user_submission_id, s.timestamp, s.filename, u.username,
+               s.public_score, s.private_score
+        FROM submissions s
+        JOIN users u ON s.user_id = u.user_id
+        WHERE s.user_id = ?
+        ORDER BY s.submitted_at DESC, s.submission_id DESC
+        LIMIT ? OFFSET ?
+    """
+    history = pd.read_sql_query(
+        query, conn, params=(user_id, page_size, (page - 1) * page_size)
+    )
+    conn.close()
+    return history
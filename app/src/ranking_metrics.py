@@ -0,0 +1,230 @@
+"""ランキング・多クラス分類の評価指標
+
+answer_columnが1つの数値ではないコンペティション用の評価指標。
+metricは "map@5"、"ndcg@10"、"top_k_accuracy@3"、"multi_logloss" のように指定する。
+
+- map@K / ndcg@K / top_k_accuracy@K: 正解と予測は空白区切りの項目のリスト
+  (例: "12 45 7")。予測は先頭ほど上位とみなし、先頭のK個を評価する。
+- multi_logloss: 正解はクラス名、予測は class_columns で指定したクラスごとの確率の列。
+
+項目のリストは (行ごとの開始位置 offsets, 全行をつなげた項目のコード values) の
+形で持ち、行ごとのループを使わずにNumPyのセグメント演算(bincount, cumsum)で
+行ごとのスコアを計算する。
+行ごとのスコアを1回だけ計算し、Public/Privateのマスクで平均を取る。
+"""
+
+from dataclasses import dataclass
+
+from app.src.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+pa = lazy_import("pyarrow")
+pc = lazy_import("pyarrow.compute")
+
+LIST_METRICS = {"map", "ndcg", "top_k_accuracy"}
+CLASS_METRICS = {"multi_logloss"}
+# 1行の正解の項目数がこれ以下なら、正解を行列に詰めて列ごとに照合する
+# (それより多ければ二分探索)
+DENSE_MATCH_MAX_ITEMS = 32
+# multi_loglossで確率を丸める範囲
+LOGLOSS_EPS = 1e-15
+
+
+@dataclass(frozen=True)
+class ItemLists:
+    """行ごとの項目のリスト。values[offsets[i]:offsets[i + 1]] がi行目
+
+    項目は正解データの語彙のコードで表し、正解に出てこない項目は-1とする。
+    """
+
+    values: "np.ndarray"
+    offsets: "np.ndarray"
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def take(self, order):
+        """行をorderの順に並べ替えたItemListsを返す"""
+        lengths = self.lengths[order]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # 並べ替え後の各項目が元の配列の何番目か
+        source = np.repeat(self.offsets[:-1][order] - offsets[:-1], lengths)
+        source += np.arange(offsets[-1], dtype=np.int64)
+        return ItemLists(values=self.values[source], offsets=offsets)
+
+
+def parse_metric(metric):
+    """ "map@5" → ("map", 5)。@Kのない評価指標は (metric, None)"""
+    name, _, k = metric.partition("@")
+    if name in LIST_METRICS:
+        if not k.isdigit() or int(k) <= 0:
+            raise ValueError(f"{name} requires a positive cutoff, e.g. {name}@5")
+        return name, int(k)
+    return metric, None
+
+
+def get_answer_format(metric):
+    """正解と予測の形式
+
+    "list"(項目のリスト)、"class"(クラスごとの確率)、"scalar"(数値) のいずれか。
+    """
+    name, _ = parse_metric(metric)
+    if name in LIST_METRICS:
+        return "list"
+    if name in CLASS_METRICS:
+        return "class"
+    return "scalar"
+
+
+def split_item_lists(texts):
+    """空白区切りの文字列の列を (offsets, 全行をつなげた項目のpyarrow配列) に分ける"""
+    texts = pc.fill_null(pa.array(texts, type=pa.string(), from_pandas=True), "")
+    lists = pc.utf8_split_whitespace(texts)
+    offsets = lists.offsets.to_numpy().astype(np.int64)
+    items = lists.flatten()
+    # 空の文字列や前後の空白からできる空の項目を除く
+    keep = pc.greater(pc.utf8_length(items), 0).to_numpy(zero_copy_only=False)
+    if not keep.all():
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        offsets = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(np.bincount(rows[keep], minlength=len(offsets) - 1), out=offsets[1:])
+        items = items.filter(pa.array(keep))
+    return offsets, items
+
+
+def encode_answer_lists(texts):
+    """正解の項目のリストをコードに変換し、(ItemLists, 語彙の配列) を返す
+
+    行内で重複する項目は1つにまとめる。
+    """
+    offsets, items = split_item_lists(texts)
+    encoded = items.dictionary_encode()
+    codes = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+    vocab = encoded.dictionary.to_numpy(zero_copy_only=False).astype(str)
+
+    rows = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+    keys = np.sort(rows * max(len(vocab), 1) + codes)
+    keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+    rows, codes = np.divmod(keys, max(len(vocab), 1))
+    offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(offsets) - 1), out=offsets[1:])
+    return ItemLists(values=codes.astype(np.int32), offsets=offsets), vocab
+
+
+def encode_prediction_lists(texts, vocab):
+    """予測の項目のリストを正解の語彙のコードに変換する。語彙にない項目は-1"""
+    offsets, items = split_item_lists(texts)
+    codes = pc.index_in(items, value_set=vocab)
+    codes = pc.fill_null(codes, -1).to_numpy(zero_copy_only=False).astype(np.int32)
+    return ItemLists(values=codes, offsets=offsets)
+
+
+def _hits_at_k(predicted, actual, k, vocab_size):
+    """予測の先頭K個について (行番号, 行内の位置, 正解かどうか) を返す
+
+    同じ行で2回目以降に出てきた項目は正解と数えない。
+    """
+    lengths = predicted.lengths
+    rows = np.repeat(np.arange(len(predicted), dtype=np.int64), lengths)
+    positions = np.arange(len(predicted.values), dtype=np.int64) - np.repeat(
+        predicted.offsets[:-1], lengths
+    )
+    within_k = positions < k
+    rows, positions = rows[within_k], positions[within_k]
+    codes = predicted.values[within_k].astype(np.int64)
+
+    max_actual = int(actual.lengths.max(initial=0))
+    if max_actual <= DENSE_MATCH_MAX_ITEMS:
+        # 正解を (行数 x 最大の正解数) の行列に詰め、
+        # 予測の行番号で引いて列ごとに比べる。
+        # 予測は行番号の順に並んでいるため、行列の読み出しはほぼ連続になる
+        dense = np.full((len(actual), max(max_actual, 1)), -2, dtype=np.int32)
+        actual_rows = np.repeat(np.arange(len(actual), dtype=np.int64), actual.lengths)
+        dense[
+            actual_rows,
+            np.arange(len(actual.values))
+            - np.repeat(actual.offsets[:-1], actual.lengths),
+        ] = actual.values
+        hits = np.zeros(len(codes), dtype=bool)
+        for column in range(max_actual):
+            hits |= dense[rows, column] == codes
+    else:
+        # (行, 項目) を1つの整数にする。正解は行ごとに項目のコード順に並べてあるため、
+        # 正解のキーはソート済みで、予測をソートせずに二分探索で照合できる
+        width = vocab_size + 1
+        keys = rows * width + codes + 1
+        actual_rows = np.repeat(np.arange(len(actual), dtype=np.int64), actual.lengths)
+        actual_keys = actual_rows * width + actual.values.astype(np.int64) + 1
+        found = np.searchsorted(actual_keys, keys)
+        found[found == len(actual_keys)] = 0
+        hits = actual_keys[found] == keys
+    hits &= codes >= 0
+
+    # 重複の確認は正解した項目だけで行う
+    hit_index = np.flatnonzero(hits)
+    hit_keys = rows[hit_index] * (vocab_size + 1) + codes[hit_index]
+    first = np.unique(hit_keys, return_index=True)[1]
+    hits[hit_index] = False
+    hits[hit_index[first]] = True
+    return rows, positions, hits
+
+
+def average_precision_at_k(predicted, actual, k, vocab_size):
+    """行ごとのAP@K (Kaggleのapkと同じ定義。正解のない行は0)"""
+    rows, positions, hits = _hits_at_k(predicted, actual, k, vocab_size)
+    n = len(actual)
+    # 行ごとの累積正解数: 全体の累積和から、その行の開始時点の累積和を引く
+    cumulative = np.cumsum(hits, dtype=np.int64)
+    kept = np.minimum(predicted.lengths, k)
+    before = np.concatenate([[0], cumulative])[np.cumsum(kept) - kept]
+    hit_index = np.flatnonzero(hits)
+    hit_rows = rows[hit_index]
+    precision = (cumulative[hit_index] - before[hit_rows]) / (positions[hit_index] + 1)
+    total = np.bincount(hit_rows, weights=precision, minlength=n)
+    denominator = np.minimum(actual.lengths, k)
+    return np.divide(total, denominator, out=np.zeros(n), where=denominator > 0)
+
+
+def ndcg_at_k(predicted, actual, k, vocab_size):
+    """行ごとのNDCG@K (関連度は正解なら1。正解のない行は0)"""
+    rows, positions, hits = _hits_at_k(predicted, actual, k, vocab_size)
+    n = len(actual)
+    discounts = 1.0 / np.log2(np.arange(k, dtype=np.float64) + 2)
+    dcg = np.bincount(rows[hits], weights=discounts[positions[hits]], minlength=n)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[np.minimum(actual.lengths, k)]
+    return np.divide(dcg, ideal, out=np.zeros(n), where=ideal > 0)
+
+
+def top_k_accuracy(predicted, actual, k, vocab_size):
+    """行ごとに、予測の先頭K個に正解が含まれていれば1"""
+    rows, _, hits = _hits_at_k(predicted, actual, k, vocab_size)
+    return (np.bincount(rows[hits], minlength=len(actual)) > 0).astype(np.float64)
+
+
+def multiclass_logloss(probabilities, labels):
+    """行ごとの多クラスlogloss。確率は行ごとに合計1に正規化する"""
+    probabilities = np.clip(
+        np.asarray(probabilities, dtype=np.float64), LOGLOSS_EPS, 1 - LOGLOSS_EPS
+    )
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    labels = np.asarray(labels, dtype=np.int64)
+    return -np.log(np.take_along_axis(probabilities, labels[:, None], axis=1)[:, 0])
+
+
+def calculate_row_scores(predictions, answer_key, metric):
+    """ids順に並んだ予測の行ごとのスコアを返す (平均が全体のスコアになる)"""
+    name, k = parse_metric(metric)
+    if name in CLASS_METRICS:
+        return multiclass_logloss(predictions, answer_key.target)
+    actual = ItemLists(values=answer_key.target, offsets=answer_key.target_offsets)
+    vocab_size = len(answer_key.vocab)
+    if name == "map":
+        return average_precision_at_k(predictions, actual, k, vocab_size)
+    if name == "ndcg":
+        return ndcg_at_k(predictions, actual, k, vocab_size)
+    return top_k_accuracy(predictions, actual, k, vocab_size)
@@ -0,0 +1,256 @@
+"""アップロードされた提出ファイルの保持と圧縮
+
+<submissions_dir>/<user_id>/ に溜まる提出CSVのうち、一定日数より古いものを
+ユーザーごとのzip (<user_id>/archive.zip) に追記して元のファイルを削除する。
+最終提出に選ばれた提出と、ユーザーごとのPublic score上位の提出は圧縮せずに残す。
+圧縮したファイルは archived_submission_files に記録し、open_submission_file で読める。
+
+採点の読み書きと競合しないよう、読み込む速度をバイト数で制限し、直前に提出があった間は待つ。
+ユーザーごとの使用量は user_storage に記録する。
+"""
+
+import os
+import sqlite3
+import time
+import zipfile
+from collections import defaultdict
+from datetime import datetime
+
+from app.src.competition import get_current_competition
+from app.src.database import TIMESTAMP_FORMAT
+from app.src.lazy_import import lazy_import
+from app.src.logger_config import get_logger
+from app.src.submission import get_submission_file_name
+
+pd = lazy_import("pandas")
+
+logger = get_logger(__name__)
+
+ARCHIVE_FILENAME = "archive.zip"
+# これより古い提出ファイルを圧縮する(日)
+RETENTION_DAYS = 7
+# ユーザーごとに圧縮せずに残すPublic score上位の提出数
+RETENTION_KEEP_TOP_K = 5
+# 圧縮のために読み込む速度の上限(バイト/秒)
+RETENTION_MAX_BYTES_PER_SEC = 20 * 1024 * 1024
+# 最後の提出からこの秒数が経つまでは、採点中とみなして圧縮を待つ
+RETENTION_BUSY_WINDOW_SEC = 10
+RETENTION_BUSY_SLEEP_SEC = 5
+
+
+def _get_hot_file_names(conn, competition, keep_top_k):
+    """ユーザーごとに圧縮しないファイル名の集合を返す"""
+    optimization_direction = competition.config["competition"]["optimization_direction"]
+    order = "DESC" if optimization_direction == "max" else "ASC"
+    rows = conn.execute(
+        f"""
+        SELECT user_id, filename, timestamp, user_submission_id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY user_id ORDER BY public_score {order}
+               ) AS score_rank
+        FROM submissions ORDER BY submission_id
+    """
+    ).fetchall()
+    final_picks = set(
+        conn.execute(
+            "SELECT user_id, user_submission_id FROM final.final_submissions"
+        ).fetchall()
+    )
+
+    hot = defaultdict(set)
+    # 同じユーザー・時刻・ファイル名の提出は登録順に連番付きで保存されている
+    duplicates = defaultdict(int)
+    for user_id, filename, timestamp, user_submission_id, score_rank in rows:
+        n = duplicates[(user_id, filename, timestamp)]
+        duplicates[(user_id, filename, timestamp)] += 1
+        if score_rank <= keep_top_k or (user_id, user_submission_id) in final_picks:
+            hot[user_id].add(get_submission_file_name(user_id, filename, timestamp, n))
+    return hot
+
+
+def _wait_while_busy(conn):
+    """直前に提出が登録されていれば、採点のI/Oが落ち着くまで待つ"""
+    while True:
+        row = conn.execute(
+            "SELECT submitted_at FROM submissions ORDER BY submission_id DESC LIMIT 1"
+        ).fetchone()
+        if row is None or row[0] is None:
+            return
+        if time.time() - row[0] >= RETENTION_BUSY_WINDOW_SEC:
+            return
+        time.sleep(RETENTION_BUSY_SLEEP_SEC)
+
+
+def update_user_storage(conn, user_dir, user_id):
+    """ユーザーのディレクトリの使用量を数えてuser_storageに記録する"""
+    hot_files, hot_bytes, archive_bytes = 0, 0, 0
+    for entry in os.scandir(user_dir):
+        if not entry.is_file():
+            continue
+        if entry.name == ARCHIVE_FILENAME:
+            archive_bytes = entry.stat().st_size
+        elif entry.name.endswith(".csv"):
+            hot_files += 1
+            hot_bytes += entry.stat().st_size
+    archived_files, archived_bytes = conn.execute(
+        """
+        SELECT COUNT(*), COALESCE(SUM(original_size), 0)
+        FROM archived_submission_files WHERE user_id = ?
+    """,
+        (user_id,),
+    ).fetchone()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO user_storage VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                hot_files,
+                hot_bytes,
+                archived_files,
+                archived_bytes,
+                archive_bytes,
+                datetime.now().strftime(TIMESTAMP_FORMAT),
+            ),
+        )
+
+
+def find_compaction_candidates(user_dir, hot_file_names, cutoff):
+    """ユーザーの提出ファイルのうち、hot_file_names以外でcutoffより古いもののパス"""
+    return sorted(
+        entry.path
+        for entry in os.scandir(user_dir)
+        if entry.is_file()
+        and entry.name.endswith(".csv")
+        and entry.name not in hot_file_names
+        and entry.stat().st_mtime < cutoff
+    )
+
+
+def compact_user_files(conn, user_dir, user_id, candidates, max_bytes_per_sec):
+    """candidatesのファイルをユーザーのzipに移す
+
+    (圧縮したファイル数, バイト数) を返す。
+    """
+    if not candidates:
+        return 0, 0
+
+    archived = []
+    archived_at = datetime.now().strftime(TIMESTAMP_FORMAT)
+    with zipfile.ZipFile(
+        os.path.join(user_dir, ARCHIVE_FILENAME), "a", zipfile.ZIP_DEFLATED
+    ) as archive:
+        existing = set(archive.namelist())
+        for path in candidates:
+            _wait_while_busy(conn)
+            started = time.perf_counter()
+            name = os.path.basename(path)
+            size = os.path.getsize(path)
+            if name not in existing:
+                archive.write(path, name)
+            archived.append((user_id, name, ARCHIVE_FILENAME, size, archived_at))
+            # 読み込んだバイト数に応じて休み、ディスクの帯域を使い切らない
+            time.sleep(
+                max(0.0, size / max_bytes_per_sec - (time.perf_counter() - started))
+            )
+
+    # zipを閉じて書き込みが終わってから記録し、元のファイルを削除する
+    with zipfile.ZipFile(os.path.join(user_dir, ARCHIVE_FILENAME)) as archive:
+        names = set(archive.namelist())
+    archived = [row for row in archived if row[1] in names]
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO archived_submission_files VALUES (?, ?, ?, ?, ?)",
+            archived,
+        )
+    for _, name, _, _, _ in archived:
+        os.remove(os.path.join(user_dir, name))
+    return len(archived), sum(row[3] for row in archived)
+
+
+def run_retention(
+    days=RETENTION_DAYS,
+    keep_top_k=RETENTION_KEEP_TOP_K,
+    max_bytes_per_sec=RETENTION_MAX_BYTES_PER_SEC,
+    dry_run=False,
+    competition=None,
+):
+    """全ユーザーの古い提出ファイルを圧縮し、{user_id: (ファイル数, バイト数)} を返す"""
+    if competition is None:
+        competition = get_current_competition()
+    if not os.path.isdir(competition.submissions_dir):
+        return {}
+    cutoff = time.time() - days * 24 * 3600
+
+    conn = sqlite3.connect(competition.submission_db_path, timeout=30)
+    try:
+        conn.execute(
+            "ATTACH DATABASE ? AS final", (competition.final_submission_db_path,)
+        )
+        hot = _get_hot_file_names(conn, competition, keep_top_k)
+        results = {}
+        for entry in sorted(
+            os.scandir(competition.submissions_dir), key=lambda e: e.name
+        ):
+            if not entry.is_dir() or not entry.name.isdigit():
+                continue
+            user_id = int(entry.name)
+            candidates = find_compaction_candidates(entry.path, hot[user_id], cutoff)
+            if dry_run:
+                results[user_id] = (
+                    len(candidates),
+                    sum(os.path.getsize(path) for path in candidates),
+                )
+                continue
+            results[user_id] = compact_user_files(
+                conn, entry.path, user_id, candidates, max_bytes_per_sec
+            )
+            update_user_storage(conn, entry.path, user_id)
+    finally:
+        conn.close()
+    archived_files = sum(files for files, _ in results.values())
+    logger.info(f"Retention: archived {archived_files} files in {len(results)} users")
+    return results
+
+
+def open_submission_file(user_id, file_name, competition=None):
+    """提出ファイルをバイナリモードで開く。圧縮済みならzipから読む"""
+    if competition is None:
+        competition = get_current_competition()
+    user_dir = os.path.join(competition.submissions_dir, str(user_id))
+    path = os.path.join(user_dir, file_name)
+    if os.path.exists(path):
+        return open(path, "rb")
+
+    conn = sqlite3.connect(competition.submission_db_path)
+    row = conn.execute(
+        """
+        SELECT archive_name FROM archived_submission_files
+        WHERE user_id = ? AND file_name = ?
+    """,
+        (user_id, file_name),
+    ).fetchone()
+    conn.close()
+    if row is None:
+        raise FileNotFoundError(path)
+    # zipを閉じても、返したファイルが閉じられるまでは読める
+    with zipfile.ZipFile(os.path.join(user_dir, row[0])) as archive:
+        return archive.open(file_name)
+
+
+def get_user_storage(competition=None):
+    """ユーザーごとの使用量 (最後にretentionを実行した時点)"""
+    if competition is None:
+        competition = get_current_competition()
+    conn = sqlite3.connect(competition.submission_db_path)
+    storage = pd.read_sql_query(
+        """
+        SELECT u.username, s.hot_files, s.hot_bytes, s.archived_files,
+               s.archived_bytes, s.archive_bytes, s.updated_at
+        FROM user_storage s
+        JOIN users u ON s.user_id = u.user_id
+        ORDER BY s.hot_bytes + s.archive_bytes DESC
+    """,
+        conn,
+    )
+    conn.close()
+    return storage
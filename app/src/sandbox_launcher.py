@@ -0,0 +1,282 @@
+"""コードコンペティションの提出を隔離して実行するランチャー
+
+app/src/code_execution.py から `python -I sandbox_launcher.py ...` として
+別プロセスで起動する。
+参加者のコードと同じプロセスでimportされないよう、標準ライブラリだけを使う。
+
+1. ユーザー・マウント・ネットワーク・PIDの名前空間を新しく作る
+   (ループバックのみでネットワークは使えない)
+2. 新しいPID名前空間の1番のプロセス(init)をforkする。以降はinitが行う
+3. /tmp を提出専用の空のtmpfsにし、提出の作業ディレクトリを共通のマウント先
+   (--mount-point) に割り当てる。全提出の作業ディレクトリの親 (--jobs-root) は
+   空のtmpfsで隠すため、同時に実行中の他の提出は見えない
+4. 正解データ・DB・認証設定などの --hide のパスを
+   空のtmpfs (ファイルは/dev/null) で隠す
+5. / 以下の全てのマウントを読み取り専用にし、作業ディレクトリと /tmp だけを
+   書き込めるように戻す。/proc はこのPID名前空間のものに置き換え、他のプロセスは見えない
+6. CPU時間・メモリ・ファイルサイズの上限を設定し、
+   作業ディレクトリで提出のスクリプトをforkしてexecする
+
+名前空間の中のuidは0以外 (SANDBOX_UID) にするため、exec後のプロセスは権限を持たず、
+読み取り専用のマウントや隠したマウントを戻すことはできない。
+initは提出のプロセスの終了を待って終了し、残った子プロセスは名前空間ごと止まる。
+隔離の準備に失敗した場合はスクリプトを実行せずに SETUP_FAILED_EXIT_CODE で終了する。
+"""
+
+import argparse
+import ctypes
+import os
+import resource
+import signal
+import sys
+
+SETUP_FAILED_EXIT_CODE = 125
+
+MS_RDONLY = 0x1
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_NOEXEC = 0x8
+MS_BIND = 0x1000
+MS_REC = 0x4000
+MS_PRIVATE = 0x40000
+
+# mount_setattr(2) (Linux 5.12以降)。システムコール番号はx86_64とarm64で共通
+SYS_MOUNT_SETATTR = 442
+AT_FDCWD = -100
+AT_RECURSIVE = 0x8000
+MOUNT_ATTR_RDONLY = 0x1
+
+PRIVATE_TMP_DIR = "/tmp"
+# 名前空間の中のuid/gid。0以外にして、exec後のプロセスに権限を持たせない
+SANDBOX_UID = 65534
+SANDBOX_GID = 65534
+
+
+class MountAttr(ctypes.Structure):
+    _fields_ = [
+        ("attr_set", ctypes.c_uint64),
+        ("attr_clr", ctypes.c_uint64),
+        ("propagation", ctypes.c_uint64),
+        ("userns_fd", ctypes.c_uint64),
+    ]
+
+
+def _raise_errno(target, operation):
+    errno = ctypes.get_errno()
+    raise OSError(errno, f"{operation} {target}: {os.strerror(errno)}")
+
+
+def mount(source, target, fstype, flags, data=None):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if (
+        libc.mount(
+            source.encode() if source else None,
+            target.encode(),
+            fstype.encode() if fstype else None,
+            flags,
+            data.encode() if data else None,
+        )
+        != 0
+    ):
+        _raise_errno(target, "mount")
+
+
+def set_readonly(path, readonly, recursive=False):
+    """pathのマウント(recursiveなら配下の全てのマウント)の読み取り専用を切り替える"""
+    libc = ctypes.CDLL(None, use_errno=True)
+    attr = (
+        MountAttr(attr_set=MOUNT_ATTR_RDONLY)
+        if readonly
+        else MountAttr(attr_clr=MOUNT_ATTR_RDONLY)
+    )
+    if (
+        libc.syscall(
+            SYS_MOUNT_SETATTR,
+            AT_FDCWD,
+            path.encode(),
+            AT_RECURSIVE if recursive else 0,
+            ctypes.byref(attr),
+            ctypes.sizeof(attr),
+        )
+        != 0
+    ):
+        _raise_errno(path, "mount_setattr")
+
+
+def map_ids(pid):
+    """pidのユーザー名前空間のSANDBOX_UID/SANDBOX_GIDに自分のuid/gidだけを割り当てる
+
+    割り当てがないと、名前空間の中で作ったtmpfsにファイルを作れない。
+    root (uid 0) を割り当てるには元の名前空間の権限が要るため、
+    名前空間の外に残ったプロセスから書き込む。
+    """
+    with open(f"/proc/{pid}/setgroups", "w") as f:
+        f.write("deny")
+    with open(f"/proc/{pid}/uid_map", "w") as f:
+        f.write(f"{SANDBOX_UID} {os.getuid()} 1")
+    with open(f"/proc/{pid}/gid_map", "w") as f:
+        f.write(f"{SANDBOX_GID} {os.getgid()} 1")
+
+
+def unshare_namespaces():
+    """ユーザー・マウント・ネットワーク・PIDの名前空間を作り、uid/gidを割り当てる"""
+    ready_read_fd, ready_write_fd = os.pipe()
+    mapper_pid = os.fork()
+    if mapper_pid == 0:
+        os.close(ready_write_fd)
+        # unshareに失敗した場合は何も届かずに閉じられる
+        if not os.read(ready_read_fd, 1):
+            os._exit(0)
+        try:
+            map_ids(os.getppid())
+        except OSError as e:
+            print(f"sandbox setup failed: {e}", file=sys.stderr)
+            os._exit(SETUP_FAILED_EXIT_CODE)
+        os._exit(0)
+
+    os.close(ready_read_fd)
+    try:
+        os.unshare(
+            os.CLONE_NEWUSER | os.CLONE_NEWNS | os.CLONE_NEWNET | os.CLONE_NEWPID
+        )
+        os.write(ready_write_fd, b"1")
+    finally:
+        os.close(ready_write_fd)
+        _, mapper_status = os.waitpid(mapper_pid, 0)
+    if mapper_status != 0:
+        raise OSError("failed to map uid/gid into the user namespace")
+
+
+def isolate(workdir, mount_point, jobs_root, hidden_paths, tmp_size_bytes):
+    """マウント名前空間の中を作業ディレクトリと /tmp 以外は読み取り専用にする
+
+    新しいPID名前空間の中 (init) から呼ぶ。
+    """
+    # 以降のマウントを元の名前空間に伝播させない
+    mount(None, "/", None, MS_REC | MS_PRIVATE)
+    # 作業ディレクトリは /tmp の下にあることが多いため、/tmp を置き換える前に開いておく
+    workdir_fd = os.open(workdir, os.O_PATH | os.O_DIRECTORY)
+    try:
+        mount(
+            "tmpfs",
+            PRIVATE_TMP_DIR,
+            "tmpfs",
+            MS_NOSUID | MS_NODEV,
+            f"size={tmp_size_bytes},mode=1777",
+        )
+        os.makedirs(mount_point, exist_ok=True)
+        mount(f"/proc/self/fd/{workdir_fd}", mount_point, None, MS_BIND)
+    finally:
+        os.close(workdir_fd)
+
+    hidden_flags = MS_RDONLY | MS_NOSUID | MS_NODEV
+    for path in [jobs_root, *hidden_paths]:
+        if os.path.isdir(path):
+            mount("tmpfs", path, "tmpfs", hidden_flags)
+        elif os.path.exists(path):
+            mount("/dev/null", path, None, MS_BIND)
+
+    set_readonly("/", True, recursive=True)
+    set_readonly(PRIVATE_TMP_DIR, False)
+    set_readonly(mount_point, False)
+    # 元の名前空間の /proc からは他のプロセスが見えるため、このPID名前空間のものにする。
+    # コンテナなどでprocをマウントできない場合は /proc ごと隠す
+    proc_flags = MS_NOSUID | MS_NODEV | MS_NOEXEC
+    try:
+        mount("proc", "/proc", "proc", proc_flags)
+    except PermissionError:
+        mount("tmpfs", "/proc", "tmpfs", MS_RDONLY | proc_flags)
+
+
+def set_limits(cpu_seconds, memory_bytes, file_size_bytes):
+    # 上限を超えるとSIGXCPU、それでも止まらなければ1秒後にSIGKILLで止まる
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_size_bytes, file_size_bytes))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def run_init(args, status_fd):
+    """PID名前空間のinitとして隔離を準備し、提出のスクリプトを実行して終了を待つ
+
+    スクリプトの終了ステータスをstatus_fdに書く。
+    """
+    try:
+        isolate(
+            args.workdir,
+            args.mount_point,
+            args.jobs_root,
+            args.hide,
+            args.file_size_bytes,
+        )
+    except OSError as e:
+        print(f"sandbox setup failed: {e}", file=sys.stderr)
+        os._exit(SETUP_FAILED_EXIT_CODE)
+
+    pid = os.fork()
+    if pid == 0:
+        os.close(status_fd)
+        try:
+            set_limits(args.cpu_seconds, args.memory_bytes, args.file_size_bytes)
+            os.chdir(args.mount_point)
+            os.execv(sys.executable, [sys.executable, "-I", args.script])
+        except OSError as e:
+            print(f"sandbox setup failed: {e}", file=sys.stderr)
+        os._exit(SETUP_FAILED_EXIT_CODE)
+
+    # initは孤児になった子プロセスも引き取るため、スクリプトが終わるまで全て回収する
+    while True:
+        waited_pid, status = os.wait()
+        if waited_pid == pid:
+            break
+    os.write(status_fd, str(status).encode())
+    os._exit(0)
+
+
+def exit_like(status):
+    """子プロセスの終了ステータスと同じ終了の仕方をする"""
+    if os.WIFSIGNALED(status):
+        signum = os.WTERMSIG(status)
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if signum not in (signal.SIGKILL, signal.SIGSTOP):
+            signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+    sys.exit(os.waitstatus_to_exitcode(status))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workdir", required=True)
+    parser.add_argument("--mount-point", required=True)
+    parser.add_argument("--jobs-root", required=True)
+    parser.add_argument("--hide", action="append", default=[])
+    parser.add_argument("--cpu-seconds", type=int, required=True)
+    parser.add_argument("--memory-bytes", type=int, required=True)
+    parser.add_argument("--file-size-bytes", type=int, required=True)
+    parser.add_argument("script")
+    args = parser.parse_args()
+
+    try:
+        unshare_namespaces()
+    except OSError as e:
+        print(f"sandbox setup failed: {e}", file=sys.stderr)
+        sys.exit(SETUP_FAILED_EXIT_CODE)
+
+    # unshare後に最初にforkしたプロセスが新しいPID名前空間の1番(init)になる
+    read_fd, write_fd = os.pipe()
+    init_pid = os.fork()
+    if init_pid == 0:
+        os.close(read_fd)
+        run_init(args, write_fd)
+    os.close(write_fd)
+    _, init_status = os.waitpid(init_pid, 0)
+    with os.fdopen(read_fd) as status_file:
+        script_status = status_file.read()
+    if not script_status:
+        # スクリプトを実行する前にinitが終了した
+        exit_like(init_status)
+    exit_like(int(script_status))
+
+
+if __name__ == "__main__":
+    main()
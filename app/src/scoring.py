@@ -0,0 +1,133 @@
+from app.src.answer_key import (
+    PRIVATE_SPLIT_NAME,
+    PUBLIC_SPLIT_NAME,
+    align_predictions,
+    load_answer_key,
+)
+from app.src.competition import get_current_competition
+from app.src.lazy_import import lazy_import
+from app.src.ranking_metrics import calculate_row_scores, get_answer_format
+from app.src.submission_validation import validate_submission
+
+np = lazy_import("numpy")
+
+
+# メトリックを計算する関数（この例ではMSEを使用）
+def calculate_metric(predictions, actual, metric):
+    if metric == "rmse":
+        mse = ((predictions - actual) ** 2).mean()
+        return np.sqrt(mse)
+    elif metric == "mae":
+        return np.abs(predictions - actual).mean()
+    else:
+        raise ValueError("Unsupported metric specified in the configuration.")
+
+
+def calculate_metric_batch(predictions, actual, metric):
+    """(ブレンド数 x 行数) の予測値の各行についてメトリックを計算する"""
+    if metric == "rmse":
+        return np.sqrt(((predictions - actual) ** 2).mean(axis=1))
+    elif metric == "mae":
+        # 大きな行列を何度も確保しないよう、その場で計算する
+        errors = np.subtract(predictions, actual, out=predictions)
+        return np.abs(errors, out=errors).mean(axis=1)
+    else:
+        raise ValueError("Unsupported metric specified in the configuration.")
+
+
+def calculate_row_errors(predictions, actual, metric):
+    """rmse/maeの行ごとの誤差 (二乗誤差・絶対誤差) を返す"""
+    errors = np.asarray(predictions, dtype=np.float64) - actual
+    if metric == "rmse":
+        return np.square(errors, out=errors)
+    elif metric == "mae":
+        return np.abs(errors, out=errors)
+    else:
+        raise ValueError("Unsupported metric specified in the configuration.")
+
+
+def calculate_split_scores(predictions, answer_key, metric):
+    """全ての分割のスコアを分割ラベルの順の配列で返す
+
+    行ごとの誤差(スコア)に重みを掛けて (分割, グループ) の番号ごとに合計し、
+    変換時に計算済みの重みの合計で割って番号ごとのスコアにする。
+    番号ごとのスコアを分割ごとに平均したものが分割のスコアになる
+    (グループがなければ番号は分割そのもの)。重みの合計が0の番号は平均に含めず、
+    行のない分割はNaNになる。
+    """
+    if get_answer_format(metric) == "scalar":
+        row_values = calculate_row_errors(predictions, answer_key.target, metric)
+    else:
+        row_values = calculate_row_scores(predictions, answer_key, metric)
+    if answer_key.weight is not None:
+        row_values = row_values * answer_key.weight
+
+    segment_weight = answer_key.segment_weight
+    totals = np.bincount(
+        answer_key.segment, weights=row_values, minlength=len(segment_weight)
+    )
+    valid = segment_weight > 0
+    segment_scores = np.divide(
+        totals, segment_weight, out=np.zeros(len(totals)), where=valid
+    )
+    if metric == "rmse":
+        segment_scores = np.sqrt(segment_scores)
+
+    num_splits = len(answer_key.splits)
+    segment_split = answer_key.segment_split[valid]
+    split_totals = np.bincount(
+        segment_split, weights=segment_scores[valid], minlength=num_splits
+    )
+    split_counts = np.bincount(segment_split, minlength=num_splits)
+    return np.divide(
+        split_totals,
+        split_counts,
+        out=np.full(num_splits, np.nan),
+        where=split_counts > 0,
+    )
+
+
+def is_plain_mean_scoring(competition=None):
+    """グループや重みのない、分割全体の平均で採点するコンペティションかどうか"""
+    if competition is None:
+        competition = get_current_competition()
+    config = competition.config["competition"]
+    return not config.get("group_column") and not config.get("weight_column")
+
+
+def read_aligned_predictions(uploaded_submit_csv, competition=None):
+    """提出CSVを検証して読み込み、予測値を正解データのids順に並べた配列を返す
+
+    形式に誤りがあれば SubmissionValidationError (ValueErrorの派生クラス) を送出する。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    answer_column = competition.config["competition"]["answer_column"]
+
+    # 正解データはメモリマップで読み込み、プロセス間で共有する
+    answer_key = load_answer_key(competition)
+    submit_df, order = validate_submission(
+        uploaded_submit_csv, answer_key, answer_column
+    )
+    return align_predictions(submit_df, answer_key, answer_column, order)
+
+
+def score_splits(predictions, competition=None):
+    """ids順に並んだ予測値から全ての分割のスコアを計算し、{分割名: スコア} で返す"""
+    if competition is None:
+        competition = get_current_competition()
+    metric = competition.config["competition"]["metric"]
+    answer_key = load_answer_key(competition)
+    scores = calculate_split_scores(predictions, answer_key, metric)
+    return dict(zip(answer_key.splits, scores.tolist()))
+
+
+def score_aligned_predictions(predictions, competition=None):
+    """ids順に並んだ予測値からPublic scoreとPrivate scoreを計算する"""
+    scores = score_splits(predictions, competition)
+    return scores[PUBLIC_SPLIT_NAME], scores[PRIVATE_SPLIT_NAME]
+
+
+def get_public_private_score(uploaded_submit_csv, competition=None):
+    predictions = read_aligned_predictions(uploaded_submit_csv, competition)
+    return score_aligned_predictions(predictions, competition)
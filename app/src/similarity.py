@@ -0,0 +1,216 @@
+"""最終提出どうしの予測値の類似度
+
+Private公開前に、チーム間で予測値を共有・コピーしていないかを確認するための管理者向けの計算。
+予測値キャッシュ(app/src/prediction_cache.py)をメモリマップで読み、
+(提出のブロック x 提出のブロック) のタイルごとに、
+行方向のチャンクの行列積を積み上げて計算する。
+使うメモリは提出数や行数ではなくブロックとチャンクの大きさで決まる。
+
+- correlation: ピアソン相関 (大きいほど似ている)
+- rmsd: 予測値の差の二乗平均平方根 (小さいほど似ている)
+"""
+
+import heapq
+
+from app.src.competition import get_current_competition
+from app.src.lazy_import import lazy_import
+from app.src.leaderboard import (
+    fetch_data_from_db,
+    get_team_name_user_df,
+    prepare_leaderboard_data,
+)
+from app.src.prediction_cache import load_submission_predictions
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+SIMILARITY_METRICS = ["correlation", "rmsd"]
+# 1つのタイルに含める提出の数
+SUBMISSION_BLOCK_SIZE = 128
+# 1回の行列積で読む行数
+ROW_CHUNK_SIZE = 2**16
+# これ以下の提出数なら行列全体も返す (ヒートマップ表示用)
+MAX_FULL_MATRIX_SUBMISSIONS = 300
+
+
+def get_final_submissions_with_predictions(competition=None):
+    """リーダーボードで使われる最終提出と、その予測値(メモリマップ)を返す"""
+    if competition is None:
+        competition = get_current_competition()
+    users_df, submissions_df, final_submissions_df = fetch_data_from_db()
+    final_df = prepare_leaderboard_data(users_df, submissions_df, final_submissions_df)
+    if final_df.empty:
+        return final_df, []
+
+    final_df = (
+        final_df[["submission_id", "user_id", "filename", "public_score"]]
+        .merge(users_df[["user_id", "username"]], on="user_id", how="left")
+        .merge(get_team_name_user_df(), on="user_id", how="left")
+    )
+    # チームに所属していないユーザーは1人のチームとして扱う
+    final_df["team_name"] = final_df["team_name"].fillna(final_df["username"])
+
+    predictions = load_submission_predictions(final_df["submission_id"], competition)
+    final_df = final_df[final_df["submission_id"].isin(predictions)].reset_index(
+        drop=True
+    )
+    return final_df, [predictions[i] for i in final_df["submission_id"]]
+
+
+def _row_means(predictions, num_rows):
+    """各提出の予測値の平均をチャンク単位で計算する"""
+    sums = np.zeros(len(predictions))
+    for start in range(0, num_rows, ROW_CHUNK_SIZE):
+        for i, prediction in enumerate(predictions):
+            sums[i] += np.asarray(
+                prediction[start : start + ROW_CHUNK_SIZE], dtype=np.float64
+            ).sum()
+    return sums / num_rows
+
+
+def _block_gram(predictions, means, rows_i, rows_j, num_rows):
+    """2つのブロックの (meansで中心化した) 予測値の内積をチャンク単位で積み上げる"""
+    means_i = means[rows_i].astype(np.float32)
+    means_j = means[rows_j].astype(np.float32)
+    gram = np.zeros((len(rows_i), len(rows_j)))
+    for start in range(0, num_rows, ROW_CHUNK_SIZE):
+        stop = min(start + ROW_CHUNK_SIZE, num_rows)
+        block_i = np.stack([predictions[i][start:stop] for i in rows_i]).astype(
+            np.float32
+        )
+        block_j = (
+            block_i
+            if rows_i is rows_j
+            else np.stack([predictions[j][start:stop] for j in rows_j]).astype(
+                np.float32
+            )
+        )
+        block_i = block_i - means_i[:, None]
+        block_j = block_j - means_j[:, None]
+        gram += (block_i @ block_j.T).astype(np.float64)
+    return gram
+
+
+def _tile_similarity(gram, norms_i, norms_j, metric, num_rows):
+    """タイルの内積から (類似度, 似ているほど大きい値) を計算する"""
+    if metric == "correlation":
+        denominator = np.sqrt(np.outer(norms_i, norms_j))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            similarity = np.where(denominator > 0, gram / denominator, 0.0)
+        return similarity, similarity
+    squared = norms_i[:, None] + norms_j[None, :] - 2 * gram
+    similarity = np.sqrt(np.maximum(squared, 0) / num_rows)
+    return similarity, -similarity
+
+
+def _push_top_k(heap, values, pair_i, pair_j, top_k):
+    """候補の組 (pair_i, pair_j) のうち、valuesの大きい上位top_k件をヒープに入れる"""
+    if len(values) > top_k:
+        # タイル内の上位top_k件以外はヒープに入らないので先に絞り込む
+        best = np.argpartition(values, -top_k)[-top_k:]
+        pair_i, pair_j, values = pair_i[best], pair_j[best], values[best]
+    for i, j, value in zip(pair_i, pair_j, values):
+        item = (float(value), int(i), int(j))
+        if len(heap) < top_k:
+            heapq.heappush(heap, item)
+        elif item[0] > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+
+def compute_similarity(predictions, groups, metric="correlation", top_k=20):
+    """提出間の類似度を計算し、異なるグループ(チーム)間で最も似ている上位top_k組を返す
+
+    戻り値は (上位の組のリスト [(類似度, i, j)], 行列全体またはNone)。
+    行列全体は提出数がMAX_FULL_MATRIX_SUBMISSIONS以下の場合のみ返す。
+    """
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Unsupported similarity metric: {metric}")
+    num_submissions = len(predictions)
+    if num_submissions == 0:
+        return [], None
+    num_rows = len(predictions[0])
+    groups = np.asarray(groups)
+
+    means = _row_means(predictions, num_rows)
+    if metric == "rmsd":
+        # rmsdは |a|^2 + |b|^2 - 2ab で求める。
+        # 全提出から同じ値を引いても差は変わらないので、
+        # float32での桁落ちを避けるため全体の平均で中心化する
+        means = np.full(num_submissions, means.mean())
+
+    full_matrix = (
+        np.full((num_submissions, num_submissions), np.nan)
+        if num_submissions <= MAX_FULL_MATRIX_SUBMISSIONS
+        else None
+    )
+    # 似ている順に並べるための値を (値, i, j) のヒープで上位top_k件だけ保持する
+    heap = []
+    blocks = [
+        np.arange(start, min(start + SUBMISSION_BLOCK_SIZE, num_submissions))
+        for start in range(0, num_submissions, SUBMISSION_BLOCK_SIZE)
+    ]
+    # 対角のタイルから各提出のノルムを取り出すため、先に対角を計算する
+    diagonal_grams = {}
+    for b, rows in enumerate(blocks):
+        diagonal_grams[b] = _block_gram(predictions, means, rows, rows, num_rows)
+    norms = np.concatenate([np.diag(diagonal_grams[b]) for b in range(len(blocks))])
+
+    for bi, rows_i in enumerate(blocks):
+        for bj in range(bi, len(blocks)):
+            rows_j = blocks[bj]
+            gram = (
+                diagonal_grams[bi]
+                if bi == bj
+                else _block_gram(predictions, means, rows_i, rows_j, num_rows)
+            )
+            similarity, ranking_value = _tile_similarity(
+                gram, norms[rows_i], norms[rows_j], metric, num_rows
+            )
+
+            if full_matrix is not None:
+                full_matrix[np.ix_(rows_i, rows_j)] = similarity
+                full_matrix[np.ix_(rows_j, rows_i)] = similarity.T
+
+            # 同じチームの組と、対角タイルの下三角(重複)を除く
+            candidates = groups[rows_i][:, None] != groups[rows_j][None, :]
+            if bi == bj:
+                candidates &= np.triu(np.ones_like(candidates), k=1).astype(bool)
+            candidate_i, candidate_j = np.nonzero(candidates)
+            _push_top_k(
+                heap,
+                ranking_value[candidate_i, candidate_j],
+                rows_i[candidate_i],
+                rows_j[candidate_j],
+                top_k,
+            )
+
+    pairs = sorted(heap, reverse=True)
+    if metric == "rmsd":
+        pairs = [(-value, i, j) for value, i, j in pairs]
+    return pairs, full_matrix
+
+
+def find_similar_final_submissions(metric="correlation", top_k=20, competition=None):
+    """最終提出のうち、異なるチーム間で最も似ている組をDataFrameで返す"""
+    final_df, predictions = get_final_submissions_with_predictions(competition)
+    if len(predictions) < 2:
+        return pd.DataFrame(), final_df, None
+
+    pairs, full_matrix = compute_similarity(
+        predictions, final_df["team_name"].to_numpy(), metric, top_k
+    )
+    rows = []
+    for value, i, j in pairs:
+        a, b = final_df.iloc[i], final_df.iloc[j]
+        rows.append(
+            {
+                metric: value,
+                "チーム A": a["team_name"],
+                "ユーザー A": a["username"],
+                "提出ID A": a["submission_id"],
+                "チーム B": b["team_name"],
+                "ユーザー B": b["username"],
+                "提出ID B": b["submission_id"],
+            }
+        )
+    return pd.DataFrame(rows), final_df, full_matrix
@@ -0,0 +1,180 @@
+"""提出の採点と登録
+
+Streamlitの提出ページとHTTP API(app/api/server.py)の両方から使う。
+"""
+
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+
+from app.src.answer_key import PRIVATE_SPLIT_NAME, PUBLIC_SPLIT_NAME
+from app.src.competition import get_current_competition
+from app.src.database import (
+    DAILY_SUBMISSION_LIMIT_REACHED,
+    SUBMISSION_INSERTED,
+    SUBMISSION_LIMIT_REACHED,
+    SubmissionRecord,
+    get_submission_counter,
+    insert_submission_within_quota,
+    timestamp_to_epoch,
+)
+from app.src.duplicate_detection import register_submission_signature
+from app.src.logger_config import get_logger
+from app.src.prediction_cache import remove_prediction_cache, save_prediction_cache
+from app.src.ranking_metrics import get_answer_format
+from app.src.scoring import read_aligned_predictions, score_splits
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class SubmissionResult:
+    status: str
+    public_score: float | None = None
+    private_score: float | None = None
+    # 今回の提出より前のベストスコアと提出回数
+    previous_best_score: float | None = None
+    previous_submission_count: int = 0
+    # public/privateを含む全ての分割のスコア {分割名: スコア}
+    split_scores: dict | None = None
+    # 登録した提出のsubmission_id (登録しなかった場合はNone)
+    submission_id: int | None = None
+
+
+def get_submission_limits(competition):
+    """(総提出回数の上限, 1日あたりの上限) を返す。1日あたりは未設定ならNone"""
+    config = competition.config["competition"]
+    max_submissions = config["max_submissions"]
+    if config["stop_final_submission_select"]:
+        max_submissions = 9999
+    return max_submissions, config.get("max_daily_submissions")
+
+
+def create_user_directory(user_id, competition=None):
+    """ユーザーごとのディレクトリを作成する"""
+    if competition is None:
+        competition = get_current_competition()
+    user_dir = os.path.join(competition.submissions_dir, str(user_id))
+    if not os.path.exists(user_dir):
+        os.makedirs(user_dir, exist_ok=True)
+    return user_dir
+
+
+def get_submission_file_name(user_id, filename, timestamp, n=0):
+    """保存するファイル名。同じ名前のファイルがある場合はnで連番を付ける"""
+    save_filename = f"TIMESTAMP_{timestamp}_FILENAME_{filename}_USER_ID{user_id}"
+    return f"{save_filename}_{n}.csv" if n else f"{save_filename}.csv"
+
+
+def get_submission_file_path(user_id, filename, timestamp, competition=None):
+    """提出されたCSVの保存先のパス"""
+    user_dir = create_user_directory(user_id, competition)
+    # APIからは同じファイル名を1秒以内に何度も提出できるため、
+    # 上書きしないよう連番を付ける
+    n = 0
+    while True:
+        file_path = os.path.join(
+            user_dir, get_submission_file_name(user_id, filename, timestamp, n)
+        )
+        if not os.path.exists(file_path):
+            return file_path
+        n += 1
+
+
+def save_submitted_csv(file, user_id, filename, timestamp, competition=None):
+    """提出されたCSVファイルを保存する"""
+    file_path = get_submission_file_path(user_id, filename, timestamp, competition)
+
+    with open(file_path, "wb") as f:
+        f.write(file.getvalue())
+
+    return file_path
+
+
+def _score_or_worst(best_score, competition):
+    """提出がなくベストスコアがNoneの場合は、どのスコアよりも悪い値にする"""
+    if best_score is not None:
+        return best_score
+    optimization_direction = competition.config["competition"]["optimization_direction"]
+    return float("inf") if optimization_direction == "min" else float("-inf")
+
+
+def get_best_public_score(user_id, competition=None):
+    """submission_countersに記録したユーザーのベストのPublicスコア"""
+    if competition is None:
+        competition = get_current_competition()
+    _, _, best_score = get_submission_counter(user_id, int(time.time()), competition)
+    return _score_or_worst(best_score, competition)
+
+
+def register_duplicate_signature(submission_id, user_id, predictions, competition):
+    """登録された提出の重複検出用のシグネチャを保存する。失敗しても提出自体は有効なままにする"""
+    try:
+        register_submission_signature(submission_id, user_id, predictions, competition)
+    except sqlite3.Error:
+        logger.exception("Failed to register submission signature")
+
+
+def score_and_register_submission(
+    user_id, submit_csv, filename, timestamp, competition=None
+):
+    """提出を採点し、提出回数の上限内であれば登録する
+
+    総提出回数・1日あたりの上限に達している場合は採点せずに打ち切る。最終的な上限の判定は
+    insert_submission_within_quota のトランザクション内で行われる。
+    数値の予測値はキャッシュとして保存し、登録されなかった場合は削除する。
+    項目のリストやクラスごとの確率の予測はキャッシュせず、重複検出もしない。
+    """
+    if competition is None:
+        competition = get_current_competition()
+    max_submissions, max_daily_submissions = get_submission_limits(competition)
+
+    submitted_at = timestamp_to_epoch(timestamp) or int(time.time())
+    submission_count, daily_count, best_score = get_submission_counter(
+        user_id, submitted_at, competition
+    )
+    if submission_count >= max_submissions:
+        return SubmissionResult(
+            status=SUBMISSION_LIMIT_REACHED, previous_submission_count=submission_count
+        )
+    if max_daily_submissions is not None and daily_count >= max_daily_submissions:
+        return SubmissionResult(
+            status=DAILY_SUBMISSION_LIMIT_REACHED,
+            previous_submission_count=submission_count,
+        )
+
+    predictions = read_aligned_predictions(submit_csv, competition)
+    split_scores = score_splits(predictions, competition)
+    public_score = split_scores[PUBLIC_SPLIT_NAME]
+    private_score = split_scores[PRIVATE_SPLIT_NAME]
+    prediction_path = None
+    if get_answer_format(competition.config["competition"]["metric"]) == "scalar":
+        prediction_path = save_prediction_cache(predictions, user_id, competition)
+    status, submission_id = insert_submission_within_quota(
+        SubmissionRecord(
+            user_id=user_id,
+            public_score=public_score,
+            private_score=private_score,
+            timestamp=timestamp,
+            filename=filename,
+            prediction_path=prediction_path,
+            split_scores=split_scores,
+        ),
+        max_submissions=max_submissions,
+        max_daily_submissions=max_daily_submissions,
+        competition=competition,
+    )
+    if status == SUBMISSION_INSERTED and prediction_path is not None:
+        register_duplicate_signature(submission_id, user_id, predictions, competition)
+    else:
+        remove_prediction_cache(prediction_path)
+    return SubmissionResult(
+        status=status,
+        public_score=public_score,
+        private_score=private_score,
+        previous_best_score=_score_or_worst(best_score, competition),
+        previous_submission_count=submission_count,
+        split_scores=split_scores,
+        submission_id=submission_id,
+    )
@@ -0,0 +1,344 @@
+"""提出CSVの事前検証
+
+提出CSVを段階的に検証し、形式の誤ったファイルを採点や保存の前に拒否する。
+問題が見つかった段階で打ち切るため、誤ったファイルは全体をパースせずに短時間で返せる。
+
+1. バイト列の走査: 先頭行(ヘッダー)と改行の数だけを見て、必要な列と行数を確認する。
+   CSVとしてのパースはしない。値に引用符がある場合は値の中の改行と区別できないため、
+   行数の確認は次の段階に回す。空白だけの行はパースで読み飛ばされるため、
+   そのような行があれば行数が多すぎる場合の判定も次の段階に回す
+2. 型を指定したパース: 必要な列だけを型を指定して読み込む。型に合わない値が
+   あった場合は、型を指定した列をpyarrowで文字列として読み直し、該当する行を特定する
+3. ベクトル化した検証: 欠損値・負の確率・idの重複・正解データにないidを
+   NumPyでまとめて調べる
+
+問題があれば SubmissionValidationError を送出する。errors には問題のある行を
+先頭から MAX_REPORTED_ERRORS 件まで持つ。
+行番号はヘッダーを1行目とするファイル上の行番号。
+検証を通った場合は読み込んだDataFrameとidの照合結果を返し、採点ではそれをそのまま使う。
+"""
+
+import csv
+import os
+import re
+
+from app.src.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+pa = lazy_import("pyarrow")
+pa_csv = lazy_import("pyarrow.csv")
+pc = lazy_import("pyarrow.compute")
+pd = lazy_import("pandas")
+
+# 報告する問題のある行の最大数
+MAX_REPORTED_ERRORS = 10
+# バイト列を走査する単位
+SCAN_CHUNK_SIZE = 1 << 20
+# 報告に含める値の最大文字数
+MAX_VALUE_LENGTH = 50
+# 型を指定したパースに失敗した場合に、各行の値が数値・整数として読めるかを調べるパターン
+NUMBER_PATTERN = r"^\s*[-+]?((\d+\.?\d*|\.\d+)(e[-+]?\d+)?|inf|infinity|nan)\s*$"
+INTEGER_PATTERN = r"^\s*[-+]?\d+\s*$"
+# パースで読み飛ばされる空白だけの行
+BLANK_LINE_PATTERN = re.compile(rb"\n[ \t\r]*\n")
+
+
+class SubmissionValidationError(ValueError):
+    """提出ファイルの形式の誤り
+
+    errors は {"行": 行番号, "列": 列名, "内容": 問題の説明} のリスト
+    (ファイル全体の問題では空)、error_count は見つかった問題のある行の総数。
+    """
+
+    def __init__(self, message, errors=(), error_count=0):
+        super().__init__(message)
+        self.message = message
+        self.errors = list(errors)
+        self.error_count = error_count
+
+    def report(self, max_lines=MAX_REPORTED_ERRORS):
+        """問題のある行を含む複数行の説明を返す"""
+        lines = [self.message]
+        for error in self.errors[:max_lines]:
+            lines.append(f"{error['行']}行目 {error['列']}: {error['内容']}")
+        if self.error_count > len(lines) - 1:
+            lines.append(f"ほか{self.error_count - (len(lines) - 1)}件")
+        return "\n".join(lines)
+
+
+def _iter_chunks(source):
+    """提出(ファイルパスまたはファイルオブジェクト)のバイト列を先頭から返す"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            while chunk := f.read(SCAN_CHUNK_SIZE):
+                yield chunk
+    elif hasattr(source, "getvalue"):
+        yield source.getvalue()
+    else:
+        source.seek(0)
+        while chunk := source.read(SCAN_CHUNK_SIZE):
+            yield chunk
+
+
+def _rewind(source):
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    return source
+
+
+def scan_csv(source):
+    """CSVをパースせずに (ヘッダーの列名のリスト, データの行数, 引用符があるか,
+    空白だけの行があるか) を返す
+
+    行数は改行の数から数え、末尾の空行は数えない。途中の空白だけの行は行数に含まれるため、
+    そのような行があればデータの行数は返す値より少ないことがある。
+    """
+    head = b""
+    header_found = False
+    newlines = 0
+    has_quote = False
+    has_blank_line = False
+    # チャンクの境界をまたぐ空白だけの行を見つけるため、
+    # 最後の改行以降が空白だけなら次のチャンクに持ち越す
+    line_tail = b""
+    # 末尾の空行を除くため、最後の数バイトを持っておく
+    tail = b""
+    for chunk in _iter_chunks(source):
+        if not header_found:
+            head += chunk
+            header_found = b"\n" in head
+        newlines += chunk.count(b"\n")
+        has_quote = has_quote or b'"' in chunk
+        if not has_blank_line:
+            text = line_tail + chunk
+            has_blank_line = BLANK_LINE_PATTERN.search(text) is not None
+            last_line = text[max(text.rfind(b"\n"), 0) :]
+            line_tail = last_line if not last_line.strip(b" \t\r\n") else b""
+        tail = (tail + chunk[-64:])[-64:]
+
+    stripped = tail.rstrip(b"\r\n \t")
+    if not head.strip():
+        raise SubmissionValidationError("提出ファイルが空です。")
+    lines = newlines - tail[len(stripped) :].count(b"\n") + 1
+
+    try:
+        header_line = head.split(b"\n", 1)[0].decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError:
+        raise SubmissionValidationError(
+            "提出ファイルをUTF-8のCSVとして読み込めません。"
+        ) from None
+    header = next(csv.reader([header_line]), [])
+    return header, lines - 1, has_quote, has_blank_line
+
+
+def _format_value(value):
+    text = str(value)
+    if len(text) > MAX_VALUE_LENGTH:
+        text = text[:MAX_VALUE_LENGTH] + "..."
+    return repr(text)
+
+
+def _add_errors(errors, rows, column, describe):
+    """問題のある行 (0始まりのデータ行の番号の配列) を報告に加え、その件数を返す"""
+    for row in rows[: max(MAX_REPORTED_ERRORS - len(errors), 0)]:
+        errors.append({"行": int(row) + 2, "列": column, "内容": describe(row)})
+    return len(rows)
+
+
+def _raise_if_errors(errors, error_count):
+    if error_count:
+        raise SubmissionValidationError(
+            f"提出ファイルに問題のある値が{error_count}件あります。",
+            errors,
+            error_count,
+        )
+
+
+def _read_columns(source, columns, dtype):
+    try:
+        # 整数の列に欠損値があるとValueErrorの前にキャストの警告が出るため抑える
+        with np.errstate(invalid="ignore"):
+            return pd.read_csv(_rewind(source), usecols=columns, dtype=dtype)
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise SubmissionValidationError(
+            f"提出ファイルをCSVとして読み込めません: {e}"
+        ) from None
+
+
+def _find_invalid_values(source, columns, integer_columns, errors):
+    """型を指定したパースに失敗した列を文字列で読み直し、欠損値と型に合わない値の行を報告する"""
+    try:
+        table = pa_csv.read_csv(
+            _rewind(source),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns,
+                column_types={column: pa.string() for column in columns},
+                strings_can_be_null=True,
+            ),
+        )
+    except pa.ArrowInvalid as e:
+        raise SubmissionValidationError(
+            f"提出ファイルをCSVとして読み込めません: {e}"
+        ) from None
+
+    error_count = 0
+    for column in columns:
+        text = table[column]
+        integer = column in integer_columns
+        pattern = INTEGER_PATTERN if integer else NUMBER_PATTERN
+        missing = text.is_null().to_numpy(zero_copy_only=False)
+        matched = pc.fill_null(
+            pc.match_substring_regex(text, pattern, ignore_case=True), True
+        ).to_numpy(zero_copy_only=False)
+        kind = "整数" if integer else "数値"
+        error_count += _add_errors(
+            errors,
+            np.flatnonzero(missing | ~matched),
+            column,
+            lambda row, text=text, missing=missing, kind=kind: (
+                "値がありません"
+                if missing[row]
+                else f"{kind}ではありません: {_format_value(text[int(row)].as_py())}"
+            ),
+        )
+    return error_count
+
+
+def _check_ids(submit_ids, answer_ids, id_column, errors):
+    """正解データにないidとidの重複の行を報告する
+
+    (件数, 各行のidの正解データでの位置) を返す。
+    行数は正解データと一致しているため、未知のidも重複もなければ全てのidがそろっている。
+    """
+    # 正解データのidはソート済みなので二分探索で照合する
+    positions = np.searchsorted(answer_ids, submit_ids)
+    positions[positions == len(answer_ids)] = 0
+    unknown = np.flatnonzero(answer_ids[positions] != submit_ids)
+    error_count = _add_errors(
+        errors,
+        unknown,
+        id_column,
+        lambda row: f"正解データにないidです: {_format_value(submit_ids[row])}",
+    )
+    if error_count:
+        return error_count, positions
+
+    # 同じ位置に2行以上が対応していれば重複
+    duplicated = np.flatnonzero(
+        np.bincount(positions, minlength=len(answer_ids))[positions] > 1
+    )
+    error_count += _add_errors(
+        errors,
+        duplicated,
+        id_column,
+        lambda row: f"idが重複しています: {_format_value(submit_ids[row])}",
+    )
+    return error_count, positions
+
+
+def validate_submission(source, answer_key, answer_column):
+    """提出CSVを検証して読み込む
+
+    (必要な列だけのDataFrame, 並べ替えのインデックス) を返す。
+    source はファイルパスかファイルオブジェクト。並べ替えのインデックスは提出の行を
+    正解データのids順に並べ替えるもので、id列で突き合わせない場合はNone。
+    問題があれば SubmissionValidationError を送出する。
+    """
+    meta = answer_key.meta
+    answer_format = meta["answer_format"]
+    id_column = meta["id_column"]
+
+    # 1. ヘッダーと行数
+    header, row_count, has_quote, has_blank_line = scan_csv(source)
+    value_columns = (
+        meta["class_columns"] if answer_format == "class" else [answer_column]
+    )
+    missing = [column for column in value_columns if column not in header]
+    if missing:
+        raise SubmissionValidationError(
+            f"提出ファイルに列 {', '.join(missing)} がありません。"
+            f" (ヘッダー: {', '.join(header)})"
+        )
+    # 空白だけの行があれば実際の行数はrow_countより少ないことがあるため、
+    # 少なすぎる場合だけを確定とする
+    if not has_quote and (
+        row_count < len(answer_key)
+        or (row_count > len(answer_key) and not has_blank_line)
+    ):
+        raise SubmissionValidationError(
+            f"提出ファイルの行数({row_count})が正解データの行数({len(answer_key)})と一致しません。"
+        )
+
+    # 2. 型を指定したパース
+    use_ids = meta["has_id_column"] and id_column in header
+    columns = value_columns + ([id_column] if use_ids else [])
+    numeric_columns = [] if answer_format == "list" else value_columns
+    dtype = {column: np.float64 for column in numeric_columns}
+    if answer_format == "list":
+        # 項目のリストは先頭の0が消えないよう文字列で読む
+        dtype[answer_column] = str
+    integer_columns = []
+    if use_ids and answer_key.ids.dtype.kind in "iu":
+        dtype[id_column] = np.int64
+        integer_columns.append(id_column)
+
+    errors = []
+    try:
+        submit_df = _read_columns(source, columns, dtype)
+    except SubmissionValidationError:
+        raise
+    except ValueError as e:
+        # 型に合わない値か欠損値がある。型を指定した列を文字列で読み直して行を特定する
+        _raise_if_errors(
+            errors,
+            _find_invalid_values(
+                source, numeric_columns + integer_columns, integer_columns, errors
+            ),
+        )
+        raise SubmissionValidationError(f"提出ファイルを読み込めません: {e}") from None
+
+    if len(submit_df) != len(answer_key):
+        raise SubmissionValidationError(
+            f"提出ファイルの行数({len(submit_df)})が正解データの行数({len(answer_key)})と一致しません。"
+        )
+
+    # 3. ベクトル化した検証
+    error_count = 0
+    for column in numeric_columns:
+        values = submit_df[column].to_numpy()
+        rows = np.flatnonzero(~np.isfinite(values))
+        error_count += _add_errors(
+            errors,
+            rows,
+            column,
+            lambda row, values=values: (
+                "値がありません"
+                if np.isnan(values[row])
+                else f"有限の数値ではありません: {values[row]}"
+            ),
+        )
+        if answer_format == "class":
+            error_count += _add_errors(
+                errors,
+                np.flatnonzero(values < 0),
+                column,
+                lambda row: "確率が負の値です",
+            )
+
+    order = None
+    if use_ids:
+        missing_ids = np.flatnonzero(submit_df[id_column].isna().to_numpy())
+        id_errors = _add_errors(
+            errors, missing_ids, id_column, lambda row: "idがありません"
+        )
+        if not id_errors:
+            id_errors, positions = _check_ids(
+                submit_df[id_column].to_numpy(), answer_key.ids, id_column, errors
+            )
+            # 各行の位置の逆置換が、提出の行を正解データのids順に並べ替えるインデックス
+            order = np.empty(len(positions), dtype=np.int64)
+            order[positions] = np.arange(len(positions))
+        error_count += id_errors
+
+    _raise_if_errors(errors, error_count)
+    return submit_df, order
@@ -0,0 +1,321 @@
+"""チームとメンバーの管理
+
+ユーザーは team_members で1つのチームに所属する。チームのベストスコア・提出回数・
+メンバー数は team_summaries に持ち、
+提出の登録(database.insert_submission_within_quota)、
+合流、脱退のたびに差分で更新する。リーダーボードはこの集計を読むだけで、
+submissionsを集計し直すことはない。
+
+合流は、合流する側のチームがリクエストを送り、合流先のチームのメンバーが承認すると行われる。
+"""
+
+import sqlite3
+from datetime import datetime
+
+from app.src.competition import get_current_competition
+from app.src.database import (
+    TIMESTAMP_FORMAT,
+    better_score,
+    ensure_team_membership,
+    get_optimization_direction,
+    get_submission_db_path,
+)
+from app.src.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class TeamError(Exception):
+    """チームの操作ができない場合のエラー (メッセージは画面にそのまま表示する)"""
+
+
+def get_max_team_size():
+    """チームの最大人数。未設定ならNone (無制限)"""
+    return get_current_competition().config["competition"].get("max_team_size")
+
+
+def get_user_team(user_id):
+    """ユーザーの (team_id, team_name)。未所属ならユーザー名の1人チームを作る"""
+    conn = sqlite3.connect(get_submission_db_path(), isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        team_id = ensure_team_membership(conn.cursor(), user_id)
+        conn.commit()
+        if team_id is None:
+            return None
+        row = conn.execute(
+            "SELECT team_id, team_name FROM teams WHERE team_id = ?", (team_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row
+
+
+def get_team_by_name(team_name):
+    """チーム名から (team_id, team_name) を返す。存在しなければNone"""
+    conn = sqlite3.connect(get_submission_db_path())
+    row = conn.execute(
+        "SELECT team_id, team_name FROM teams WHERE team_name = ?", (team_name,)
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def get_team_members(team_id):
+    """チームのメンバーのユーザー名を参加順に返す"""
+    conn = sqlite3.connect(get_submission_db_path())
+    rows = conn.execute(
+        """
+        SELECT u.username FROM team_members tm
+        JOIN users u ON tm.user_id = u.user_id
+        WHERE tm.team_id = ?
+        ORDER BY tm.joined_at, tm.user_id
+    """,
+        (team_id,),
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def get_team_summary(team_id):
+    """(ベストスコア, 提出回数, メンバー数) を返す"""
+    conn = sqlite3.connect(get_submission_db_path())
+    row = conn.execute(
+        """
+        SELECT best_public_score, submission_count, member_count
+        FROM team_summaries WHERE team_id = ?
+    """,
+        (team_id,),
+    ).fetchone()
+    conn.close()
+    return row or (None, 0, 0)
+
+
+def rename_team(team_id, new_name):
+    """チーム名を変更する。同じ名前のチームがあればTeamError"""
+    conn = sqlite3.connect(get_submission_db_path())
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE teams SET team_name = ? WHERE team_id = ?", (new_name, team_id)
+            )
+    except sqlite3.IntegrityError:
+        raise TeamError(f"チーム名 '{new_name}' は既に使われています。")
+    finally:
+        conn.close()
+
+
+def request_team_merge(source_team_id, target_team_id, user_id):
+    """source_team_idのチームからtarget_team_idのチームへの合流をリクエストする"""
+    if source_team_id == target_team_id:
+        raise TeamError("自分のチームには合流できません。")
+    _check_team_size(source_team_id, target_team_id)
+    conn = sqlite3.connect(get_submission_db_path())
+    with conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO team_merge_requests
+                (source_team_id, target_team_id, requested_by, requested_at)
+            VALUES (?, ?, ?, ?)
+        """,
+            (
+                source_team_id,
+                target_team_id,
+                user_id,
+                datetime.now().strftime(TIMESTAMP_FORMAT),
+            ),
+        )
+    conn.close()
+
+
+def get_merge_requests(team_id):
+    """(届いたリクエスト, 送ったリクエスト)。それぞれ [(team_id, team_name), ...]"""
+    conn = sqlite3.connect(get_submission_db_path())
+    incoming = conn.execute(
+        """
+        SELECT r.source_team_id, t.team_name FROM team_merge_requests r
+        JOIN teams t ON r.source_team_id = t.team_id
+        WHERE r.target_team_id = ? ORDER BY r.requested_at
+    """,
+        (team_id,),
+    ).fetchall()
+    outgoing = conn.execute(
+        """
+        SELECT r.target_team_id, t.team_name FROM team_merge_requests r
+        JOIN teams t ON r.target_team_id = t.team_id
+        WHERE r.source_team_id = ? ORDER BY r.requested_at
+    """,
+        (team_id,),
+    ).fetchall()
+    conn.close()
+    return incoming, outgoing
+
+
+def cancel_merge_request(source_team_id, target_team_id):
+    """合流リクエストを取り消す (送った側の取り消しと、届いた側の拒否の両方に使う)"""
+    conn = sqlite3.connect(get_submission_db_path())
+    with conn:
+        conn.execute(
+            """
+            DELETE FROM team_merge_requests
+            WHERE source_team_id = ? AND target_team_id = ?
+        """,
+            (source_team_id, target_team_id),
+        )
+    conn.close()
+
+
+def _check_team_size(source_team_id, target_team_id, cursor=None):
+    max_team_size = get_max_team_size()
+    if max_team_size is None:
+        return
+    conn = None
+    if cursor is None:
+        conn = sqlite3.connect(get_submission_db_path())
+        cursor = conn.cursor()
+    (member_count,) = cursor.execute(
+        "SELECT COUNT(*) FROM team_members WHERE team_id IN (?, ?)",
+        (source_team_id, target_team_id),
+    ).fetchone()
+    if conn is not None:
+        conn.close()
+    if member_count > max_team_size:
+        raise TeamError(
+            f"合流後のメンバー数 ({member_count}人) が"
+            f"チームの上限 ({max_team_size}人) を超えます。"
+        )
+
+
+def accept_merge_request(source_team_id, target_team_id):
+    """届いた合流リクエストを承認し、source_team_idのメンバーをtarget_team_idに移す
+
+    合流後のチームのベストスコア・提出回数・メンバー数は2つのチームの集計から求める。
+    合流したチームの過去の提出も合流先のチームのものになる。
+    """
+    optimization_direction = get_optimization_direction()
+    conn = sqlite3.connect(get_submission_db_path(), isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if not conn.execute(
+            """
+            SELECT 1 FROM team_merge_requests
+            WHERE source_team_id = ? AND target_team_id = ?
+        """,
+            (source_team_id, target_team_id),
+        ).fetchone():
+            raise TeamError("合流リクエストが見つかりません。")
+        _check_team_size(source_team_id, target_team_id, conn.cursor())
+
+        source = conn.execute(
+            """
+            SELECT best_public_score, submission_count, member_count
+            FROM team_summaries WHERE team_id = ?
+        """,
+            (source_team_id,),
+        ).fetchone() or (None, 0, 0)
+        target = conn.execute(
+            "SELECT best_public_score FROM team_summaries WHERE team_id = ?",
+            (target_team_id,),
+        ).fetchone()
+        conn.execute(
+            """
+            UPDATE team_summaries
+            SET best_public_score = ?,
+                submission_count = submission_count + ?,
+                member_count = member_count + ?
+            WHERE team_id = ?
+        """,
+            (
+                better_score(
+                    optimization_direction,
+                    target[0] if target else None,
+                    source[0],
+                ),
+                source[1],
+                source[2],
+                target_team_id,
+            ),
+        )
+        conn.execute(
+            "UPDATE team_members SET team_id = ? WHERE team_id = ?",
+            (target_team_id, source_team_id),
+        )
+        conn.execute(
+            "UPDATE submissions SET team_id = ? WHERE team_id = ?",
+            (target_team_id, source_team_id),
+        )
+        conn.execute(
+            """
+            DELETE FROM team_merge_requests
+            WHERE source_team_id = ? OR target_team_id = ?
+        """,
+            (source_team_id, source_team_id),
+        )
+        conn.execute("DELETE FROM team_summaries WHERE team_id = ?", (source_team_id,))
+        conn.execute("DELETE FROM teams WHERE team_id = ?", (source_team_id,))
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info(f"Merged team {source_team_id} into team {target_team_id}")
+
+
+def leave_team(user_id):
+    """ユーザーをチームから外し、ユーザー名の1人チームに戻す
+
+    元のチームのベストスコアは残ったメンバーのベストスコアから求め直す。
+    ユーザーの過去の提出は新しいチームのものになる。
+    """
+    best_func = "MAX" if get_optimization_direction() == "max" else "MIN"
+    conn = sqlite3.connect(get_submission_db_path(), isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            """
+            SELECT tm.team_id, ts.member_count FROM team_members tm
+            JOIN team_summaries ts ON tm.team_id = ts.team_id
+            WHERE tm.user_id = ?
+        """,
+            (user_id,),
+        ).fetchone()
+        if row is None or row[1] <= 1:
+            raise TeamError("1人のチームからは脱退できません。")
+        old_team_id = row[0]
+        (total_count,) = conn.execute(
+            "SELECT COALESCE(MAX(total_count), 0) FROM submission_counters"
+            " WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+
+        conn.execute("DELETE FROM team_members WHERE user_id = ?", (user_id,))
+        conn.execute(
+            f"""
+            UPDATE team_summaries
+            SET best_public_score = (
+                    SELECT {best_func}(c.best_public_score) FROM team_members tm
+                    JOIN submission_counters c ON tm.user_id = c.user_id
+                    WHERE tm.team_id = ?
+                ),
+                submission_count = submission_count - ?,
+                member_count = member_count - 1
+            WHERE team_id = ?
+        """,
+            (old_team_id, total_count, old_team_id),
+        )
+        new_team_id = ensure_team_membership(conn.cursor(), user_id)
+        conn.execute(
+            "UPDATE submissions SET team_id = ? WHERE user_id = ?",
+            (new_team_id, user_id),
+        )
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info(f"User {user_id} left team {old_team_id}")
+    return new_team_id
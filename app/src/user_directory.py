@@ -0,0 +1,128 @@
+"""ユーザー一覧の検索とページ分割
+
+ユーザー名・メールアドレス・チーム名を user_directory に持ち、FTS5のtrigramインデックス
+(user_directory_fts) で部分一致検索する。1ページ分の行だけをSQLiteから読むため、
+数万人のユーザーがいても検索とページ送りは数ミリ秒で終わる。
+
+user_directory は参加者とチームの変更にトリガーで追従する
+(database.migrate_user_directory)。
+認証設定ファイルに登録されたアカウントとメールアドレスは sync_accounts で反映し、
+ファイルが更新されていなければ読み込まない。
+"""
+
+import os
+import sqlite3
+
+import yaml
+
+from app.src.database import get_submission_db_path
+from app.src.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+AUTHENTICATOR_CONFIG_PATH = "./authenticator_config.yaml"
+USER_DIRECTORY_PAGE_SIZE = 50
+# trigramで検索できる最短の長さ。これより短い語はFTS5のインデックスを使えないため、
+# 長い語と一緒なら全文検索で絞った行をLIKEで絞り込み、短い語だけならユーザー名の
+# 前方一致にする (LIKEで全ての行を走査しないよう、usernameのインデックスの範囲で探す)
+FTS_MIN_TERM_LENGTH = 3
+
+
+def sync_accounts(config_path=AUTHENTICATOR_CONFIG_PATH):
+    """認証設定ファイルのアカウントをuser_directoryに反映する。反映した行数を返す"""
+    if not os.path.exists(config_path):
+        return 0
+    mtime = os.path.getmtime(config_path)
+    conn = sqlite3.connect(get_submission_db_path())
+    try:
+        row = conn.execute(
+            "SELECT mtime FROM user_directory_sources WHERE source = ?", (config_path,)
+        ).fetchone()
+        if row is not None and row[0] == mtime:
+            return 0
+
+        with open(config_path) as file:
+            config = yaml.load(
+                file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            )
+        accounts = ((config or {}).get("credentials") or {}).get("usernames") or {}
+        with conn:
+            # 変更のあった行だけを更新し、全文検索インデックスの更新を最小限にする
+            cursor = conn.executemany(
+                """
+                INSERT INTO user_directory (username, email) VALUES (?, ?)
+                ON CONFLICT (username) DO UPDATE SET email = excluded.email
+                WHERE email IS NOT excluded.email
+            """,
+                (
+                    (username, (info or {}).get("email"))
+                    for username, info in accounts.items()
+                ),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO user_directory_sources VALUES (?, ?)",
+                (config_path, mtime),
+            )
+        logger.info(f"Synced {cursor.rowcount} accounts from {config_path}")
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def _quote_fts_term(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _prefix_upper_bound(term):
+    """termで始まる文字列より大きい最小の文字列"""
+    return term[:-1] + chr(ord(term[-1]) + 1)
+
+
+def search_users(query="", page=1, page_size=USER_DIRECTORY_PAGE_SIZE):
+    """queryの全ての語を含むユーザーのpageページ目を返す
+
+    戻り値は ([(ユーザー名, メールアドレス, チーム名), ...], 該当する総件数)。
+    ユーザー名の順に並べる。FTS_MIN_TERM_LENGTH 未満の語だけの場合は
+    ユーザー名がその語で始まるユーザーを返す。
+    """
+    terms = query.split()
+    long_terms = [term for term in terms if len(term) >= FTS_MIN_TERM_LENGTH]
+    short_terms = [term for term in terms if len(term) < FTS_MIN_TERM_LENGTH]
+
+    joins, conditions, params = "", [], []
+    if long_terms:
+        joins = "JOIN user_directory_fts f ON f.rowid = d.entry_id"
+        conditions.append("user_directory_fts MATCH ?")
+        params.append(" ".join(_quote_fts_term(term) for term in long_terms))
+        for term in short_terms:
+            conditions.append(
+                "(d.username LIKE ? ESCAPE '\\' OR d.email LIKE ? ESCAPE '\\' "
+                "OR d.team_name LIKE ? ESCAPE '\\')"
+            )
+            params.extend([f"%{_escape_like(term)}%"] * 3)
+    else:
+        for term in short_terms:
+            conditions.append("(d.username >= ? AND d.username < ?)")
+            params.extend([term, _prefix_upper_bound(term)])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = sqlite3.connect(get_submission_db_path())
+    try:
+        (total,) = conn.execute(
+            f"SELECT COUNT(*) FROM user_directory d {joins} {where}", params
+        ).fetchone()
+        rows = conn.execute(
+            f"""
+            SELECT d.username, d.email, d.team_name FROM user_directory d
+            {joins} {where}
+            ORDER BY d.username LIMIT ? OFFSET ?
+        """,
+            params + [page_size, (max(page, 1) - 1) * page_size],
+        ).fetchall()
+    finally:
+        conn.close()
+    return rows, total
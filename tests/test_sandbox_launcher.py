@@ -0,0 +1,126 @@
+"""提出コードのサンドボックスの隔離のテスト
+
+ユーザー名前空間を作れない環境ではスキップする。
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from app.src.sandbox_launcher import SETUP_FAILED_EXIT_CODE
+
+LAUNCHER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "app",
+    "src",
+    "sandbox_launcher.py",
+)
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SandboxLauncherTest(unittest.TestCase):
+    def setUp(self):
+        self.sandbox_root = tempfile.mkdtemp()
+        self.workdir = os.path.join(self.sandbox_root, "jobs", "job")
+        self.mount_point = os.path.join(self.sandbox_root, "work")
+        os.makedirs(self.workdir)
+        os.makedirs(self.mount_point)
+        # /tmp はサンドボックスの中で専用のtmpfsになるため、外側の書き込み先は別に作る
+        self.outside_dir = tempfile.mkdtemp(dir=TESTS_DIR)
+
+    def tearDown(self):
+        for root in [self.sandbox_root, self.outside_dir]:
+            subprocess.run(["rm", "-rf", root], check=True)
+
+    def run_script(self, source):
+        script_path = os.path.join(self.workdir, "main.py")
+        with open(script_path, "w") as f:
+            f.write(textwrap.dedent(source))
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-I",
+                LAUNCHER_PATH,
+                "--workdir",
+                self.workdir,
+                "--mount-point",
+                self.mount_point,
+                "--jobs-root",
+                os.path.join(self.sandbox_root, "jobs"),
+                "--cpu-seconds",
+                "10",
+                "--memory-bytes",
+                str(2 * 1024**3),
+                "--file-size-bytes",
+                str(64 * 1024**2),
+                os.path.join(self.mount_point, "main.py"),
+            ],
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        if result.returncode == SETUP_FAILED_EXIT_CODE:
+            self.skipTest(f"isolation is not available: {result.stderr.strip()}")
+        return result
+
+    def test_write_outside_workdir_fails(self):
+        outside_path = os.path.join(self.outside_dir, "escaped.txt")
+        result = self.run_script(
+            f"""
+            try:
+                with open({outside_path!r}, "w") as f:
+                    f.write("escaped")
+            except OSError:
+                raise SystemExit(0)
+            raise SystemExit(1)
+            """
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertFalse(os.path.exists(outside_path))
+
+    def test_write_to_workdir_and_tmp_succeeds(self):
+        result = self.run_script(
+            """
+            with open("output.txt", "w") as f:
+                f.write("ok")
+            with open("/tmp/scratch.txt", "w") as f:
+                f.write("ok")
+            """
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(os.path.join(self.workdir, "output.txt")) as f:
+            self.assertEqual(f.read(), "ok")
+
+    def test_other_processes_are_not_visible(self):
+        result = self.run_script(
+            """
+            import os
+
+            pids = [name for name in os.listdir("/proc") if name.isdigit()]
+            print(os.getpid(), len(pids))
+            """
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        pid, num_pids = map(int, result.stdout.split())
+        # 1番はサンドボックスのinit
+        self.assertEqual(pid, 2)
+        self.assertLessEqual(num_pids, 2)
+
+    def test_exit_status_is_propagated(self):
+        result = self.run_script(
+            """
+            import os
+            import signal
+
+            os.kill(os.getpid(), signal.SIGKILL)
+            """
+        )
+        self.assertEqual(result.returncode, -9)
+        self.assertEqual(self.run_script("raise SystemExit(3)").returncode, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
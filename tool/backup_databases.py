@@ -0,0 +1,125 @@
+"""提出データベースのバックアップ・検証・復元スクリプト (app/src/backup.py)
+
+アプリを止めずにバックアップできる。
+--interval-minutes を指定すると常駐して定期的に実行し、
+各回のあとに保持ポリシー(新しい24個と、過去7日間の各日の最新)に含まれないものを削除する。
+cronから1回ずつ実行してもよい。リポジトリのルートで実行すること。
+
+使い方:
+    python tool/backup_databases.py backup
+    python tool/backup_databases.py backup --interval-minutes 60
+    python tool/backup_databases.py list
+    python tool/backup_databases.py verify backups/default/20250101_120000
+    python tool/backup_databases.py restore backups/default/20250101_120000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.src.backup import (
+    BACKUP_KEEP_DAYS,
+    BACKUP_KEEP_LAST,
+    BACKUP_ROOT,
+    apply_retention,
+    create_backup,
+    list_backups,
+    restore_backup,
+    verify_backup,
+)
+from app.src.competition import (
+    DEFAULT_COMPETITION_ID,
+    get_competitions,
+    use_competition,
+)
+
+
+def run_backup(args, competition):
+    backup_dir = create_backup(args.backup_root, competition)
+    print(f"Created {backup_dir}")
+    for removed in apply_retention(
+        args.backup_root, args.keep_last, args.keep_days, competition
+    ):
+        print(f"Removed {removed}")
+
+
+def run_verify(args):
+    try:
+        manifest = verify_backup(args.backup_dir)
+    except ValueError as e:
+        print(f"NG: {e}")
+        sys.exit(1)
+    for name, info in manifest["databases"].items():
+        print(f"OK: {name} {info['row_counts']}")
+
+
+def run_restore(args, competition):
+    if not args.yes:
+        answer = input(
+            f"{competition.competition_id} のデータベースを "
+            f"{args.backup_dir} で置き換えます。よろしいですか? [y/N] "
+        )
+        if answer.lower() != "y":
+            print("中止しました。")
+            return
+    # 復元前の状態も戻せるように、先にバックアップを取っておく
+    current_backup = create_backup(args.backup_root, competition)
+    print(f"Backed up current databases to {current_backup}")
+    manifest = restore_backup(args.backup_dir, competition)
+    for name, info in manifest["databases"].items():
+        print(f"Restored: {name} {info['row_counts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提出データベースのバックアップと復元")
+    parser.add_argument("--competition", default=DEFAULT_COMPETITION_ID)
+    parser.add_argument("--backup-root", default=BACKUP_ROOT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = subparsers.add_parser("backup", help="バックアップを作成する")
+    backup_parser.add_argument(
+        "--interval-minutes",
+        type=float,
+        default=None,
+        help="指定すると常駐してこの間隔でバックアップする",
+    )
+    backup_parser.add_argument("--keep-last", type=int, default=BACKUP_KEEP_LAST)
+    backup_parser.add_argument("--keep-days", type=int, default=BACKUP_KEEP_DAYS)
+
+    subparsers.add_parser("list", help="バックアップの一覧")
+    verify_parser = subparsers.add_parser("verify", help="バックアップを検証する")
+    verify_parser.add_argument("backup_dir")
+    restore_parser = subparsers.add_parser(
+        "restore", help="検証したバックアップで現在のデータベースを置き換える"
+    )
+    restore_parser.add_argument("backup_dir")
+    restore_parser.add_argument("--yes", action="store_true", help="確認せずに復元する")
+    args = parser.parse_args()
+
+    if args.competition not in get_competitions():
+        parser.error(f"Unknown competition: {args.competition}")
+
+    with use_competition(args.competition) as competition:
+        if args.command == "backup":
+            run_backup(args, competition)
+            while args.interval_minutes:
+                time.sleep(args.interval_minutes * 60)
+                try:
+                    run_backup(args, competition)
+                except Exception as e:
+                    # 常駐中は1回の失敗で止めない
+                    print(f"Backup failed: {e}")
+        elif args.command == "list":
+            for backup_dir in list_backups(args.backup_root, competition):
+                print(backup_dir)
+        elif args.command == "verify":
+            run_verify(args)
+        elif args.command == "restore":
+            run_restore(args, competition)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""スコア計算・リーダーボードのベンチマークスクリプト
+
+seed固定のフィクスチャ(ユーザー数 x ユーザーあたり提出数)を作成し、
+get_leaderboard / generate_leaderboard / get_public_private_score /
+insert_submission の実行時間とピークメモリを計測してJSONに保存する。
+--compare で過去の結果と比較し、閾値を超えて遅くなったものがあれば終了コード1を返す。
+
+各計測は作業ディレクトリにchdirした子プロセスで行うため、計測同士が
+インポート済みモジュールやメモリ使用量を共有しない。
+
+使い方:
+    python tool/benchmark.py --scales 100x1,10000x20 --output bench.json
+    python tool/benchmark.py --output new.json --compare bench.json --threshold 0.2
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+DEFAULT_SCALES = "100x1,100x200,10000x1,10000x20,100000x1,100000x10"
+BENCHMARKS = (
+    "get_leaderboard",
+    "generate_leaderboard",
+    "get_public_private_score",
+    # DBに行を追加するため最後に実行する
+    "insert_submission",
+)
+INSERTS_PER_ROUND = 20
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MiniKaggleのベンチマーク")
+    parser.add_argument(
+        "--scales",
+        default=DEFAULT_SCALES,
+        help="<ユーザー数>x<ユーザーあたり提出数> のカンマ区切り",
+    )
+    parser.add_argument(
+        "--benchmarks", default=",".join(BENCHMARKS), help="実行するベンチマーク"
+    )
+    parser.add_argument("--test-rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--timeout", type=float, default=600.0, help="1計測あたりのタイムアウト秒数"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workdir", type=Path, default=REPO_ROOT / "temp_files" / "benchmark"
+    )
+    parser.add_argument("--output", type=Path, default=None, help="結果のJSON出力先")
+    parser.add_argument("--compare", type=Path, default=None, help="比較対象のJSON")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="中央値がこの割合以上遅くなったら回帰とみなす",
+    )
+    return parser.parse_args()
+
+
+def parse_scales(scales):
+    parsed = []
+    for scale in scales.split(","):
+        num_users, _, submissions_per_user = scale.partition("x")
+        parsed.append((int(num_users), int(submissions_per_user)))
+    return parsed
+
+
+def first_existing(*paths):
+    for path in paths:
+        if path.exists():
+            return path
+    return None
+
+
+def create_test_data(data_dir, test_rows, answer_column, seed):
+    """スコア計算用のtest.csvと提出CSVを作成する"""
+    test_path = data_dir / "test.csv"
+    submission_path = data_dir / "submission.csv"
+    if test_path.exists() and submission_path.exists():
+        return test_path, submission_path
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    target = rng.normal(size=test_rows)
+    pd.DataFrame(
+        {
+            "id": np.arange(test_rows),
+            answer_column: target,
+            "is_public": (rng.random(test_rows) < 0.5).astype(np.int8),
+        }
+    ).to_csv(test_path, index=False)
+    pd.DataFrame(
+        {
+            "id": np.arange(test_rows),
+            answer_column: target + rng.normal(scale=0.1, size=test_rows),
+        }
+    ).to_csv(submission_path, index=False)
+    return test_path, submission_path
+
+
+def create_fixture(fixture_dir, num_users, submissions_per_user, seed, setting_path):
+    """seed固定でユーザー・チーム・提出・最終提出のDBを作成する"""
+    if (fixture_dir / "database" / "submissions.db").exists():
+        return
+
+    database_dir = fixture_dir / "database"
+    database_dir.mkdir(parents=True, exist_ok=True)
+    # 集計の作成に最適化方向を使うため、設定ファイルも置いておく
+    shutil.copy(setting_path, fixture_dir / "competition_setting.yaml")
+    cwd = os.getcwd()
+    os.chdir(fixture_dir)
+    try:
+        # 実際のスキーマで作成するためcreate_tablesを使う
+        from app.src.database import (
+            create_tables,
+            get_final_submission_db_path,
+            get_submission_db_path,
+        )
+
+        create_tables()
+        rng = np.random.default_rng([seed, num_users, submissions_per_user])
+        base_time = datetime(2024, 1, 1)
+
+        with sqlite3.connect(get_submission_db_path()) as conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, username) VALUES (?, ?)",
+                ((i, f"user_{i:06d}") for i in range(1, num_users + 1)),
+            )
+            conn.executemany(
+                "INSERT INTO teams (team_id, team_name) VALUES (?, ?)",
+                ((i, f"user_{i:06d}") for i in range(1, num_users + 1)),
+            )
+            conn.executemany(
+                "INSERT INTO team_members (user_id, team_id) VALUES (?, ?)",
+                ((i, i) for i in range(1, num_users + 1)),
+            )
+            for start in range(1, num_users + 1, 1000):
+                user_ids = range(start, min(start + 1000, num_users + 1))
+                scores = rng.random((len(user_ids), submissions_per_user, 2))
+                minutes = rng.integers(
+                    0, 60 * 24 * 60, size=(len(user_ids), submissions_per_user)
+                )
+                conn.executemany(
+                    """INSERT INTO submissions
+                    (user_id, team_id, filename, public_score, private_score,
+                     timestamp, user_submission_id, submitted_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (
+                        (
+                            user_id,
+                            user_id,
+                            f"submission_{n}.csv",
+                            float(scores[row, n, 0]),
+                            float(scores[row, n, 1]),
+                            submitted.strftime("%Y%m%d_%H%M%S"),
+                            n + 1,
+                            int(submitted.timestamp()),
+                        )
+                        for row, user_id in enumerate(user_ids)
+                        for n in range(submissions_per_user)
+                        for submitted in [
+                            base_time + timedelta(minutes=int(minutes[row, n]))
+                        ]
+                    ),
+                )
+            final_rows = conn.execute(
+                """SELECT submission_id, user_id, team_id, filename, public_score,
+                          private_score, timestamp, user_submission_id
+                   FROM submissions WHERE user_submission_id <= 2 AND user_id % 2 = 0"""
+            ).fetchall()
+
+        with sqlite3.connect(get_final_submission_db_path()) as conn:
+            conn.executemany(
+                """INSERT INTO final_submissions
+                (submission_id, user_id, team_id, filename, public_score,
+                 private_score, timestamp, user_submission_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                final_rows,
+            )
+
+        # 直接INSERTした提出から提出回数カウンターとチームの集計を作成する
+        create_tables()
+    finally:
+        os.chdir(cwd)
+
+
+def prepare_run_dir(run_dir, fixture_dir, setting_path, test_path):
+    """計測のたびにフィクスチャをコピーした作業ディレクトリを作り直す"""
+    if run_dir.exists():
+        shutil.rmtree(run_dir)
+    shutil.copytree(fixture_dir / "database", run_dir / "database")
+    (run_dir / "competition").mkdir()
+    shutil.copy(test_path, run_dir / "competition" / "test.csv")
+    shutil.copy(setting_path, run_dir / "competition_setting.yaml")
+
+
+def make_benchmark_func(name, submission_path):
+    """計測対象の関数を返す。モジュールは子プロセスでchdir後にインポートする"""
+    if name == "get_leaderboard":
+        from app.src.leaderboard import get_leaderboard
+
+        return get_leaderboard
+    elif name == "generate_leaderboard":
+        from app.src.leaderboard import generate_leaderboard
+
+        return generate_leaderboard
+    elif name == "get_public_private_score":
+        from app.src.scoring import get_public_private_score
+
+        return lambda: get_public_private_score(submission_path)
+    elif name == "insert_submission":
+        from app.src.database import SubmissionRecord, insert_submission
+
+        def insert_round():
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            for user_id in range(1, INSERTS_PER_ROUND + 1):
+                insert_submission(
+                    SubmissionRecord(
+                        user_id=user_id,
+                        public_score=0.5,
+                        private_score=0.5,
+                        timestamp=timestamp,
+                        filename="bench.csv",
+                        team_id=user_id,
+                    )
+                )
+
+        return insert_round
+    raise ValueError(f"Unknown benchmark: {name}")
+
+
+def measure(run_dir, name, submission_path, repeat, conn):
+    """子プロセスで実行時間とピークメモリを計測してパイプで返す"""
+    os.chdir(run_dir)
+    func = make_benchmark_func(name, submission_path)
+
+    # ウォームアップ (インポートやページキャッシュの影響を除く)
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    # tracemallocは処理を遅くするため、時間計測とは別に1回だけ実行する
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    conn.send(
+        {
+            "timings_sec": timings,
+            "tracemalloc_peak_mb": peak / 1024**2,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+    conn.close()
+
+
+def run_measurement(run_dir, name, submission_path, repeat, timeout):
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=measure, args=(run_dir, name, submission_path, repeat, child_conn)
+    )
+    process.start()
+    child_conn.close()
+    if parent_conn.poll(timeout):
+        try:
+            result = parent_conn.recv()
+        except EOFError:
+            result = {"error": "crashed"}
+    else:
+        process.kill()
+        result = {"error": "timeout"}
+    process.join()
+    if "timings_sec" in result:
+        result["median_sec"] = statistics.median(result["timings_sec"])
+        result["min_sec"] = min(result["timings_sec"])
+    elif process.exitcode not in (0, None) and "error" not in result:
+        result["error"] = f"exitcode {process.exitcode}"
+    return result
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    import yaml
+
+    setting_path = first_existing(
+        REPO_ROOT / "competition_setting.yaml",
+        REPO_ROOT / ".competition_setting.yaml",
+    )
+    with open(setting_path) as file:
+        answer_column = yaml.safe_load(file)["competition"]["answer_column"]
+
+    workdir = args.workdir.resolve()
+    test_path, submission_path = create_test_data(
+        workdir / f"test_data_{args.test_rows}_seed{args.seed}",
+        args.test_rows,
+        answer_column,
+        args.seed,
+    )
+    benchmarks = args.benchmarks.split(",")
+
+    results = []
+    for num_users, submissions_per_user in parse_scales(args.scales):
+        scale = f"{num_users}x{submissions_per_user}"
+        fixture_dir = workdir / "fixtures" / f"{scale}_seed{args.seed}"
+        print(f"[{scale}] preparing fixture ...", flush=True)
+        create_fixture(
+            fixture_dir, num_users, submissions_per_user, args.seed, setting_path
+        )
+
+        run_dir = workdir / "run"
+        prepare_run_dir(run_dir, fixture_dir, setting_path, test_path)
+        for name in benchmarks:
+            result = run_measurement(
+                run_dir, name, submission_path, args.repeat, args.timeout
+            )
+            result.update({"scale": scale, "benchmark": name})
+            results.append(result)
+            if "error" in result:
+                print(f"[{scale}] {name}: {result['error']}", flush=True)
+            else:
+                print(
+                    f"[{scale}] {name}: median {result['median_sec'] * 1000:.1f}ms "
+                    f"peak {result['tracemalloc_peak_mb']:.1f}MB",
+                    flush=True,
+                )
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": get_git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "test_rows": args.test_rows,
+        },
+        "results": results,
+    }
+
+
+def compare_results(current, baseline, threshold):
+    """中央値の比を表示し、回帰があればTrueを返す"""
+    baseline_map = {
+        (r["scale"], r["benchmark"]): r
+        for r in baseline["results"]
+        if "median_sec" in r
+    }
+    regressed = False
+    print(f"{'scale':<16}{'benchmark':<28}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for result in current["results"]:
+        base = baseline_map.get((result["scale"], result["benchmark"]))
+        if base is None or "median_sec" not in result:
+            continue
+        ratio = result["median_sec"] / base["median_sec"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressed = True
+        print(
+            f"{result['scale']:<16}{result['benchmark']:<28}"
+            f"{base['median_sec'] * 1000:>10.1f}ms"
+            f"{result['median_sec'] * 1000:>10.1f}ms"
+            f"{ratio:>8.2f}{mark}"
+        )
+    return regressed
+
+
+def main():
+    args = parse_args()
+    current = run_benchmarks(args)
+
+    if args.output:
+        args.output.write_text(json.dumps(current, indent=2, ensure_ascii=False))
+        print(f"Saved: {args.output}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if compare_results(current, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""予測値キャッシュ(app/src/prediction_cache.py)がない既存の提出について、保存済みのCSVから作成するスクリプト
+
+新しい提出は登録時にキャッシュされるため、このスクリプトはキャッシュ導入前の提出や
+test.csvの差し替え後に実行する。リポジトリのルートで実行すること。
+
+使い方:
+    python tool/build_prediction_cache.py             # 全コンペティション
+    python tool/build_prediction_cache.py --competition default --rebuild
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.src.competition import get_competitions, use_competition
+from app.src.database import create_tables
+from app.src.prediction_cache import (
+    load_prediction_cache,
+    remove_prediction_cache,
+    save_prediction_cache,
+)
+from app.src.ranking_metrics import get_answer_format
+from app.src.retention import open_submission_file
+from app.src.scoring import read_aligned_predictions
+from app.src.submission import get_submission_file_name
+
+
+def build_prediction_cache(competition, rebuild=False):
+    create_tables()
+    conn = sqlite3.connect(competition.submission_db_path)
+    rows = conn.execute(
+        """
+        SELECT submission_id, user_id, filename, timestamp, prediction_path
+        FROM submissions ORDER BY submission_id
+    """
+    ).fetchall()
+
+    built, skipped = 0, 0
+    # 同じユーザー・時刻・ファイル名の提出は登録順に連番付きで保存されている
+    duplicates = defaultdict(int)
+    for submission_id, user_id, filename, timestamp, prediction_path in rows:
+        n = duplicates[(user_id, filename, timestamp)]
+        duplicates[(user_id, filename, timestamp)] += 1
+        if (
+            not rebuild
+            and load_prediction_cache(prediction_path, competition) is not None
+        ):
+            continue
+
+        file_name = get_submission_file_name(user_id, filename, timestamp, n)
+        try:
+            # 古い提出はretentionでユーザーごとのzipに圧縮されている場合がある
+            with open_submission_file(user_id, file_name, competition) as file:
+                predictions = read_aligned_predictions(file, competition)
+        except FileNotFoundError:
+            print(f"  submission {submission_id}: file not found ({file_name})")
+            skipped += 1
+            continue
+        except (ValueError, KeyError) as e:
+            print(f"  submission {submission_id}: {e}")
+            skipped += 1
+            continue
+
+        new_path = save_prediction_cache(predictions, user_id, competition)
+        with conn:
+            conn.execute(
+                "UPDATE submissions SET prediction_path = ? WHERE submission_id = ?",
+                (new_path, submission_id),
+            )
+        remove_prediction_cache(prediction_path)
+        built += 1
+    conn.close()
+    return built, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="既存の提出の予測値キャッシュを作成する"
+    )
+    parser.add_argument(
+        "--competition",
+        action="append",
+        default=None,
+        help="対象のcompetition_id (複数指定可、省略時は全コンペティション)",
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="キャッシュがある提出も作り直す"
+    )
+    args = parser.parse_args()
+
+    competitions = get_competitions()
+    competition_ids = args.competition or list(competitions)
+    for competition_id in competition_ids:
+        if competition_id not in competitions:
+            parser.error(f"Unknown competition: {competition_id}")
+
+        with use_competition(competition_id) as competition:
+            metric = competition.config["competition"]["metric"]
+            if get_answer_format(metric) != "scalar":
+                # 予測値キャッシュは数値の予測だけが対象
+                print(f"{competition_id}: skipped ({metric} is not a numeric metric)")
+                continue
+            started = time.perf_counter()
+            built, skipped = build_prediction_cache(competition, args.rebuild)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{competition_id}: built {built}, skipped {skipped} ({elapsed:.1f}s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""古い提出ファイルをユーザーごとのzipに圧縮するスクリプト (app/src/retention.py)
+
+最終提出とユーザーごとのPublic score上位の提出は圧縮しない。読み込み速度を制限し、
+直前に提出があった間は待つため、コンペティションの開催中に実行してもよい。
+--interval-minutes を指定すると常駐して定期的に実行する。
+リポジトリのルートで実行すること。
+
+使い方:
+    python tool/compact_submissions.py --dry-run
+    python tool/compact_submissions.py --days 7 --keep-top-k 5
+    python tool/compact_submissions.py --interval-minutes 360 --max-mb-per-sec 10
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.src.competition import (
+    DEFAULT_COMPETITION_ID,
+    get_competitions,
+    use_competition,
+)
+from app.src.database import create_tables
+from app.src.retention import (
+    RETENTION_DAYS,
+    RETENTION_KEEP_TOP_K,
+    RETENTION_MAX_BYTES_PER_SEC,
+    run_retention,
+)
+
+
+def run_once(args, competition):
+    started = time.perf_counter()
+    results = run_retention(
+        days=args.days,
+        keep_top_k=args.keep_top_k,
+        max_bytes_per_sec=args.max_mb_per_sec * 1024 * 1024,
+        dry_run=args.dry_run,
+        competition=competition,
+    )
+    files = sum(count for count, _ in results.values())
+    size = sum(size for _, size in results.values())
+    action = "would archive" if args.dry_run else "archived"
+    print(
+        f"{competition.competition_id}: {action} {files} files "
+        f"({size / 1024 / 1024:.1f}MB) in {len(results)} users "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="古い提出ファイルの圧縮")
+    parser.add_argument("--competition", default=DEFAULT_COMPETITION_ID)
+    parser.add_argument(
+        "--days",
+        type=float,
+        default=RETENTION_DAYS,
+        help="これより古いファイルを圧縮する",
+    )
+    parser.add_argument(
+        "--keep-top-k",
+        type=int,
+        default=RETENTION_KEEP_TOP_K,
+        help="ユーザーごとに残すPublic score上位の提出数",
+    )
+    parser.add_argument(
+        "--max-mb-per-sec",
+        type=float,
+        default=RETENTION_MAX_BYTES_PER_SEC / 1024 / 1024,
+        help="読み込み速度の上限(MB/秒)",
+    )
+    parser.add_argument("--interval-minutes", type=float, default=None)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="圧縮せずに対象の数だけ表示する"
+    )
+    args = parser.parse_args()
+
+    if args.competition not in get_competitions():
+        parser.error(f"Unknown competition: {args.competition}")
+
+    with use_competition(args.competition) as competition:
+        create_tables()
+        run_once(args, competition)
+        while args.interval_minutes:
+            time.sleep(args.interval_minutes * 60)
+            try:
+                run_once(args, competition)
+            except Exception as e:
+                # 常駐中は1回の失敗で止めない
+                print(f"Retention failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
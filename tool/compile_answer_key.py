@@ -0,0 +1,46 @@
+"""test.csvをメモリマップ用のバイナリ形式に変換するスクリプト
+
+スコア計算時にも古ければ自動で変換されるが、デプロイ時に事前に実行しておくと
+最初の提出で変換待ちが発生しない。リポジトリのルートで実行すること。
+
+使い方:
+    python tool/compile_answer_key.py             # 全コンペティション
+    python tool/compile_answer_key.py --competition default
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.src.answer_key import compile_answer_key
+from app.src.competition import get_competitions, use_competition
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正解データをバイナリ形式に変換する")
+    parser.add_argument(
+        "--competition",
+        action="append",
+        default=None,
+        help="対象のcompetition_id (複数指定可、省略時は全コンペティション)",
+    )
+    args = parser.parse_args()
+
+    competitions = get_competitions()
+    competition_ids = args.competition or list(competitions)
+    for competition_id in competition_ids:
+        if competition_id not in competitions:
+            parser.error(f"Unknown competition: {competition_id}")
+
+        with use_competition(competition_id) as competition:
+            started = time.perf_counter()
+            answer_key_dir = compile_answer_key(competition)
+            elapsed = time.perf_counter() - started
+            print(f"{competition_id}: {answer_key_dir} ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
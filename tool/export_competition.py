@@ -0,0 +1,97 @@
+"""提出データをParquet / Arrow IPCにエクスポートするスクリプト
+
+submissions、submission_scores、final_submissions、users、team_users
+(と予測値キャッシュ) をバッチ単位で読み、テーブルごとにパーティション分割したファイルに
+書き出す (app/src/export.py)。
+リポジトリのルートで実行すること。
+
+使い方:
+    python tool/export_competition.py --output export/
+    python tool/export_competition.py --output export/ --format arrow \
+        --include-predictions
+    python tool/export_competition.py --output export/ --tables submissions,users
+
+読み込み:
+    pd.read_parquet("export/submissions")
+    pyarrow.dataset.dataset("export/submissions", format="arrow")
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.src.competition import (
+    DEFAULT_COMPETITION_ID,
+    get_competitions,
+    use_competition,
+)
+from app.src.database import create_tables
+from app.src.export import (
+    EXPORT_BATCH_ROWS,
+    EXPORT_FORMATS,
+    EXPORT_PARTITION_ROWS,
+    EXPORT_TABLES,
+    ExportOptions,
+    export_competition_data,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提出データのエクスポート")
+    parser.add_argument(
+        "--output", type=Path, required=True, help="出力先のディレクトリ"
+    )
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet")
+    parser.add_argument(
+        "--tables",
+        default=",".join(EXPORT_TABLES),
+        help="エクスポートするテーブル (カンマ区切り)",
+    )
+    parser.add_argument(
+        "--include-predictions",
+        action="store_true",
+        help="予測値キャッシュも submission_predictions として書き出す",
+    )
+    parser.add_argument(
+        "--competition",
+        default=DEFAULT_COMPETITION_ID,
+        help="対象のcompetition_id",
+    )
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS)
+    parser.add_argument("--partition-rows", type=int, default=EXPORT_PARTITION_ROWS)
+    args = parser.parse_args()
+
+    competitions = get_competitions()
+    if args.competition not in competitions:
+        parser.error(f"Unknown competition: {args.competition}")
+    tables = [table for table in args.tables.split(",") if table]
+    for table in tables:
+        if table not in EXPORT_TABLES:
+            parser.error(f"Unknown table: {table}")
+
+    with use_competition(args.competition) as competition:
+        create_tables()
+        started = time.perf_counter()
+        manifest = export_competition_data(
+            args.output,
+            ExportOptions(
+                file_format=args.format,
+                tables=tables,
+                include_predictions=args.include_predictions,
+                batch_rows=args.batch_rows,
+                partition_rows=args.partition_rows,
+            ),
+            competition,
+        )
+        elapsed = time.perf_counter() - started
+
+    for table, info in manifest["tables"].items():
+        print(f"{table}: {info['rows']} rows, {len(info['files'])} files")
+    print(f"Exported to {args.output} ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
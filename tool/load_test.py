@@ -0,0 +1,333 @@
+"""同時提出ユーザーを模擬する負荷試験スクリプト
+
+app/src/database.py とスコア計算の本物の関数を、N人の模擬ユーザーが
+スレッドまたはプロセスから同時に呼び出す。各ユーザーは
+提出 / リーダーボード閲覧 / 最終提出の変更 をランダムに繰り返す。
+--streamlit-clients を指定すると、StreamlitのAppTestでリーダーボードページを
+ヘッドレスに描画するクライアントも同時に走らせる。
+
+実行中のDBを汚さないように、作業ディレクトリ(--workdir)にDB・設定・test.csvを
+用意してからそこへchdirして実行する。
+
+使い方:
+    python tool/load_test.py --users 20 --mode process --duration 30
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+OPERATIONS = ("submit", "leaderboard", "final_pick")
+STREAMLIT_OPERATION = "streamlit_leaderboard"
+MAIN_SCRIPT_PATH = REPO_ROOT / "app" / "main.py"
+LEADERBOARD_PAGE = "pages/page_02_leaderbord.py"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MiniKaggleの同時ユーザー負荷試験")
+    parser.add_argument("--users", type=int, default=10, help="模擬ユーザー数")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--duration", type=float, default=10.0, help="実行秒数")
+    parser.add_argument(
+        "--mix",
+        default="submit=1,leaderboard=3,final_pick=1",
+        help="操作の重み (例: submit=1,leaderboard=3,final_pick=1)",
+    )
+    parser.add_argument(
+        "--test-csv", type=Path, default=REPO_ROOT / "competition" / "test.csv"
+    )
+    parser.add_argument(
+        "--submission-csv",
+        type=Path,
+        default=None,
+        help="提出に使うCSV。省略時はtest.csvをそのまま提出する",
+    )
+    parser.add_argument(
+        "--streamlit-clients",
+        type=int,
+        default=0,
+        help="AppTestでリーダーボードページを描画するクライアント数",
+    )
+    parser.add_argument("--workdir", type=Path, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, default=None, help="結果のJSON出力先")
+    args = parser.parse_args()
+    if args.json:
+        # 作業ディレクトリへ移動する前に絶対パスにしておく
+        args.json = args.json.resolve()
+
+    if not args.test_csv.exists():
+        parser.error(
+            f"{args.test_csv} が見つかりません。"
+            "tool/make_synthetic_competition.py で作成してください。"
+        )
+    return args
+
+
+def parse_mix(mix):
+    weights = dict.fromkeys(OPERATIONS, 0.0)
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in weights:
+            raise ValueError(f"Unknown operation: {name}")
+        weights[name] = float(weight)
+    return [weights[name] for name in OPERATIONS]
+
+
+def first_existing(*paths):
+    for path in paths:
+        if path.exists():
+            return path
+    return None
+
+
+def prepare_workdir(args):
+    """負荷試験用の作業ディレクトリにDB・設定・test.csvを用意する"""
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="minikaggle_load_"))
+    (workdir / "database").mkdir(parents=True, exist_ok=True)
+    (workdir / "competition").mkdir(exist_ok=True)
+
+    setting_path = first_existing(
+        REPO_ROOT / "competition_setting.yaml",
+        REPO_ROOT / ".competition_setting.yaml",
+    )
+    shutil.copy(setting_path, workdir / "competition_setting.yaml")
+
+    authenticator_path = first_existing(
+        REPO_ROOT / "authenticator_config.yaml",
+        REPO_ROOT / ".authenticator_config.yaml",
+    )
+    shutil.copy(authenticator_path, workdir / "authenticator_config.yaml")
+
+    shutil.copy(args.test_csv, workdir / "competition" / "test.csv")
+    submission_csv = (args.submission_csv or args.test_csv).resolve()
+    return workdir, submission_csv
+
+
+def setup_users(num_users):
+    from app.src.database import (
+        create_tables,
+        get_or_create_team_id,
+        get_or_create_user_id,
+    )
+
+    create_tables()
+    users = []
+    for i in range(num_users):
+        user_id = get_or_create_user_id(f"loadtest_{i:04d}")
+        team_id = get_or_create_team_id(user_id)
+        users.append((user_id, team_id))
+    return users
+
+
+def do_submit(user_id, team_id, submission_csv, rng):
+    """提出ページ・APIと同じ score_and_register_submission で提出を処理する
+
+    上限の判定と登録(BEGIN IMMEDIATEのカウンター更新)、予測値キャッシュと
+    重複検出のシグネチャの書き込みまで含めて計測する。
+    """
+    from app.src.database import (
+        DAILY_SUBMISSION_LIMIT_REACHED,
+        SUBMISSION_ERROR,
+        SUBMISSION_LIMIT_REACHED,
+    )
+    from app.src.submission import score_and_register_submission
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    result = score_and_register_submission(
+        user_id, submission_csv, submission_csv.name, timestamp
+    )
+    if result.status in (SUBMISSION_LIMIT_REACHED, DAILY_SUBMISSION_LIMIT_REACHED):
+        return "limit"
+    if result.status == SUBMISSION_ERROR:
+        return "failed"
+    return None
+
+
+def do_leaderboard(user_id, team_id, submission_csv, rng):
+    from app.src.leaderboard import get_leaderboard
+
+    get_leaderboard()
+
+
+def do_final_pick(user_id, team_id, submission_csv, rng):
+    from app.src.database import get_user_submissions, update_final_submissions
+
+    submissions = get_user_submissions(user_id)
+    if submissions.empty:
+        return None
+    submission_ids = submissions["submission_id"].tolist()
+    selected_ids = rng.sample(submission_ids, min(2, len(submission_ids)))
+    update_final_submissions(user_id, selected_ids)
+    return None
+
+
+OPERATION_FUNCS = {
+    "submit": do_submit,
+    "leaderboard": do_leaderboard,
+    "final_pick": do_final_pick,
+}
+
+
+def classify_error(e):
+    # pandas.read_sql_queryはsqlite3のエラーをDatabaseErrorで包むため
+    # メッセージで判定する
+    if "database is locked" in str(e):
+        return "locked"
+    return "other"
+
+
+def run_user(user, submission_csv, weights, deadline, seed):
+    """1人の模擬ユーザー (user_id, team_id) として期限まで操作を繰り返す"""
+    user_id, team_id = user
+    rng = random.Random(seed + user_id)
+    records = []
+    while time.time() < deadline:
+        operation = rng.choices(OPERATIONS, weights)[0]
+        started = time.perf_counter()
+        try:
+            # 各操作は成功ならNone、例外にならない失敗("failed")や
+            # 提出回数の上限("limit")はその分類を返す
+            error = OPERATION_FUNCS[operation](user_id, team_id, submission_csv, rng)
+        except Exception as e:
+            error = classify_error(e)
+        records.append((operation, time.perf_counter() - started, error))
+    return records
+
+
+def run_streamlit_client(deadline):
+    """AppTestでリーダーボードページを繰り返し描画する
+
+    AppTestはプロセス内のStreamlitランタイムを共有するため、クライアントごとに
+    別プロセスで実行する。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    records = []
+    while time.time() < deadline:
+        started = time.perf_counter()
+        error = None
+        try:
+            # ナビゲーションのpage_linkを解決するためmain.pyから開いてページを切り替える
+            at = AppTest.from_file(str(MAIN_SCRIPT_PATH), default_timeout=60)
+            at.session_state["authentication_status"] = False
+            at.run()
+            at.switch_page(LEADERBOARD_PAGE).run()
+            if at.exception:
+                error = "other"
+        except Exception as e:
+            error = classify_error(e)
+        records.append((STREAMLIT_OPERATION, time.perf_counter() - started, error))
+    return records
+
+
+def run_load(args, users, submission_csv, weights):
+    deadline = time.time() + args.duration
+    executor_class = (
+        ThreadPoolExecutor if args.mode == "thread" else ProcessPoolExecutor
+    )
+
+    started = time.perf_counter()
+    with (
+        executor_class(max_workers=len(users)) as executor,
+        ProcessPoolExecutor(
+            max_workers=max(1, args.streamlit_clients),
+            # ワーカースレッドが動いている状態でforkすると
+            # ロックを抱えたまま複製されるためspawnを使う
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as st_executor,
+    ):
+        futures = [
+            executor.submit(
+                run_user, user, submission_csv, weights, deadline, args.seed
+            )
+            for user in users
+        ]
+        futures += [
+            st_executor.submit(run_streamlit_client, deadline)
+            for _ in range(args.streamlit_clients)
+        ]
+        records = [record for future in futures for record in future.result()]
+    elapsed = time.perf_counter() - started
+
+    return records, elapsed
+
+
+def summarize(records, elapsed):
+    summary = {"elapsed_sec": elapsed, "operations": {}}
+    operations = sorted({record[0] for record in records})
+    for operation in operations + ["total"]:
+        rows = [r for r in records if operation == "total" or r[0] == operation]
+        latencies = np.array([r[1] for r in rows]) * 1000
+        errors = [r[2] for r in rows]
+        summary["operations"][operation] = {
+            "count": len(rows),
+            "throughput_per_sec": len(rows) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "locked_rate": errors.count("locked") / len(rows),
+            "failed_rate": errors.count("failed") / len(rows),
+            "limit_rate": errors.count("limit") / len(rows),
+            "other_error_rate": errors.count("other") / len(rows),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(
+        f"{'operation':<24}{'count':>8}{'ops/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}"
+        f"{'locked':>9}{'failed':>9}{'limit':>9}{'other':>9}"
+    )
+    for operation, stats in summary["operations"].items():
+        print(
+            f"{operation:<24}{stats['count']:>8}{stats['throughput_per_sec']:>10.1f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+            f"{stats['locked_rate']:>9.2%}{stats['failed_rate']:>9.2%}"
+            f"{stats['limit_rate']:>9.2%}{stats['other_error_rate']:>9.2%}"
+        )
+    print(f"Elapsed: {summary['elapsed_sec']:.1f}s")
+
+
+def main():
+    args = parse_args()
+    weights = parse_mix(args.mix)
+    workdir, submission_csv = prepare_workdir(args)
+    print(f"Workdir: {workdir}")
+
+    # アプリのモジュールは相対パスでDBや設定を参照するため、作業ディレクトリへ移動する
+    os.chdir(workdir)
+    users = setup_users(args.users)
+    records, elapsed = run_load(args, users, submission_csv, weights)
+
+    if not records:
+        print("No operations were recorded.")
+        return
+
+    summary = summarize(records, elapsed)
+    summary["config"] = {
+        "users": args.users,
+        "mode": args.mode,
+        "mix": args.mix,
+        "streamlit_clients": args.streamlit_clients,
+    }
+    print_summary(summary)
+    if args.json:
+        args.json.write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""オフラインで任意サイズの合成コンペティションを作成するスクリプト
+
+fetch_openmlを使わずに、負荷試験・スケール試験用のtest.csvと
+対応するサンプル提出・ノイズ付き提出をチャンク単位で書き出す。
+乱数はchunk_sizeによらない固定サイズのブロックごとに生成するため、
+同じseedであればchunk_sizeによらず出力は常に同一になる。
+
+使い方:
+    python tool/make_synthetic_competition.py --rows 10000000 --task binary \
+        --public-ratio 0.3 --seed 42 --output-dir ./competition
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+TASK_TYPES = ("regression", "binary", "multiclass")
+MAX_ROWS = 10**8
+DEFAULT_CHUNK_SIZE = 1_000_000
+# 乱数列を切り替える行数の単位。変えると同じseedでも出力が変わる
+RNG_BLOCK_SIZE = 1 << 16
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="合成コンペティションを作成する")
+    parser.add_argument("--rows", type=int, default=100_000, help="test.csvの行数")
+    parser.add_argument("--task", choices=TASK_TYPES, default="regression")
+    parser.add_argument(
+        "--num-classes", type=int, default=5, help="multiclassのクラス数"
+    )
+    parser.add_argument(
+        "--public-ratio", type=float, default=0.5, help="is_public=1になる行の割合"
+    )
+    parser.add_argument(
+        "--noise", type=float, default=0.1, help="ノイズ付き提出のノイズ量"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--answer-column", default="answer_column")
+    parser.add_argument("--output-dir", type=Path, default=Path("./competition"))
+    args = parser.parse_args()
+
+    if not 0 < args.rows <= MAX_ROWS:
+        parser.error(f"--rows は1以上{MAX_ROWS}以下にしてください。")
+    if not 0.0 <= args.public_ratio <= 1.0:
+        parser.error("--public-ratio は0以上1以下にしてください。")
+    if args.task == "multiclass" and args.num_classes < 2:
+        parser.error("--num-classes は2以上にしてください。")
+    if args.chunk_size <= 0:
+        parser.error("--chunk-size は1以上にしてください。")
+    return args
+
+
+def generate_target(rng, size, task, num_classes):
+    """正解列を生成する"""
+    if task == "regression":
+        return rng.normal(loc=0.0, scale=1.0, size=size)
+    elif task == "binary":
+        return (rng.random(size) < 0.4).astype(np.int8)
+    else:
+        return rng.integers(0, num_classes, size=size, dtype=np.int16)
+
+
+def generate_noisy_prediction(rng, target, task, num_classes, noise):
+    """正解列にノイズを加えた予測値を生成する"""
+    if task == "regression":
+        return target + rng.normal(loc=0.0, scale=noise, size=len(target))
+
+    # 分類はnoiseの確率でラベルをランダムに置き換える
+    flip_mask = rng.random(len(target)) < noise
+    if task == "binary":
+        random_labels = rng.integers(0, 2, size=len(target), dtype=np.int8)
+    else:
+        random_labels = rng.integers(0, num_classes, size=len(target), dtype=np.int16)
+    return np.where(flip_mask, random_labels, target)
+
+
+def baseline_prediction(target, task):
+    """サンプル提出用の定数予測を生成する"""
+    if task == "regression":
+        return np.zeros(len(target), dtype=np.float64)
+    return np.zeros(len(target), dtype=target.dtype)
+
+
+def generate_block(args, block_index):
+    """ブロックの (正解列, is_public, ノイズ付き予測) を生成する
+
+    ブロックごとに独立した乱数列を使い、出力をseedで決定的にする。
+    """
+    rng = np.random.default_rng([args.seed, block_index])
+    start = block_index * RNG_BLOCK_SIZE
+    size = min(start + RNG_BLOCK_SIZE, args.rows) - start
+    target = generate_target(rng, size, args.task, args.num_classes)
+    is_public = (rng.random(size) < args.public_ratio).astype(np.int8)
+    noisy = generate_noisy_prediction(
+        rng, target, args.task, args.num_classes, args.noise
+    )
+    return target, is_public, noisy
+
+
+def generate_rows(args, start, end, cache):
+    """[start, end) の行の (正解列, is_public, ノイズ付き予測) を生成する
+
+    チャンクの境界がブロックの途中にある場合に同じブロックを作り直さないよう、
+    直前のブロックをcacheに持っておく。
+    """
+    parts = []
+    first_block, last_block = start // RNG_BLOCK_SIZE, (end - 1) // RNG_BLOCK_SIZE
+    for block_index in range(first_block, last_block + 1):
+        if cache.get("index") != block_index:
+            cache["index"] = block_index
+            cache["block"] = generate_block(args, block_index)
+        block_start = block_index * RNG_BLOCK_SIZE
+        lo = max(start, block_start) - block_start
+        hi = min(end, block_start + RNG_BLOCK_SIZE) - block_start
+        parts.append([column[lo:hi] for column in cache["block"]])
+    return [np.concatenate(columns) for columns in zip(*parts)]
+
+
+def iter_chunks(total_rows, chunk_size):
+    for start in range(0, total_rows, chunk_size):
+        yield start, min(start + chunk_size, total_rows)
+
+
+def make_competition(args):
+    output_dir = args.output_dir
+    distribution_dir = output_dir / "distribution"
+    distribution_dir.mkdir(parents=True, exist_ok=True)
+
+    test_path = output_dir / "test.csv"
+    sample_path = distribution_dir / "sample_submission.csv"
+    noisy_path = distribution_dir / "noisy_submission.csv"
+    float_format = "%.6f" if args.task == "regression" else None
+
+    started = time.perf_counter()
+    with (
+        open(test_path, "w", newline="") as test_file,
+        open(sample_path, "w", newline="") as sample_file,
+        open(noisy_path, "w", newline="") as noisy_file,
+    ):
+        test_file.write(f"id,{args.answer_column},is_public\n")
+        sample_file.write(f"id,{args.answer_column}\n")
+        noisy_file.write(f"id,{args.answer_column}\n")
+
+        block_cache = {}
+        for start, end in iter_chunks(args.rows, args.chunk_size):
+            ids = np.arange(start, end, dtype=np.int64)
+            target, is_public, noisy = generate_rows(args, start, end, block_cache)
+
+            pd.DataFrame(
+                {"id": ids, args.answer_column: target, "is_public": is_public}
+            ).to_csv(test_file, header=False, index=False, float_format=float_format)
+            pd.DataFrame(
+                {"id": ids, args.answer_column: baseline_prediction(target, args.task)}
+            ).to_csv(sample_file, header=False, index=False, float_format=float_format)
+            pd.DataFrame({"id": ids, args.answer_column: noisy}).to_csv(
+                noisy_file, header=False, index=False, float_format=float_format
+            )
+
+            print(f"{end:,}/{args.rows:,} rows written")
+
+    elapsed = time.perf_counter() - started
+    print(f"test.csv: {test_path}")
+    print(f"sample_submission.csv: {sample_path}")
+    print(f"noisy_submission.csv: {noisy_path}")
+    print(f"Elapsed: {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    make_competition(parse_args())
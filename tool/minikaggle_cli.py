@@ -0,0 +1,146 @@
+"""minikaggleのHTTP API(app/api/server.py)を使うコマンドラインクライアント
+
+kaggleコマンドと同じような使い方で、スクリプトから提出やリーダーボードの確認ができる。
+標準ライブラリのみで動くので、minikaggleの依存パッケージがない環境でも使える。
+
+使い方:
+    export MINIKAGGLE_API_URL=http://localhost:15001
+    export MINIKAGGLE_API_TOKEN=<提出ページで発行したトークン>
+
+    python tool/minikaggle_cli.py competitions list
+    python tool/minikaggle_cli.py competitions submit -c default -f submission.csv
+    python tool/minikaggle_cli.py competitions leaderboard -c default
+    python tool/minikaggle_cli.py competitions submissions -c default
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+from urllib.parse import quote, urlencode
+
+DEFAULT_API_URL = "http://localhost:15001"
+
+
+class ApiClient:
+    def __init__(self, base_url, token):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+
+    def request(self, method, path, data=None, headers=None):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            method=method,
+            headers={"Authorization": f"Bearer {self.token}", **(headers or {})},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                body = json.load(e)
+            except ValueError:
+                body = {}
+            message = body.get("error") or body.get("status") or e.reason
+            # 提出ファイルの問題のある行
+            for error in body.get("errors") or []:
+                message += f"\n  line {error['行']} {error['列']}: {error['内容']}"
+            raise SystemExit(f"Error ({e.code}): {message}")
+        except urllib.error.URLError as e:
+            raise SystemExit(f"Error: cannot connect to {self.base_url} ({e.reason})")
+
+    def list_competitions(self):
+        return self.request("GET", "/api/competitions")
+
+    def get_leaderboard(self, competition_id):
+        return self.request(
+            "GET", f"/api/competitions/{quote(competition_id)}/leaderboard"
+        )
+
+    def get_submissions(self, competition_id):
+        return self.request(
+            "GET", f"/api/competitions/{quote(competition_id)}/submissions"
+        )
+
+    def submit(self, competition_id, file_path):
+        # ファイルオブジェクトをそのまま渡し、全体をメモリに読み込まずに送信する
+        query = urlencode({"filename": os.path.basename(file_path)})
+        with open(file_path, "rb") as file:
+            return self.request(
+                "POST",
+                f"/api/competitions/{quote(competition_id)}/submissions?{query}",
+                data=file,
+                headers={
+                    "Content-Type": "text/csv",
+                    "Content-Length": str(os.path.getsize(file_path)),
+                },
+            )
+
+
+def print_table(records):
+    if not records:
+        print("(no records)")
+        return
+    columns = list(records[0])
+    rows = [
+        ["" if record[c] is None else str(record[c]) for c in columns]
+        for record in records
+    ]
+    widths = [
+        max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)
+    ]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(value.ljust(w) for value, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="minikaggle command line client")
+    parser.add_argument(
+        "--api-url", default=os.environ.get("MINIKAGGLE_API_URL", DEFAULT_API_URL)
+    )
+    parser.add_argument("--token", default=os.environ.get("MINIKAGGLE_API_TOKEN"))
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    groups = parser.add_subparsers(dest="group", required=True)
+
+    competitions = groups.add_parser("competitions", aliases=["c"])
+    commands = competitions.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    submit = commands.add_parser("submit")
+    submit.add_argument("-c", "--competition", required=True)
+    submit.add_argument("-f", "--file", required=True)
+    for name in ["leaderboard", "submissions"]:
+        command = commands.add_parser(name)
+        command.add_argument("-c", "--competition", required=True)
+    args = parser.parse_args()
+
+    if not args.token:
+        parser.error("API token is required (--token or MINIKAGGLE_API_TOKEN)")
+    client = ApiClient(args.api_url, args.token)
+
+    if args.command == "list":
+        result = client.list_competitions()
+    elif args.command == "submit":
+        if not os.path.isfile(args.file):
+            parser.error(f"File not found: {args.file}")
+        result = client.submit(args.competition, args.file)
+    elif args.command == "leaderboard":
+        result = client.get_leaderboard(args.competition)
+    else:
+        result = client.get_submissions(args.competition)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif isinstance(result, list):
+        print_table(result)
+    else:
+        for key, value in result.items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""ページごとのコールドスタート時間とインポート時間の計測スクリプト
+
+各ページについて新しいPythonプロセスを起動し、
+StreamlitのAppTestで main.py → ページ の順に描画するまでの時間(初回描画時間)を計測する。
+同時に -X importtime の出力から、
+アプリの実行中にインポートされたモジュールを累積時間の大きい順に集計する。
+Streamlit本体(AppTest)のインポートはサーバー起動時に済んでいるものとして計測に含めない。
+
+--budget を超えたページがあれば終了コード1を返すので、デプロイ前のチェックに使える。
+
+使い方:
+    python tool/startup_profile.py
+    python tool/startup_profile.py --pages page_02_leaderbord.py --top 20 --budget 1.5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MAIN_SCRIPT_PATH = REPO_ROOT / "app" / "main.py"
+PAGES = (
+    "main.py",
+    "pages/account.py",
+    "pages/page_02_leaderbord.py",
+    "pages/page_03_submission.py",
+    "pages/page_04_private_leaderboard.py",
+    "pages/page_05_change_teamname.py",
+    "pages/page_07_admin_analytics.py",
+)
+# 初回描画時間の上限(秒)のデフォルト
+DEFAULT_BUDGET_SEC = 2.0
+APP_START_MARKER = "__MINIKAGGLE_APP_START__"
+
+# 子プロセスで実行するコード。引数は main.py のパス、ページ、ユーザー名
+CHILD_CODE = f"""
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+main_script, page, username = sys.argv[1:4]
+sys.stderr.write("{APP_START_MARKER}\\n")
+sys.stderr.flush()
+
+started = time.perf_counter()
+at = AppTest.from_file(main_script, default_timeout=120)
+at.session_state["authentication_status"] = True
+at.session_state["username"] = username
+at.session_state["name"] = username
+at.run()
+main_done = time.perf_counter()
+if page != "main.py":
+    at.switch_page(page).run()
+done = time.perf_counter()
+print(json.dumps({{
+    "total_sec": done - started,
+    "main_sec": main_done - started,
+    "page_sec": done - main_done,
+    "exceptions": [e.message for e in at.exception],
+}}))
+"""
+
+
+def first_existing(*paths):
+    for path in paths:
+        if path.exists():
+            return path
+    return None
+
+
+def prepare_workdir(workdir):
+    """計測用の作業ディレクトリに設定ファイルを用意し、管理者のユーザー名を返す"""
+    import yaml
+
+    (workdir / "database").mkdir(parents=True, exist_ok=True)
+    setting_path = first_existing(
+        REPO_ROOT / "competition_setting.yaml",
+        REPO_ROOT / ".competition_setting.yaml",
+    )
+    shutil.copy(setting_path, workdir / "competition_setting.yaml")
+    authenticator_path = first_existing(
+        REPO_ROOT / "authenticator_config.yaml",
+        REPO_ROOT / ".authenticator_config.yaml",
+        REPO_ROOT / "sample_authenticator_config.yaml",
+    )
+    shutil.copy(authenticator_path, workdir / "authenticator_config.yaml")
+
+    with open(authenticator_path) as file:
+        usernames = yaml.safe_load(file)["credentials"]["usernames"]
+    # 管理者ページも描画できるように管理者で計測する
+    admins = [name for name, user in usernames.items() if user.get("role") == "admin"]
+    return admins[0] if admins else next(iter(usernames))
+
+
+def parse_importtime(stderr):
+    """マーカー以降の -X importtime の出力を読む
+
+    (モジュール, 深さ, 累積時間[us]) のリストを返す。
+    """
+    _, _, app_output = stderr.partition(APP_START_MARKER)
+    modules = []
+    for line in app_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        # モジュール名の前の空白はネストの深さ (区切りの後の1文字 + 深さごとに2文字)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), depth, int(cumulative_us)))
+    return modules
+
+
+def profile_page(workdir, page, username):
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            CHILD_CODE,
+            str(MAIN_SCRIPT_PATH),
+            page,
+            username,
+        ],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": str(REPO_ROOT)},
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1]}
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(completed.stderr)
+    # 最上位でインポートされたモジュールの累積時間の合計が、インポートの総時間
+    result["import_sec"] = (
+        sum(cumulative for _, depth, cumulative in modules if depth == 0) / 1e6
+    )
+    result["top_imports"] = [
+        {"module": name, "cumulative_ms": cumulative / 1000}
+        for name, depth, cumulative in sorted(modules, key=lambda m: -m[2])
+        if depth == 0
+    ]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ページのコールドスタート時間の計測")
+    parser.add_argument(
+        "--pages", default=",".join(PAGES), help="計測するページ (カンマ区切り)"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="表示するインポートの数")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=DEFAULT_BUDGET_SEC,
+        help="初回描画時間の上限(秒)。超えたページがあれば終了コード1",
+    )
+    parser.add_argument("--workdir", type=Path, default=None)
+    parser.add_argument("--json", type=Path, default=None, help="結果のJSON出力先")
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="minikaggle_startup_"))
+    username = prepare_workdir(workdir)
+
+    results = {}
+    over_budget = []
+    for page in args.pages.split(","):
+        runs = [profile_page(workdir, page, username) for _ in range(args.repeat)]
+        errors = [run["error"] for run in runs if "error" in run]
+        if errors:
+            print(f"{page}: {errors[0]}")
+            results[page] = {"error": errors[0]}
+            over_budget.append(page)
+            continue
+
+        total_sec = statistics.median(run["total_sec"] for run in runs)
+        import_sec = statistics.median(run["import_sec"] for run in runs)
+        exceptions = runs[0]["exceptions"]
+        results[page] = {
+            "total_sec": total_sec,
+            "page_sec": statistics.median(run["page_sec"] for run in runs),
+            "import_sec": import_sec,
+            "exceptions": exceptions,
+            "top_imports": runs[0]["top_imports"][: args.top],
+        }
+        mark = ""
+        if total_sec > args.budget:
+            mark = f"  OVER BUDGET ({args.budget:.2f}s)"
+            over_budget.append(page)
+        print(f"{page}: first paint {total_sec:.2f}s (imports {import_sec:.2f}s){mark}")
+        for module in results[page]["top_imports"]:
+            print(f"    {module['cumulative_ms']:>8.1f}ms  {module['module']}")
+        for exception in exceptions:
+            print(f"    exception: {exception}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        print(f"Saved: {args.json}")
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()